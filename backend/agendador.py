@@ -0,0 +1,176 @@
+# agendador.py
+# Este módulo controla a admissão de gerações no Ollama: limita quantas rodam ao mesmo tempo,
+# mantém uma fila limitada por prioridade (chat interativo antes de trabalho em lote)
+# e rejeita rapidamente quando a fila está cheia.
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+
+from config_manager import obter_config, cota_por_worker
+from metricas import ESPERA_FILA, REJEICOES
+
+# Prioridades (menor valor = atendido primeiro)
+PRIORIDADE_INTERATIVA = 0
+PRIORIDADE_LOTE = 10
+
+
+# A fila de espera atingiu o limite; o cliente deve tentar de novo após retry_after segundos
+class FilaCheia(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Fila de geração cheia. Tente novamente em {retry_after}s.")
+        self.retry_after = retry_after
+
+
+# A requisição ficou na fila mais tempo do que o permitido
+class TempoEsperaExcedido(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Tempo de espera na fila excedido. Tente novamente em {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class Reserva:
+    def __init__(self, agendador, prioridade, sequencia, max_espera=None):
+        self._agendador = agendador
+        self.prioridade = prioridade
+        self.sequencia = sequencia
+        # Espera máxima na fila (None = a do agendador; 0 = sem limite, usado pelos trabalhos em lote)
+        self.max_espera = agendador.max_espera if max_espera is None else max_espera
+        self.criada_em = time.monotonic()
+        self.concedida_em = None
+        self.liberada = False
+        self._vez = asyncio.get_running_loop().create_future()
+
+    @property
+    def concedida(self):
+        return self.concedida_em is not None
+
+    def __lt__(self, outra):
+        return (self.prioridade, self.sequencia) < (outra.prioridade, outra.sequencia)
+
+    def posicao(self):
+        return self._agendador.posicao(self)
+
+    # Espera a vez na fila, informando a posição sempre que ela muda
+    async def posicoes(self, intervalo=1.0):
+        ultima = None
+        while not self.concedida:
+            posicao = self.posicao()
+            if posicao != ultima:
+                ultima = posicao
+                yield posicao
+            if self.max_espera and time.monotonic() - self.criada_em > self.max_espera:
+                self.liberar()
+                REJEICOES.incrementar(motivo="tempo_espera")
+                raise TempoEsperaExcedido(self._agendador.estimar_retry_after())
+            try:
+                await asyncio.wait_for(asyncio.shield(self._vez), intervalo)
+            except asyncio.TimeoutError:
+                pass
+
+    async def aguardar(self):
+        async for _ in self.posicoes():
+            pass
+
+    def liberar(self):
+        self._agendador._liberar(self)
+
+
+class Agendador:
+    def __init__(self, max_concorrentes=None, max_fila=None, max_espera=None):
+        # Limites do servidor inteiro: com vários workers, cada um fica com a sua parte
+        self.max_concorrentes = max_concorrentes or cota_por_worker(obter_config("AGENDADOR", "AGENDADOR_MAX_CONCORRENTES", 2, int))
+        self.max_fila = max_fila if max_fila is not None else cota_por_worker(obter_config("AGENDADOR", "AGENDADOR_MAX_FILA", 32, int))
+        self.max_espera = max_espera if max_espera is not None else obter_config("AGENDADOR", "AGENDADOR_MAX_ESPERA", 90, float)
+        self._fila = []
+        self._ativos = 0
+        self._sequencia = itertools.count()
+        # Média móvel da duração de uma geração, usada para estimar o Retry-After
+        self._duracao_media = 30.0
+        self.rejeitadas = 0
+        self.desistencias = 0
+
+    @property
+    def ativos(self):
+        return self._ativos
+
+    @property
+    def em_fila(self):
+        return len(self._fila)
+
+    def estimar_retry_after(self):
+        rodadas = (len(self._fila) + 1) / max(self.max_concorrentes, 1)
+        return max(1, math.ceil(self._duracao_media * rodadas))
+
+    def verificar_admissao(self):
+        if self._ativos >= self.max_concorrentes and len(self._fila) >= self.max_fila:
+            self.rejeitadas += 1
+            REJEICOES.incrementar(motivo="fila_cheia")
+            raise FilaCheia(self.estimar_retry_after())
+
+    def reservar(self, prioridade=PRIORIDADE_INTERATIVA, max_espera=None):
+        self.verificar_admissao()
+        reserva = Reserva(self, prioridade, next(self._sequencia), max_espera)
+        if self._ativos < self.max_concorrentes and not self._fila:
+            self._conceder(reserva)
+        else:
+            heapq.heappush(self._fila, reserva)
+        return reserva
+
+    # Reserva + espera + liberação automática (para rotas sem streaming)
+    @asynccontextmanager
+    async def slot(self, prioridade=PRIORIDADE_INTERATIVA, max_espera=None):
+        reserva = self.reservar(prioridade, max_espera)
+        try:
+            await reserva.aguardar()
+            yield reserva
+        finally:
+            reserva.liberar()
+
+    def posicao(self, reserva):
+        if reserva.concedida:
+            return 0
+        return 1 + sum(1 for outra in self._fila if outra < reserva)
+
+    def estatisticas(self):
+        return {
+            "ativos": self._ativos,
+            "em_fila": len(self._fila),
+            "max_concorrentes": self.max_concorrentes,
+            "max_fila": self.max_fila,
+            "duracao_media": round(self._duracao_media, 2),
+            "rejeitadas": self.rejeitadas,
+            "desistencias": self.desistencias,
+        }
+
+    def _conceder(self, reserva):
+        self._ativos += 1
+        reserva.concedida_em = time.monotonic()
+        ESPERA_FILA.observar(
+            reserva.concedida_em - reserva.criada_em,
+            prioridade="interativa" if reserva.prioridade <= PRIORIDADE_INTERATIVA else "lote",
+        )
+        if not reserva._vez.done():
+            reserva._vez.set_result(True)
+
+    def _liberar(self, reserva):
+        if reserva.liberada:
+            return
+        reserva.liberada = True
+        if reserva.concedida:
+            self._ativos -= 1
+            duracao = time.monotonic() - reserva.concedida_em
+            self._duracao_media = 0.8 * self._duracao_media + 0.2 * duracao
+        else:
+            # Saiu da fila antes de ser atendida (desistência ou tempo esgotado)
+            self.desistencias += 1
+            self._fila.remove(reserva)
+            heapq.heapify(self._fila)
+        self._despachar()
+
+    def _despachar(self):
+        while self._ativos < self.max_concorrentes and self._fila:
+            self._conceder(heapq.heappop(self._fila))
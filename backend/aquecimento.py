@@ -0,0 +1,128 @@
+# aquecimento.py
+# Este módulo mantém os modelos carregados nos servidores Ollama. No startup, cada modelo configurado
+# é carregado (geração vazia) com keep_alive, para que a primeira pergunta não pague o tempo de carga.
+# Uma verificação periódica recarrega os modelos que o Ollama descarregou (pelo /api/ps, acompanhado
+# pelo pool) e o estado de prontidão alimenta o endpoint de saúde usado pelo balanceador.
+
+import asyncio
+import time
+
+from config_manager import obter_config
+from pool_ollama import normalizar_modelo
+
+
+class GerenciadorModelos:
+    def __init__(self, pool, modelos, keep_alive=None, intervalo=None, timeout=None, num_ctx=None):
+        self.pool = pool
+        self.modelos = list(modelos)
+        # "-1" mantém o modelo carregado indefinidamente; também aceita durações ("30m", "2h")
+        self.keep_alive = keep_alive or obter_config("AQUECIMENTO", "AQUECIMENTO_KEEP_ALIVE", "-1")
+        self.intervalo = intervalo or obter_config("AQUECIMENTO", "AQUECIMENTO_INTERVALO", 30, float)
+        # Carregar um modelo grande pode levar minutos
+        self.timeout = timeout or obter_config("AQUECIMENTO", "AQUECIMENTO_TIMEOUT", 600, float)
+        # Mesmo num_ctx das gerações: um num_ctx diferente faria o Ollama recarregar o modelo
+        self.num_ctx = num_ctx or obter_config("AQUECIMENTO", "AQUECIMENTO_NUM_CTX", 4096, int)
+        self.ativo = obter_config("AQUECIMENTO", "AQUECIMENTO_ATIVO", True, bool)
+        # (url, modelo) -> {"estado": "aquecendo" | "pronto" | "erro", ...}
+        self._estados = {}
+        self._aquecendo = {}
+        self._tarefa = None
+        self.aquecimentos = 0
+
+    # keep_alive como o Ollama espera: número (segundos, -1 = sempre) ou duração em texto
+    def valor_keep_alive(self):
+        try:
+            return int(self.keep_alive)
+        except (TypeError, ValueError):
+            return self.keep_alive
+
+    def iniciar(self):
+        if self.ativo and self._tarefa is None:
+            # Sem bloquear o startup: a prontidão fica falsa até os modelos carregarem
+            self._tarefa = asyncio.create_task(self._manter_aquecidos())
+
+    async def encerrar(self):
+        tarefas = list(self._aquecendo.values())
+        if self._tarefa is not None:
+            tarefas.append(self._tarefa)
+            self._tarefa = None
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        self._aquecendo.clear()
+
+    async def _manter_aquecidos(self):
+        while True:
+            try:
+                self.verificar()
+            except Exception as e:
+                print(f"Erro ao verificar o aquecimento dos modelos: {str(e)}")
+            await asyncio.sleep(self.intervalo)
+
+    # Dispara o aquecimento dos modelos que não aparecem carregados em algum backend saudável
+    def verificar(self):
+        for backend in self.pool.backends:
+            if not backend.saudavel:
+                continue
+            for modelo in self.modelos:
+                chave = (backend.url, modelo)
+                if chave in self._aquecendo or not backend.atende(modelo):
+                    continue
+                if normalizar_modelo(modelo) in backend.carregados:
+                    if self._estados.get(chave, {}).get("estado") != "pronto":
+                        self._estados[chave] = {"estado": "pronto", "desde": time.time()}
+                    continue
+                if self._estados.get(chave, {}).get("estado") == "pronto":
+                    print(f"Modelo {modelo} descarregado em {backend.url}; aquecendo novamente")
+                self._estados[chave] = {"estado": "aquecendo", "desde": time.time()}
+                self._aquecendo[chave] = asyncio.create_task(self._aquecer(backend, modelo))
+
+    async def _aquecer(self, backend, modelo):
+        chave = (backend.url, modelo)
+        inicio = time.perf_counter()
+        try:
+            # Prompt vazio: o Ollama apenas carrega o modelo e aplica o keep_alive
+            status, corpo = await self.pool.gerar_em(backend, {
+                "model": modelo,
+                "prompt": "",
+                "stream": False,
+                "keep_alive": self.valor_keep_alive(),
+                "options": {"num_ctx": self.num_ctx},
+            }, timeout=self.timeout)
+            if status != 200:
+                raise RuntimeError(f"status {status}: {str(corpo)[:200]}")
+            duracao = time.perf_counter() - inicio
+            backend.carregados.add(normalizar_modelo(modelo))
+            self.aquecimentos += 1
+            self._estados[chave] = {"estado": "pronto", "desde": time.time(), "duracao_carga": round(duracao, 2)}
+            print(f"Modelo {modelo} carregado em {backend.url} ({duracao:.1f}s)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Erro ao aquecer o modelo {modelo} em {backend.url}: {str(e) or type(e).__name__}")
+            self._estados[chave] = {"estado": "erro", "desde": time.time(), "erro": str(e) or type(e).__name__}
+        finally:
+            self._aquecendo.pop(chave, None)
+
+    # Pronto quando cada modelo está carregado em pelo menos um backend saudável
+    def pronto(self):
+        if not self.ativo:
+            return any(backend.saudavel for backend in self.pool.backends)
+        return all(
+            any(
+                backend.saudavel and self._estados.get((backend.url, modelo), {}).get("estado") == "pronto"
+                for backend in self.pool.backends
+            )
+            for modelo in self.modelos
+        )
+
+    def estatisticas(self):
+        return {
+            "pronto": self.pronto(),
+            "keep_alive": self.keep_alive,
+            "aquecimentos": self.aquecimentos,
+            "modelos": [
+                {"url": url, "modelo": modelo, **estado}
+                for (url, modelo), estado in sorted(self._estados.items())
+            ],
+        }
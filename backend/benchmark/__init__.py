@@ -0,0 +1,2 @@
+# benchmark
+# Testes de carga da API com um servidor Ollama falso (ver carga.py e ollama_falso.py).
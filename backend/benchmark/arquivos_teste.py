@@ -0,0 +1,88 @@
+# arquivos_teste.py
+# Gera os arquivos usados nos testes de carga de upload: PDF (escrito à mão, sem dependências),
+# DOCX (python-docx) e XLSX (openpyxl), com tamanho controlado pelo número de páginas/parágrafos/linhas.
+
+import os
+import random
+
+FRASES = [
+    "O inquérito policial foi instaurado para apurar a autoria do fato.",
+    "A autoridade policial ouviu as testemunhas e juntou os documentos.",
+    "O prazo para conclusão do procedimento foi prorrogado pelo juízo.",
+    "O relatório final aponta indícios suficientes de materialidade.",
+    "Foram requisitadas perícias complementares no local dos fatos.",
+]
+
+
+def _texto_pdf(texto):
+    texto = texto.encode("latin-1", "replace").decode("latin-1")
+    return texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# PDF mínimo com uma fonte padrão e linhas de texto por página (o PyPDF2 extrai o texto normalmente)
+def gerar_pdf(caminho, paginas=10, linhas_por_pagina=40):
+    objetos = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    filhos = " ".join(f"{3 + 2 * i} 0 R" for i in range(paginas))
+    objetos.append(f"<< /Type /Pages /Kids [{filhos}] /Count {paginas} >>".encode())
+    fonte = 3 + 2 * paginas
+    for pagina in range(paginas):
+        objetos.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * pagina} 0 R "
+            f"/Resources << /Font << /F1 {fonte} 0 R >> >> >>".encode()
+        )
+        linhas = [f"Pagina {pagina + 1}"] + [random.choice(FRASES) for _ in range(linhas_por_pagina)]
+        conteudo = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({_texto_pdf(linha)}) Tj T*" for linha in linhas) + " ET"
+        conteudo = conteudo.encode("latin-1")
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(conteudo) + conteudo + b"\nendstream")
+    objetos.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    saida = bytearray(b"%PDF-1.4\n")
+    posicoes = []
+    for indice, objeto in enumerate(objetos):
+        posicoes.append(len(saida))
+        saida += f"{indice + 1} 0 obj\n".encode() + objeto + b"\nendobj\n"
+    inicio_xref = len(saida)
+    saida += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    for posicao in posicoes:
+        saida += f"{posicao:010d} 00000 n \n".encode()
+    saida += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode()
+    with open(caminho, "wb") as f:
+        f.write(saida)
+    return caminho
+
+
+def gerar_docx(caminho, paragrafos=200):
+    import docx
+    documento = docx.Document()
+    documento.add_heading("Relatório de inquérito", 0)
+    for indice in range(paragrafos):
+        documento.add_paragraph(f"{indice + 1}. " + " ".join(random.choices(FRASES, k=3)))
+    documento.save(caminho)
+    return caminho
+
+
+def gerar_xlsx(caminho, linhas=2000, colunas=6):
+    import openpyxl
+    planilha = openpyxl.Workbook()
+    folha = planilha.active
+    folha.title = "Inqueritos"
+    folha.append(["numero", "descricao", "delegacia", "valor", "situacao", "data"][:colunas])
+    for indice in range(linhas):
+        folha.append([
+            f"{indice + 1:05d}/2024", random.choice(FRASES), f"DP {indice % 30 + 1}",
+            round(random.uniform(100, 10000), 2), random.choice(["aberto", "concluído"]), f"2024-{indice % 12 + 1:02d}-10",
+        ][:colunas])
+    planilha.save(caminho)
+    return caminho
+
+
+# Gera os três tipos de arquivo no diretório e devolve [(caminho, content-type)]
+def gerar_arquivos(diretorio, paginas_pdf=10, paragrafos_docx=200, linhas_xlsx=2000):
+    os.makedirs(diretorio, exist_ok=True)
+    return [
+        (gerar_pdf(os.path.join(diretorio, "teste.pdf"), paginas_pdf), "application/pdf"),
+        (gerar_docx(os.path.join(diretorio, "teste.docx"), paragrafos_docx),
+         "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+        (gerar_xlsx(os.path.join(diretorio, "teste.xlsx"), linhas_xlsx),
+         "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    ]
@@ -0,0 +1,92 @@
+# cache_semantico.py
+# Verifica o cache semântico de ponta a ponta: sobe o Ollama falso (que lista o modelo de embedding como
+# "nomic-embed-text:latest", igual ao Ollama real) em uma porta local, consulta os embeddings pelo
+# PoolOllama (verificação de saúde e filtro de modelos incluídos) e confere que uma paráfrase volta do
+# cache, que números diferentes na pergunta não compartilham resposta e que o cache não se suspendeu.
+# Sai com código 1 em qualquer falha.
+#
+# Uso (a partir de backend/):
+#   python -m benchmark.cache_semantico
+
+import argparse
+import asyncio
+import socket
+import sys
+
+from aiohttp import web
+
+from benchmark.ollama_falso import ConfiguracaoFalsa, criar_app
+from cache_semantico import CacheSemantico, gerar_escopo, NUMPY_DISPONIVEL
+from pool_ollama import PoolOllama
+
+MODELO = "deepseek-r1:32b"
+
+# (pergunta guardada, paráfrase que deve acertar, pergunta de outro escopo que deve errar)
+ORIGINAL = "Qual o prazo do inquérito policial"
+PARAFRASE = "qual é o prazo do inquérito policial"
+OUTRO_NUMERO = "Qual o prazo do inquérito policial 12/2024"
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def verificar(modelo_embedding):
+    porta = porta_livre()
+    runner = web.AppRunner(criar_app(ConfiguracaoFalsa(modelos=[MODELO], ttft=0, jitter=0)))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", porta).start()
+    pool = PoolOllama(f"http://127.0.0.1:{porta}")
+    falhas = []
+    try:
+        await pool.iniciar()
+        cache = CacheSemantico(pool, modelo=modelo_embedding)
+
+        escopo = gerar_escopo(MODELO, False, ORIGINAL)
+        resposta, vetor = await cache.buscar(ORIGINAL, escopo)
+        if vetor is None:
+            falhas.append("embedding da pergunta original não foi obtido")
+        cache.guardar(vetor, ORIGINAL, "resposta guardada", escopo)
+
+        resposta, _ = await cache.buscar(PARAFRASE, gerar_escopo(MODELO, False, PARAFRASE))
+        if resposta != "resposta guardada":
+            falhas.append(f"paráfrase não voltou do cache (resposta: {resposta!r})")
+
+        resposta, _ = await cache.buscar(OUTRO_NUMERO, gerar_escopo(MODELO, False, OUTRO_NUMERO))
+        if resposta is not None:
+            falhas.append("pergunta com outro número recebeu a resposta guardada")
+
+        estatisticas = cache.estatisticas()
+        if estatisticas["erros"] or estatisticas["suspenso"]:
+            falhas.append(f"cache suspenso por erro de embeddings ({estatisticas['erros']} erros)")
+        print(
+            f"Cache semântico ({modelo_embedding}): {estatisticas['hits']} hits, {estatisticas['misses']} misses, "
+            f"{estatisticas['erros']} erros"
+        )
+    finally:
+        await pool.encerrar()
+        await runner.cleanup()
+    return falhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificação do cache semântico com o Ollama falso")
+    # Sem tag, como em config.ini: o pool precisa casar com "nomic-embed-text:latest" de /api/tags
+    parser.add_argument("--modelo-embedding", default="nomic-embed-text")
+    args = parser.parse_args()
+
+    if not NUMPY_DISPONIVEL:
+        print("FALHA: numpy não está instalado")
+        sys.exit(1)
+    falhas = asyncio.run(verificar(args.modelo_embedding))
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    if falhas:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# carga.py
+# Teste de carga da API. Dispara /perguntar_stream, /perguntar, /api/chat/ai e /upload-file em níveis
+# de concorrência fixos e mede latência (p50/p95/p99), tempo até o primeiro token nos streamings e
+# vazão. O resultado sai em JSON para comparar versões.
+#
+# Sem --api, o script sobe sozinho um Ollama falso (benchmark/ollama_falso.py) e a API (uvicorn) em
+# portas locais, com caches e índice em um diretório temporário.
+#
+# Uso (a partir de backend/):
+#   python -m benchmark.carga --concorrencias 1,8,32 --requisicoes 64 --saida resultado.json
+#   python -m benchmark.carga --api http://localhost:8000 --cenarios perguntar_stream,upload_file
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import zipfile
+from collections import Counter
+
+import aiohttp
+
+from benchmark.arquivos_teste import gerar_arquivos
+
+DIRETORIO_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CENARIOS = ("perguntar_stream", "perguntar", "chat_ai", "upload_file")
+
+PERGUNTAS = [
+    "Qual é o prazo para conclusão do inquérito policial com o investigado solto?",
+    "Quais diligências a autoridade policial pode determinar durante o inquérito?",
+    "Como funciona o arquivamento do inquérito policial?",
+    "Quais são os requisitos da prisão preventiva?",
+]
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicao - inferior)
+
+
+def resumir(resultados, duracao):
+    latencias = [r["latencia"] for r in resultados if r["ok"]]
+    ttfts = [r["ttft"] for r in resultados if r["ok"] and r["ttft"] is not None]
+    resumo = {
+        "requisicoes": len(resultados),
+        "sucesso": len(latencias),
+        "erros": len(resultados) - len(latencias),
+        "status": dict(Counter(str(r["status"]) for r in resultados)),
+        "duracao_s": round(duracao, 3),
+        "vazao_rps": round(len(latencias) / duracao, 3) if duracao else 0,
+        "latencia_s": {
+            "p50": _arredondar(percentil(latencias, 50)),
+            "p95": _arredondar(percentil(latencias, 95)),
+            "p99": _arredondar(percentil(latencias, 99)),
+            "max": _arredondar(max(latencias) if latencias else None),
+        },
+    }
+    if ttfts:
+        resumo["ttft_s"] = {
+            "p50": _arredondar(percentil(ttfts, 50)),
+            "p95": _arredondar(percentil(ttfts, 95)),
+            "p99": _arredondar(percentil(ttfts, 99)),
+        }
+    return resumo
+
+
+def _arredondar(valor):
+    return round(valor, 4) if valor is not None else None
+
+
+# Pergunta única por requisição (sem --repetir, o cache e a coalescência não entram na medida)
+def montar_pergunta(indice, repetir):
+    pergunta = PERGUNTAS[indice % len(PERGUNTAS)]
+    return pergunta if repetir else f"{pergunta} (ref {uuid.uuid4().hex[:8]})"
+
+
+# Lê um streaming NDJSON medindo o primeiro token; erro se algum frame trouxer "error"
+async def ler_streaming(response, inicio):
+    ttft = None
+    ok = True
+    async for linha in response.content:
+        if not linha.strip():
+            continue
+        try:
+            frame = json.loads(linha)
+        except ValueError:
+            ok = False
+            continue
+        if "error" in frame:
+            ok = False
+        elif "token" in frame and ttft is None:
+            ttft = time.perf_counter() - inicio
+    return ttft, ok
+
+
+async def requisitar_perguntar_stream(sessao, api, indice, contexto):
+    inicio = time.perf_counter()
+    corpo = {"pergunta": montar_pergunta(indice, contexto["repetir"])}
+    async with sessao.post(f"{api}/perguntar_stream", json=corpo) as response:
+        if response.status != 200:
+            await response.read()
+            return response.status, None, False, inicio
+        ttft, ok = await ler_streaming(response, inicio)
+        return response.status, ttft, ok, inicio
+
+
+async def requisitar_perguntar(sessao, api, indice, contexto):
+    inicio = time.perf_counter()
+    corpo = {"pergunta": montar_pergunta(indice, contexto["repetir"])}
+    async with sessao.post(f"{api}/perguntar", json=corpo) as response:
+        dados = await response.read()
+        ok = response.status == 200 and b'"resposta"' in dados
+        return response.status, None, ok, inicio
+
+
+async def requisitar_chat_ai(sessao, api, indice, contexto):
+    inicio = time.perf_counter()
+    corpo = {"prompt": montar_pergunta(indice, contexto["repetir"]), "thinkknMode": False}
+    async with sessao.post(f"{api}/api/chat/ai", json=corpo) as response:
+        if response.status != 200:
+            await response.read()
+            return response.status, None, False, inicio
+        ttft, ok = await ler_streaming(response, inicio)
+        return response.status, ttft, ok, inicio
+
+
+# Torna o arquivo único (outro SHA-256) sem invalidar o formato, para não cair no cache de extração
+def tornar_unico(conteudo, tipo):
+    marca = uuid.uuid4().hex
+    if tipo == "application/pdf":
+        return conteudo + f"% {marca}\n".encode()
+    buffer = io.BytesIO(conteudo)
+    with zipfile.ZipFile(buffer, "a") as arquivo_zip:
+        arquivo_zip.comment = marca.encode()
+    return buffer.getvalue()
+
+
+async def requisitar_upload_file(sessao, api, indice, contexto):
+    caminho, tipo, conteudo = contexto["arquivos"][indice % len(contexto["arquivos"])]
+    if not contexto["repetir"]:
+        conteudo = tornar_unico(conteudo, tipo)
+    formulario = aiohttp.FormData()
+    formulario.add_field("file", conteudo, filename=os.path.basename(caminho), content_type=tipo)
+    inicio = time.perf_counter()
+    async with sessao.post(f"{api}/upload-file", data=formulario) as response:
+        if response.status != 200:
+            await response.read()
+            return response.status, None, False, inicio
+        dados = await response.json(content_type=None)
+        ok = bool(dados.get("text")) and not dados["text"].startswith("Erro ao processar")
+        return response.status, None, ok, inicio
+
+
+REQUISICOES = {
+    "perguntar_stream": requisitar_perguntar_stream,
+    "perguntar": requisitar_perguntar,
+    "chat_ai": requisitar_chat_ai,
+    "upload_file": requisitar_upload_file,
+}
+
+
+async def executar_nivel(sessao, api, cenario, concorrencia, total, contexto):
+    requisitar = REQUISICOES[cenario]
+    fila = asyncio.Queue()
+    for indice in range(total):
+        fila.put_nowait(indice)
+    resultados = []
+
+    async def trabalhador():
+        while True:
+            try:
+                indice = fila.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            inicio = time.perf_counter()
+            try:
+                status, ttft, ok, inicio = await requisitar(sessao, api, indice, contexto)
+            except Exception as e:
+                status, ttft, ok = type(e).__name__, None, False
+            resultados.append({"latencia": time.perf_counter() - inicio, "ttft": ttft, "status": status, "ok": ok})
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+    return resumir(resultados, time.perf_counter() - inicio)
+
+
+async def aguardar_api(api, timeout=120):
+    limite = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as sessao:
+        while time.monotonic() < limite:
+            try:
+                async with sessao.get(f"{api}/health/ready") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError(f"A API em {api} não ficou pronta em {timeout}s")
+
+
+# Sobe o Ollama falso e a API em subprocessos, com estado em um diretório temporário
+def subir_ambiente(args, diretorio):
+    python = sys.executable
+    # Saída dos subprocessos em arquivo, para não misturar com o JSON do resultado
+    log = open(os.path.join(diretorio, "ambiente.log"), "w")
+    ollama = subprocess.Popen(
+        [python, "-m", "benchmark.ollama_falso", "--porta", str(args.porta_ollama),
+         "--tokens-por-segundo", str(args.tokens_por_segundo), "--ttft", str(args.ttft),
+         "--jitter", str(args.jitter), "--taxa-erro", str(args.taxa_erro), "--tokens", str(args.tokens)],
+        cwd=DIRETORIO_BACKEND, stdout=log, stderr=subprocess.STDOUT,
+    )
+    ambiente = {
+        **os.environ,
+        "OLLAMA_BACKENDS": f"http://127.0.0.1:{args.porta_ollama}",
+        "CACHE_EXTRACAO_DIR": os.path.join(diretorio, "cache_extracao"),
+        "BUSCA_INDICE_PATH": os.path.join(diretorio, "indice_busca.db"),
+    }
+    api = subprocess.Popen(
+        [python, "-m", "uvicorn", "main_api:app", "--host", "127.0.0.1", "--port", str(args.porta_api),
+         "--log-level", "warning"],
+        cwd=DIRETORIO_BACKEND, env=ambiente, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return [api, ollama]
+
+
+def versao_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=DIRETORIO_BACKEND, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def executar(args):
+    cenarios = [c.strip() for c in args.cenarios.split(",") if c.strip()]
+    desconhecidos = set(cenarios) - set(REQUISICOES)
+    if desconhecidos:
+        raise SystemExit(f"Cenários desconhecidos: {', '.join(sorted(desconhecidos))}. Opções: {', '.join(CENARIOS)}")
+    concorrencias = [int(c) for c in args.concorrencias.split(",") if c.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="gptpol_carga_") as diretorio:
+        processos = []
+        api = args.api
+        if not api:
+            processos = subir_ambiente(args, diretorio)
+            api = f"http://127.0.0.1:{args.porta_api}"
+        try:
+            await aguardar_api(api)
+            contexto = {"repetir": args.repetir, "arquivos": []}
+            if "upload_file" in cenarios:
+                for caminho, tipo in gerar_arquivos(os.path.join(diretorio, "arquivos"), args.paginas_pdf):
+                    with open(caminho, "rb") as f:
+                        contexto["arquivos"].append((caminho, tipo, f.read()))
+
+            relatorio = {
+                "versao": versao_atual(),
+                "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "api": api,
+                "parametros": {
+                    "requisicoes": args.requisicoes,
+                    "repetir": args.repetir,
+                    "ollama_falso": None if args.api else {
+                        "tokens_por_segundo": args.tokens_por_segundo, "ttft": args.ttft,
+                        "jitter": args.jitter, "taxa_erro": args.taxa_erro, "tokens": args.tokens,
+                    },
+                },
+                "cenarios": {},
+            }
+            conector = aiohttp.TCPConnector(limit=0)
+            tempo_limite = aiohttp.ClientTimeout(total=args.timeout)
+            async with aiohttp.ClientSession(connector=conector, timeout=tempo_limite) as sessao:
+                for cenario in cenarios:
+                    relatorio["cenarios"][cenario] = {}
+                    for concorrencia in concorrencias:
+                        total = max(args.requisicoes, concorrencia)
+                        print(f"{cenario}: concorrência {concorrencia}, {total} requisições...", file=sys.stderr)
+                        resumo = await executar_nivel(sessao, api, cenario, concorrencia, total, contexto)
+                        relatorio["cenarios"][cenario][str(concorrencia)] = resumo
+            return relatorio
+        finally:
+            for processo in processos:
+                processo.terminate()
+            for processo in processos:
+                try:
+                    processo.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    processo.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga da API GPTPOL")
+    parser.add_argument("--api", help="URL de uma API já em execução (sem isso, o ambiente é criado localmente)")
+    parser.add_argument("--cenarios", default=",".join(CENARIOS))
+    parser.add_argument("--concorrencias", default="1,4,16")
+    parser.add_argument("--requisicoes", type=int, default=32, help="Requisições por nível de concorrência")
+    parser.add_argument("--repetir", action="store_true", help="Repetir perguntas e arquivos (mede cache e coalescência)")
+    parser.add_argument("--timeout", type=float, default=300, help="Tempo limite por requisição (s)")
+    parser.add_argument("--paginas-pdf", type=int, default=20)
+    parser.add_argument("--saida", help="Arquivo JSON de saída (padrão: stdout)")
+    # Ambiente local
+    parser.add_argument("--porta-api", type=int, default=8765)
+    parser.add_argument("--porta-ollama", type=int, default=11765)
+    parser.add_argument("--tokens-por-segundo", type=float, default=40.0)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=48)
+    args = parser.parse_args()
+
+    relatorio = asyncio.run(executar(args))
+    texto = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto + "\n")
+        print(f"Resultado salvo em {args.saida}", file=sys.stderr)
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# ipe_falso.py
+# Servidor IP-e falso para testar o rpa_engine sem acesso ao sistema real. Serve uma listagem paginada
+# de inquéritos (tabela HTML com link para o detalhe e rel="next") e as páginas de detalhe (<dl>).
+# Com --js a listagem chega vazia e é montada por JavaScript (exige o modo navegador). A rota
+# POST /_alterar?quantidade=N altera N inquéritos para testar a sincronização incremental.
+#
+# Uso: python -m benchmark.ipe_falso --porta 8090 --inqueritos 5000 --latencia 0.02
+
+import argparse
+import asyncio
+import html
+import json
+import random
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+SITUACOES = ("Em andamento", "Relatado", "Aguardando diligência", "Prorrogado")
+
+
+def gerar_inqueritos(quantidade, semente=42):
+    aleatorio = random.Random(semente)
+    base = datetime(2024, 1, 1)
+    inqueritos = []
+    for indice in range(quantidade):
+        criacao = base + timedelta(days=aleatorio.randint(0, 600), hours=aleatorio.randint(0, 23))
+        inqueritos.append({
+            "numero": f"{indice + 1:06d}/2024",
+            "descricao": f"Apuração do fato {indice + 1} registrado na delegacia {aleatorio.randint(1, 40)}",
+            "data_criacao": criacao,
+            "data_vencimento": criacao + timedelta(days=aleatorio.choice((30, 60, 90, 120))),
+            "situacao": aleatorio.choice(SITUACOES),
+            "atualizacao": criacao,
+        })
+    return inqueritos
+
+
+def _data(valor):
+    return valor.strftime("%d/%m/%Y")
+
+
+def criar_app(quantidade=1000, por_pagina=100, latencia=0.0, js=False):
+    inqueritos = gerar_inqueritos(quantidade)
+    por_numero = {i["numero"].replace("/", "-"): i for i in inqueritos}
+    estado = {"listagens": 0, "detalhes": 0}
+
+    def linhas(pagina):
+        return inqueritos[(pagina - 1) * por_pagina:pagina * por_pagina]
+
+    async def listagem(request):
+        await asyncio.sleep(latencia)
+        estado["listagens"] += 1
+        pagina = max(int(request.query.get("pagina", 1)), 1)
+        total_paginas = max((len(inqueritos) + por_pagina - 1) // por_pagina, 1)
+        proxima = f'<a rel="next" href="/inqueritos?pagina={pagina + 1}">Próxima</a>' if pagina < total_paginas else ""
+        cabecalho = "<tr><th>Número</th><th>Situação</th><th>Instauração</th><th>Vencimento</th><th>Atualização</th></tr>"
+        if js:
+            dados = json.dumps([
+                [i["numero"], i["situacao"], _data(i["data_criacao"]), _data(i["data_vencimento"]), i["atualizacao"].isoformat()]
+                for i in linhas(pagina)
+            ])
+            corpo = f"""<table id="inqueritos">{cabecalho}</table>{proxima}
+<script>
+for (const c of {dados}) {{
+  const tr = document.createElement("tr");
+  tr.innerHTML = `<td><a href="/inqueritos/${{c[0].replace("/", "-")}}">${{c[0]}}</a></td>` +
+    c.slice(1).map(v => `<td>${{v}}</td>`).join("");
+  document.getElementById("inqueritos").appendChild(tr);
+}}
+</script>"""
+        else:
+            corpo = f'<table id="inqueritos">{cabecalho}' + "".join(
+                f'<tr><td><a href="/inqueritos/{i["numero"].replace("/", "-")}">{i["numero"]}</a></td>'
+                f'<td>{html.escape(i["situacao"])}</td><td>{_data(i["data_criacao"])}</td>'
+                f'<td>{_data(i["data_vencimento"])}</td><td>{i["atualizacao"].isoformat()}</td></tr>'
+                for i in linhas(pagina)
+            ) + f"</table>{proxima}"
+        return web.Response(text=f"<html><body><h1>Inquéritos</h1>{corpo}</body></html>", content_type="text/html")
+
+    async def detalhe(request):
+        await asyncio.sleep(latencia)
+        inquerito = por_numero.get(request.match_info["numero"])
+        if inquerito is None:
+            raise web.HTTPNotFound()
+        estado["detalhes"] += 1
+        return web.Response(content_type="text/html", text=f"""<html><body><dl>
+<dt>Número do inquérito</dt><dd>{inquerito["numero"]}</dd>
+<dt>Descrição</dt><dd>{html.escape(inquerito["descricao"])}</dd>
+<dt>Data de instauração</dt><dd>{_data(inquerito["data_criacao"])}</dd>
+<dt>Data de vencimento</dt><dd>{_data(inquerito["data_vencimento"])}</dd>
+<dt>Situação</dt><dd>{html.escape(inquerito["situacao"])}</dd>
+</dl></body></html>""")
+
+    # Prorroga N inquéritos aleatórios (muda vencimento, situação e data de atualização na listagem)
+    async def alterar(request):
+        quantidade_alterar = int(request.query.get("quantidade", 10))
+        alterados = random.sample(inqueritos, min(quantidade_alterar, len(inqueritos)))
+        for inquerito in alterados:
+            inquerito["data_vencimento"] += timedelta(days=30)
+            inquerito["situacao"] = "Prorrogado"
+            inquerito["atualizacao"] = datetime.now().replace(microsecond=0)
+        return web.json_response({"alterados": [i["numero"] for i in alterados]})
+
+    async def estatisticas(request):
+        return web.json_response(estado)
+
+    app = web.Application()
+    app.router.add_get("/inqueritos", listagem)
+    app.router.add_get("/inqueritos/{numero}", detalhe)
+    app.router.add_post("/_alterar", alterar)
+    app.router.add_get("/_estatisticas", estatisticas)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor IP-e falso para testes do rpa_engine")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8090)
+    parser.add_argument("--inqueritos", type=int, default=1000)
+    parser.add_argument("--por-pagina", type=int, default=100)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Atraso por página (s)")
+    parser.add_argument("--js", action="store_true", help="Listagem montada por JavaScript")
+    args = parser.parse_args()
+    print(f"IP-e falso em http://{args.host}:{args.porta} ({args.inqueritos} inquéritos)")
+    web.run_app(criar_app(args.inqueritos, args.por_pagina, args.latencia, args.js), host=args.host, port=args.porta, print=None)
+
+
+if __name__ == "__main__":
+    main()
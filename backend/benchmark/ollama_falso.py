@@ -0,0 +1,177 @@
+# ollama_falso.py
+# Servidor Ollama falso para testes de carga. Responde /api/generate (NDJSON em streaming ou JSON
+# único) com velocidade de tokens, tempo até o primeiro token, variação (jitter) e taxa de erros
+# configuráveis, além de /api/tags, /api/ps e /api/embeddings. O frame final traz eval_count,
+# eval_duration e prompt_eval_duration como o Ollama real.
+#
+# Uso: python -m benchmark.ollama_falso --porta 11435 --tokens-por-segundo 30 --ttft 0.5
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import zlib
+
+from aiohttp import web
+
+PALAVRAS = (
+    "o inquérito policial apura a autoria e a materialidade do fato investigado conforme o código de "
+    "processo penal e a autoridade policial deve concluir o procedimento no prazo legal"
+).split()
+
+
+class ConfiguracaoFalsa:
+    def __init__(self, modelos=("deepseek-r1:32b",), tokens_por_segundo=20.0, ttft=0.3, jitter=0.2,
+                 taxa_erro=0.0, tokens=64, carga=0.0, modelos_embedding=("nomic-embed-text:latest",)):
+        self.modelos = list(modelos)
+        # Modelos de embedding, listados em /api/tags com a tag explícita como no Ollama real
+        self.modelos_embedding = list(modelos_embedding)
+        self.tokens_por_segundo = tokens_por_segundo
+        # Tempo até o primeiro token (avaliação do prompt), em segundos
+        self.ttft = ttft
+        # Variação relativa aplicada aos tempos (0.2 = ±20%)
+        self.jitter = jitter
+        # Fração das gerações que respondem 500
+        self.taxa_erro = taxa_erro
+        self.tokens = tokens
+        # Tempo de "carga do modelo" na primeira geração
+        self.carga = carga
+
+
+def _variar(valor, jitter):
+    if not jitter:
+        return valor
+    return max(0.0, valor * random.uniform(1 - jitter, 1 + jitter))
+
+
+def criar_app(config):
+    estado = {"carregados": set(), "geracoes": 0, "ativas": 0}
+
+    async def carregar(modelo):
+        if modelo not in estado["carregados"]:
+            await asyncio.sleep(config.carga)
+            estado["carregados"].add(modelo)
+
+    def frame_final(inicio, prompt_eval, tokens, prompt):
+        total = time.perf_counter() - inicio
+        return {
+            "model": config.modelos[0],
+            "response": "",
+            "done": True,
+            "context": list(range(1, 17)),
+            "total_duration": int(total * 1e9),
+            "prompt_eval_count": max(1, len(prompt) // 4),
+            "prompt_eval_duration": int(prompt_eval * 1e9),
+            "eval_count": tokens,
+            "eval_duration": int(max(total - prompt_eval, 1e-6) * 1e9),
+        }
+
+    async def gerar(request):
+        corpo = await request.json()
+        modelo = corpo.get("model")
+        if modelo not in config.modelos:
+            return web.json_response({"error": f"model '{modelo}' not found"}, status=404)
+        await carregar(modelo)
+        prompt = corpo.get("prompt", "")
+        # Prompt vazio apenas carrega o modelo (aquecimento)
+        if not prompt:
+            return web.json_response({"model": modelo, "response": "", "done": True, "done_reason": "load"})
+        if config.taxa_erro and random.random() < config.taxa_erro:
+            return web.json_response({"error": "falha simulada"}, status=500)
+
+        estado["geracoes"] += 1
+        estado["ativas"] += 1
+        try:
+            inicio = time.perf_counter()
+            tokens = max(1, int(_variar(config.tokens, config.jitter)))
+            intervalo = 1.0 / config.tokens_por_segundo if config.tokens_por_segundo else 0
+            prompt_eval = _variar(config.ttft, config.jitter)
+            await asyncio.sleep(prompt_eval)
+
+            if not corpo.get("stream", True):
+                await asyncio.sleep(_variar(intervalo * tokens, config.jitter))
+                texto = " ".join(random.choice(PALAVRAS) for _ in range(tokens))
+                return web.json_response({**frame_final(inicio, prompt_eval, tokens, prompt), "response": texto})
+
+            resposta = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+            await resposta.prepare(request)
+            for indice in range(tokens):
+                if indice:
+                    await asyncio.sleep(_variar(intervalo, config.jitter))
+                token = (" " if indice else "") + random.choice(PALAVRAS)
+                await resposta.write(json.dumps({"model": modelo, "response": token, "done": False}).encode() + b"\n")
+            await resposta.write(json.dumps(frame_final(inicio, prompt_eval, tokens, prompt)).encode() + b"\n")
+            await resposta.write_eof()
+            return resposta
+        finally:
+            estado["ativas"] -= 1
+
+    async def tags(request):
+        return web.json_response({
+            "models": [{"name": modelo, "model": modelo} for modelo in config.modelos + config.modelos_embedding]
+        })
+
+    async def ps(request):
+        return web.json_response({"models": [{"name": modelo, "model": modelo} for modelo in sorted(estado["carregados"])]})
+
+    async def embeddings(request):
+        corpo = await request.json()
+        modelo = corpo.get("model") or ""
+        if modelo not in config.modelos_embedding and f"{modelo}:latest" not in config.modelos_embedding:
+            return web.json_response({"error": f"model '{modelo}' not found"}, status=404)
+        texto = corpo.get("prompt") or corpo.get("input") or ""
+        if isinstance(texto, list):
+            texto = " ".join(texto)
+        # Vetor determinístico a partir das palavras (suficiente para testar a busca por similaridade)
+        vetor = [0.0] * 64
+        for palavra in texto.lower().split():
+            vetor[zlib.crc32(palavra.encode()) % 64] += 1.0
+        return web.json_response({"embedding": vetor, "embeddings": [vetor]})
+
+    async def estatisticas(request):
+        return web.json_response({"geracoes": estado["geracoes"], "ativas": estado["ativas"]})
+
+    app = web.Application()
+    app.router.add_post("/api/generate", gerar)
+    app.router.add_get("/api/tags", tags)
+    app.router.add_get("/api/ps", ps)
+    app.router.add_post("/api/embeddings", embeddings)
+    app.router.add_post("/api/embed", embeddings)
+    app.router.add_get("/_estatisticas", estatisticas)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor Ollama falso para testes de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=11435)
+    parser.add_argument("--modelo", action="append", dest="modelos", help="Modelo servido (pode repetir)")
+    parser.add_argument("--tokens-por-segundo", type=float, default=20.0)
+    parser.add_argument("--ttft", type=float, default=0.3, help="Tempo até o primeiro token (s)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Variação relativa dos tempos (0.2 = ±20%%)")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração de gerações com erro 500")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens por resposta")
+    parser.add_argument(
+        "--modelo-embedding", action="append", dest="modelos_embedding",
+        help="Modelo de embedding servido (pode repetir; padrão nomic-embed-text:latest)"
+    )
+    parser.add_argument("--carga", type=float, default=0.0, help="Tempo de carga do modelo na primeira geração (s)")
+    args = parser.parse_args()
+
+    config = ConfiguracaoFalsa(
+        modelos=args.modelos or ["deepseek-r1:32b"],
+        tokens_por_segundo=args.tokens_por_segundo,
+        ttft=args.ttft,
+        jitter=args.jitter,
+        taxa_erro=args.taxa_erro,
+        tokens=args.tokens,
+        carga=args.carga,
+        modelos_embedding=args.modelos_embedding or ["nomic-embed-text:latest"],
+    )
+    print(f"Ollama falso em http://{args.host}:{args.porta} ({config.tokens_por_segundo} tokens/s, ttft {config.ttft}s)")
+    web.run_app(criar_app(config), host=args.host, port=args.porta, print=None)
+
+
+if __name__ == "__main__":
+    main()
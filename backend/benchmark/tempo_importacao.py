@@ -0,0 +1,81 @@
+# tempo_importacao.py
+# Verifica o custo de importar main_api (o que cada worker paga ao subir). Importa o módulo em processos
+# novos com "python -X importtime", mostra a mediana e os módulos mais caros e falha (código de saída 1)
+# se a mediana passar do orçamento ou se alguma biblioteca de carga tardia (extração de PDF/DOCX/XLSX)
+# for importada junto com a aplicação.
+#
+# Uso (a partir de backend/):
+#   python -m benchmark.tempo_importacao --repeticoes 5 --orcamento-ms 1500
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from config_manager import obter_config
+
+# Carregadas só no primeiro uso (extracao.py)
+CARGA_TARDIA = ("PyPDF2", "docx", "openpyxl")
+
+
+# Uma importação em processo novo: {módulo: tempo acumulado em µs}
+def medir_importacao(modulo):
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if resultado.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {modulo}:\n{resultado.stderr[-2000:]}")
+    tempos = {}
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha:
+            continue
+        _, acumulado, nome = linha.split("|", 2)
+        try:
+            tempos[nome.strip()] = int(acumulado)
+        except ValueError:
+            continue
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Orçamento de tempo de importação da API")
+    parser.add_argument("--modulo", default="main_api")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument(
+        "--orcamento-ms", type=float,
+        default=obter_config("SERVIDOR", "SERVIDOR_ORCAMENTO_IMPORTACAO_MS", 1500, float)
+    )
+    parser.add_argument("--top", type=int, default=15, help="Módulos mais caros a listar")
+    args = parser.parse_args()
+
+    # A primeira importação compila os .pyc e aquece o cache de disco; não entra na conta
+    medir_importacao(args.modulo)
+    medicoes = [medir_importacao(args.modulo) for _ in range(args.repeticoes)]
+    totais = [tempos[args.modulo] / 1000 for tempos in medicoes]
+    mediana = statistics.median(totais)
+
+    ultima = medicoes[-1]
+    print(f"Importação de {args.modulo}: mediana {mediana:.0f} ms (mín. {min(totais):.0f}, máx. {max(totais):.0f})")
+    # Pacotes de primeiro nível (sem ".") com o tempo acumulado de tudo o que eles importam
+    print("Pacotes mais caros:")
+    raizes = {nome: tempo for nome, tempo in ultima.items() if "." not in nome and nome != args.modulo}
+    for nome, tempo in sorted(raizes.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {tempo / 1000:8.1f} ms  {nome}")
+
+    falhas = []
+    carregadas = [nome for nome in CARGA_TARDIA if nome in ultima]
+    if carregadas:
+        falhas.append(f"bibliotecas de carga tardia importadas na inicialização: {', '.join(carregadas)}")
+    if mediana > args.orcamento_ms:
+        falhas.append(f"mediana de {mediana:.0f} ms acima do orçamento de {args.orcamento_ms:.0f} ms")
+    for falha in falhas:
+        print(f"FALHA: {falha}")
+    if falhas:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
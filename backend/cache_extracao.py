@@ -0,0 +1,178 @@
+# cache_extracao.py
+# Este módulo guarda o texto extraído dos documentos em disco, indexado pelo SHA-256 do conteúdo
+# (calculado durante o upload). Um documento reenviado devolve o texto sem chamar nenhum extrator.
+# O espaço em disco é limitado: os arquivos acessados há mais tempo são removidos primeiro.
+# Com vários workers, o diretório é a fonte da verdade: o índice em memória é só um atalho, um documento
+# gravado por outro worker é encontrado no disco, o último acesso fica no mtime do arquivo e o limite
+# vale para o diretório inteiro (a limpeza varre o diretório, um worker por vez).
+
+import asyncio
+import os
+import time
+
+from config_manager import obter_config
+
+try:
+    import fcntl
+except ImportError:
+    # Sem fcntl (Windows), a limpeza roda sem o lock entre processos; remoções repetidas são inofensivas
+    fcntl = None
+
+# Sufixo por tipo: o mesmo conteúdo declarado com tipos diferentes passa por extratores diferentes
+SUFIXOS_TIPO = {
+    "application/pdf": "pdf",
+    "application/msword": "doc",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.ms-excel": "xls",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+    "text/plain": "txt",
+}
+
+
+class CacheExtracao:
+    def __init__(self, diretorio=None, max_bytes=None):
+        self.diretorio = diretorio or obter_config(
+            "CACHE_EXTRACAO", "CACHE_EXTRACAO_DIR",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_extracao")
+        )
+        self.max_bytes = max_bytes or obter_config("CACHE_EXTRACAO", "CACHE_EXTRACAO_MAX_BYTES", 512 * 1024 * 1024, int)
+        # chave -> [tamanho em bytes, último acesso]
+        self._indice = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def iniciar(self):
+        await asyncio.to_thread(self._carregar_indice)
+        print(f"Cache de extração: {self.diretorio} ({len(self._indice)} documentos, {self._bytes} bytes)")
+
+    def _carregar_indice(self):
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._indice, self._bytes = self._varrer()
+
+    # Documentos no diretório (de todos os workers): chave -> [tamanho, último acesso (mtime)]
+    def _varrer(self):
+        indice = {}
+        total = 0
+        with os.scandir(self.diretorio) as entradas:
+            for entrada in entradas:
+                if not entrada.name.endswith(".txt"):
+                    continue
+                try:
+                    info = entrada.stat()
+                except FileNotFoundError:
+                    continue
+                indice[entrada.name[:-4]] = [info.st_size, info.st_mtime]
+                total += info.st_size
+        return indice, total
+
+    def chave(self, sha256, tipo_arquivo):
+        return f"{sha256}.{SUFIXOS_TIPO.get(tipo_arquivo, 'bin')}"
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f"{chave}.txt")
+
+    async def obter(self, sha256, tipo_arquivo):
+        return await self.obter_por_chave(self.chave(sha256, tipo_arquivo))
+
+    # Fora do índice, o arquivo ainda pode ter sido gravado por outro worker: o disco é consultado sempre
+    async def obter_por_chave(self, chave):
+        try:
+            texto, tamanho = await asyncio.to_thread(self._ler, chave)
+        except OSError:
+            self._descartar(chave)
+            self.misses += 1
+            return None
+        agora = time.time()
+        item = self._indice.get(chave)
+        if item is None:
+            self._indice[chave] = [tamanho, agora]
+            self._bytes += tamanho
+        else:
+            item[1] = agora
+        self.hits += 1
+        return texto
+
+    def _ler(self, chave):
+        caminho = self._caminho(chave)
+        with open(caminho, "r", encoding="utf-8") as f:
+            texto = f.read()
+            tamanho = os.fstat(f.fileno()).st_size
+        # O mtime marca o último acesso para a limpeza de qualquer worker
+        try:
+            os.utime(caminho)
+        except FileNotFoundError:
+            pass
+        return texto, tamanho
+
+    async def guardar(self, sha256, tipo_arquivo, texto):
+        chave = self.chave(sha256, tipo_arquivo)
+        tamanho = await asyncio.to_thread(self._gravar, chave, texto)
+        if tamanho > self.max_bytes:
+            await asyncio.to_thread(self._remover_arquivo, chave)
+            return
+        self._descartar(chave)
+        self._indice[chave] = [tamanho, time.time()]
+        self._bytes += tamanho
+        await asyncio.to_thread(self._respeitar_limite)
+
+    def _gravar(self, chave, texto):
+        # Grava em arquivo temporário e renomeia, para nunca deixar um texto pela metade no cache
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(texto)
+        os.replace(temporario, caminho)
+        return os.path.getsize(caminho)
+
+    def _remover_arquivo(self, chave):
+        try:
+            os.unlink(self._caminho(chave))
+        except FileNotFoundError:
+            pass
+
+    def _descartar(self, chave):
+        item = self._indice.pop(chave, None)
+        if item is not None:
+            self._bytes -= item[0]
+
+    # Limite do diretório inteiro (todos os workers): varre o disco e remove os documentos acessados há
+    # mais tempo até caber. Só um worker limpa por vez; se outro já está limpando, este não espera
+    def _respeitar_limite(self):
+        with open(os.path.join(self.diretorio, ".limpeza.lock"), "w") as trava:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return
+            indice, total = self._varrer()
+            for chave, (tamanho, _) in sorted(indice.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                self._remover_arquivo(chave)
+                del indice[chave]
+                total -= tamanho
+            # O índice local passa a refletir o diretório (inclusive o que os outros workers gravaram)
+            self._indice, self._bytes = indice, total
+
+    async def invalidar(self):
+        def remover_todos():
+            indice, _ = self._varrer()
+            for chave in indice:
+                self._remover_arquivo(chave)
+            return len(indice)
+
+        removidos = await asyncio.to_thread(remover_todos)
+        self._indice, self._bytes = {}, 0
+        return removidos
+
+    def estatisticas(self):
+        consultas = self.hits + self.misses
+        return {
+            "documentos": len(self._indice),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "taxa_acerto": round(self.hits / consultas, 4) if consultas else 0.0,
+        }
@@ -0,0 +1,187 @@
+# cache_respostas.py
+# Este módulo guarda respostas já geradas pelo modelo, indexadas por (modelo, prompt, opções, modo Thinkkn).
+# Camada em memória (LRU com TTL e limites de tamanho) e camada opcional em SQLite que sobrevive a reinícios.
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config_manager import obter_config, cota_por_worker
+
+
+# Gera a chave do cache a partir de tudo o que influencia a resposta
+# dono: usuário cujas passagens entraram no prompt ("" quando a resposta pode ser compartilhada)
+def gerar_chave(modelo, prompt, opcoes, thinkkn_mode, dono=""):
+    campos = {"modelo": modelo, "prompt": prompt, "opcoes": opcoes, "thinkkn": bool(thinkkn_mode)}
+    if dono:
+        campos["dono"] = dono
+    material = json.dumps(campos, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class CacheSQLite:
+    def __init__(self, caminho, max_itens):
+        self.caminho = caminho
+        self.max_itens = max_itens
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS respostas ("
+            "chave TEXT PRIMARY KEY, valor TEXT NOT NULL, criado_em REAL NOT NULL, acessado_em REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_respostas_acessado_em ON respostas (acessado_em)")
+        self._conn.commit()
+
+    def obter(self, chave, ttl):
+        with self._lock:
+            linha = self._conn.execute("SELECT valor, criado_em FROM respostas WHERE chave = ?", (chave,)).fetchone()
+            if linha is None:
+                return None
+            valor, criado_em = linha
+            agora = time.time()
+            if ttl and agora - criado_em > ttl:
+                self._conn.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE respostas SET acessado_em = ? WHERE chave = ?", (agora, chave))
+            self._conn.commit()
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            agora = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respostas (chave, valor, criado_em, acessado_em) VALUES (?, ?, ?, ?)",
+                (chave, valor, agora, agora),
+            )
+            # Descartar as entradas menos usadas quando passar do limite
+            self._conn.execute(
+                "DELETE FROM respostas WHERE chave IN ("
+                "SELECT chave FROM respostas ORDER BY acessado_em DESC LIMIT -1 OFFSET ?)",
+                (self.max_itens,),
+            )
+            self._conn.commit()
+
+    def remover(self, chave=None):
+        with self._lock:
+            if chave is None:
+                cursor = self._conn.execute("DELETE FROM respostas")
+            else:
+                cursor = self._conn.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def contar(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]
+
+    def fechar(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CacheRespostas:
+    def __init__(self, max_itens=None, max_bytes=None, ttl=None, caminho_sqlite=None):
+        self.max_itens = max_itens or obter_config("CACHE", "CACHE_MAX_ITENS", 512, int)
+        # Memória total do cache no servidor, dividida entre os workers
+        self.max_bytes = max_bytes or cota_por_worker(obter_config("CACHE", "CACHE_MAX_BYTES", 32 * 1024 * 1024, int))
+        self.ttl = ttl if ttl is not None else obter_config("CACHE", "CACHE_TTL", 86400, float)
+        self.caminho_sqlite = caminho_sqlite or obter_config("CACHE", "CACHE_SQLITE_PATH", None)
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._disco = None
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+
+    def iniciar(self):
+        if self.caminho_sqlite and self._disco is None:
+            max_itens_disco = obter_config("CACHE", "CACHE_SQLITE_MAX_ITENS", 10000, int)
+            self._disco = CacheSQLite(self.caminho_sqlite, max_itens_disco)
+            print(f"Cache de respostas em disco: {self.caminho_sqlite}")
+
+    def encerrar(self):
+        if self._disco is not None:
+            self._disco.fechar()
+            self._disco = None
+
+    async def obter(self, chave):
+        valor = self._obter_memoria(chave)
+        if valor is not None:
+            self.hits_memoria += 1
+            return valor
+        if self._disco is not None:
+            valor = await asyncio.to_thread(self._disco.obter, chave, self.ttl)
+            if valor is not None:
+                self.hits_disco += 1
+                self._guardar_memoria(chave, valor)
+                return valor
+        self.misses += 1
+        return None
+
+    async def guardar(self, chave, valor):
+        if not valor:
+            return
+        self._guardar_memoria(chave, valor)
+        if self._disco is not None:
+            await asyncio.to_thread(self._disco.guardar, chave, valor)
+
+    async def invalidar(self, chave=None):
+        if chave is None:
+            removidos = len(self._itens)
+            self._itens.clear()
+            self._bytes = 0
+        else:
+            removidos = 1 if self._remover_memoria(chave) else 0
+        if self._disco is not None:
+            removidos = max(removidos, await asyncio.to_thread(self._disco.remover, chave))
+        return removidos
+
+    def estatisticas(self):
+        consultas = self.hits_memoria + self.hits_disco + self.misses
+        return {
+            "itens_memoria": len(self._itens),
+            "bytes_memoria": self._bytes,
+            "max_itens": self.max_itens,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "itens_disco": self._disco.contar() if self._disco is not None else None,
+            "hits_memoria": self.hits_memoria,
+            "hits_disco": self.hits_disco,
+            "misses": self.misses,
+            "taxa_acerto": round((self.hits_memoria + self.hits_disco) / consultas, 4) if consultas else 0.0,
+        }
+
+    def _obter_memoria(self, chave):
+        item = self._itens.get(chave)
+        if item is None:
+            return None
+        valor, criado_em = item
+        if self.ttl and time.time() - criado_em > self.ttl:
+            self._remover_memoria(chave)
+            return None
+        self._itens.move_to_end(chave)
+        return valor
+
+    def _guardar_memoria(self, chave, valor):
+        tamanho = len(valor.encode("utf-8"))
+        if tamanho > self.max_bytes:
+            return
+        self._remover_memoria(chave)
+        self._itens[chave] = (valor, time.time())
+        self._bytes += tamanho
+        while len(self._itens) > self.max_itens or self._bytes > self.max_bytes:
+            _, (antigo, _) = self._itens.popitem(last=False)
+            self._bytes -= len(antigo.encode("utf-8"))
+
+    def _remover_memoria(self, chave):
+        item = self._itens.pop(chave, None)
+        if item is None:
+            return False
+        self._bytes -= len(item[0].encode("utf-8"))
+        return True
@@ -0,0 +1,228 @@
+# cache_semantico.py
+# Este módulo guarda respostas por significado da pergunta: paráfrases ("prazo do inquérito policial" e
+# "quanto tempo dura um IP") reaproveitam a resposta já gerada, sem passar pela fila de geração.
+# Cada pergunta vira um vetor pelo endpoint de embeddings do Ollama; os vetores normalizados ficam em uma
+# matriz NumPy e a busca é um produto matricial (similaridade de cosseno) contra o limiar configurado.
+# Entradas expiram por TTL e, com o índice cheio, sai a usada há mais tempo.
+
+import asyncio
+import hashlib
+import re
+import statistics
+import time
+from collections import OrderedDict, deque
+
+import metricas
+from config_manager import obter_config, cota_por_worker
+
+try:
+    import numpy as np
+    NUMPY_DISPONIVEL = True
+except ImportError:
+    NUMPY_DISPONIVEL = False
+    print("Aviso: numpy não está instalado; o cache semântico fica desativado (pip install numpy).")
+
+NUMEROS = re.compile(r"\d+(?:[./-]\d+)*")
+
+
+# Escopo de uma pergunta: só perguntas do mesmo escopo podem compartilhar resposta. Entram o modelo, o modo
+# Thinkkn, os documentos das passagens recuperadas, o usuário dono dessas passagens e os números citados
+# ("inquérito 123/2024" e "inquérito 456/2024" ficam próximos no espaço vetorial, mas não têm a mesma resposta)
+def gerar_escopo(modelo, thinkkn_mode, pergunta, passagens=(), dono=""):
+    documentos = sorted({passagem.split("\n", 1)[0] for passagem in passagens})
+    numeros = sorted(set(NUMEROS.findall(pergunta)))
+    material = "\x1f".join([modelo, str(bool(thinkkn_mode)), dono or "", *documentos, "#", *numeros])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class IndiceVetorial:
+    def __init__(self, capacidade, dimensao):
+        self.capacidade = capacidade
+        self.dimensao = dimensao
+        # Linhas [0, tamanho) ocupadas; vetores já normalizados (produto escalar = cosseno). A matriz dobra de
+        # tamanho conforme enche, até a capacidade (a maioria dos escopos tem poucas perguntas)
+        linhas = min(capacidade, 16)
+        self._vetores = np.zeros((linhas, dimensao), dtype=np.float32)
+        self._criado_em = np.zeros(linhas)
+        self._usado_em = np.zeros(linhas)
+        self._respostas = []
+        self._perguntas = []
+        self.tamanho = 0
+
+    def _crescer(self):
+        linhas = min(self.capacidade, len(self._vetores) * 2)
+        self._vetores = np.resize(self._vetores, (linhas, self.dimensao))
+        self._criado_em = np.resize(self._criado_em, linhas)
+        self._usado_em = np.resize(self._usado_em, linhas)
+
+    # Linha mais parecida com o vetor (entradas expiradas não contam): (linha, similaridade)
+    def buscar(self, vetor, ttl, agora):
+        if not self.tamanho:
+            return None, 0.0
+        similaridades = self._vetores[:self.tamanho] @ vetor
+        if ttl:
+            similaridades[self._criado_em[:self.tamanho] < agora - ttl] = -1.0
+        linha = int(np.argmax(similaridades))
+        return linha, float(similaridades[linha])
+
+    def obter(self, linha, agora):
+        self._usado_em[linha] = agora
+        return self._perguntas[linha], self._respostas[linha]
+
+    def guardar(self, vetor, pergunta, resposta, agora, ttl, linha=None):
+        if linha is None:
+            if self.tamanho < self.capacidade:
+                if self.tamanho == len(self._vetores):
+                    self._crescer()
+                linha = self.tamanho
+                self.tamanho += 1
+                self._perguntas.append(None)
+                self._respostas.append(None)
+            else:
+                # Índice cheio: reaproveita uma entrada expirada ou a usada há mais tempo
+                expiradas = np.flatnonzero(self._criado_em < agora - ttl) if ttl else ()
+                linha = int(expiradas[0]) if len(expiradas) else int(np.argmin(self._usado_em))
+        self._vetores[linha] = vetor
+        self._criado_em[linha] = agora
+        self._usado_em[linha] = agora
+        self._perguntas[linha] = pergunta
+        self._respostas[linha] = resposta
+
+    def bytes(self):
+        return self._vetores.nbytes + sum(len(r.encode("utf-8")) for r in self._respostas)
+
+
+class CacheSemantico:
+    def __init__(self, cliente, modelo=None, limiar=None, capacidade=None, ttl=None):
+        self.cliente = cliente
+        self.ativo = obter_config("CACHE_SEMANTICO", "CACHE_SEMANTICO_ATIVO", True, bool) and NUMPY_DISPONIVEL
+        self.modelo = modelo or obter_config("CACHE_SEMANTICO", "CACHE_SEMANTICO_MODELO", "nomic-embed-text")
+        # Similaridade de cosseno mínima para devolver uma resposta guardada
+        self.limiar = limiar or obter_config("CACHE_SEMANTICO", "CACHE_SEMANTICO_LIMIAR", 0.92, float)
+        # Perguntas por escopo; o total de memória é dividido entre os workers do servidor
+        self.capacidade = capacidade or cota_por_worker(obter_config("CACHE_SEMANTICO", "CACHE_SEMANTICO_CAPACIDADE", 2000, int))
+        # Escopos guardados; com o limite atingido, sai o escopo consultado há mais tempo
+        self.max_escopos = cota_por_worker(obter_config("CACHE_SEMANTICO", "CACHE_SEMANTICO_MAX_ESCOPOS", 500, int))
+        self.ttl = ttl if ttl is not None else obter_config("CACHE_SEMANTICO", "CACHE_SEMANTICO_TTL", 86400, float)
+        self.timeout = obter_config("CACHE_SEMANTICO", "CACHE_SEMANTICO_TIMEOUT", 2, float)
+        # Perguntas longas (com texto de documento colado) não passam pelo cache semântico
+        self.max_caracteres = obter_config("CACHE_SEMANTICO", "CACHE_SEMANTICO_MAX_CARACTERES", 1000, int)
+        # Depois de uma falha no endpoint de embeddings, o cache fica suspenso por este tempo (s)
+        self.pausa_erro = obter_config("CACHE_SEMANTICO", "CACHE_SEMANTICO_PAUSA_ERRO", 60, float)
+        self._indices = OrderedDict()
+        self._suspenso_ate = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.erros = 0
+        self.ignoradas = 0
+        # Últimas medições para as estatísticas
+        self._similaridades = deque(maxlen=1000)
+        self._tempos_embedding = deque(maxlen=1000)
+        self._tempos_busca = deque(maxlen=1000)
+
+    def _disponivel(self, pergunta):
+        return self.ativo and len(pergunta) <= self.max_caracteres and time.monotonic() >= self._suspenso_ate
+
+    # Vetor normalizado da pergunta, ou None se o Ollama não respondeu
+    async def vetorizar(self, texto):
+        inicio = time.perf_counter()
+        try:
+            status, corpo = await asyncio.wait_for(
+                self.cliente.embeddings({"model": self.modelo, "input": texto}, timeout=self.timeout), self.timeout
+            )
+            if status != 200:
+                raise RuntimeError(f"status {status}: {str(corpo)[:200]}")
+            vetor = np.asarray(corpo["embeddings"][0], dtype=np.float32)
+            norma = float(np.linalg.norm(vetor))
+            if not norma:
+                raise RuntimeError("vetor nulo")
+        except Exception as e:
+            self.erros += 1
+            self._suspenso_ate = time.monotonic() + self.pausa_erro
+            metricas.CACHE_SEMANTICO.incrementar(resultado="erro")
+            print(f"Cache semântico suspenso por {self.pausa_erro:.0f}s (embeddings com {self.modelo}): {str(e) or type(e).__name__}")
+            return None
+        self._tempos_embedding.append(time.perf_counter() - inicio)
+        return vetor / norma
+
+    # Resposta de uma pergunta parecida do mesmo escopo: (resposta ou None, vetor da pergunta). O vetor
+    # volta mesmo sem acerto, para guardar a resposta gerada sem calcular o embedding de novo
+    async def buscar(self, pergunta, escopo):
+        if not self._disponivel(pergunta):
+            self.ignoradas += 1
+            return None, None
+        vetor = await self.vetorizar(pergunta)
+        if vetor is None:
+            return None, None
+        inicio = time.perf_counter()
+        agora = time.time()
+        indice = self._indices.get(escopo)
+        if indice is not None:
+            self._indices.move_to_end(escopo)
+        linha, similaridade = (None, 0.0) if indice is None or indice.dimensao != len(vetor) else indice.buscar(vetor, self.ttl, agora)
+        self._tempos_busca.append(time.perf_counter() - inicio)
+        if linha is not None:
+            self._similaridades.append(similaridade)
+            metricas.SIMILARIDADE_CACHE.observar(similaridade)
+        if linha is not None and similaridade >= self.limiar:
+            original, resposta = indice.obter(linha, agora)
+            self.hits += 1
+            metricas.CACHE_SEMANTICO.incrementar(resultado="hit")
+            print(f"Cache semântico: similaridade {similaridade:.3f} com {original[:80]!r}")
+            return resposta, vetor
+        self.misses += 1
+        metricas.CACHE_SEMANTICO.incrementar(resultado="miss")
+        return None, vetor
+
+    def guardar(self, vetor, pergunta, resposta, escopo):
+        if vetor is None or not resposta:
+            return
+        agora = time.time()
+        indice = self._indices.get(escopo)
+        if indice is None or indice.dimensao != len(vetor):
+            # Modelo de embedding trocado (outra dimensão): o índice antigo do escopo é descartado
+            indice = self._indices[escopo] = IndiceVetorial(self.capacidade, len(vetor))
+            while len(self._indices) > self.max_escopos:
+                self._indices.popitem(last=False)
+        # Pergunta praticamente igual a uma já guardada: substitui a entrada em vez de duplicar
+        linha, similaridade = indice.buscar(vetor, self.ttl, agora)
+        indice.guardar(vetor, pergunta, resposta, agora, self.ttl, linha if similaridade >= 0.995 else None)
+
+    def invalidar(self):
+        removidos = sum(indice.tamanho for indice in self._indices.values())
+        self._indices.clear()
+        return removidos
+
+    def estatisticas(self):
+        consultas = self.hits + self.misses
+        similaridades = sorted(self._similaridades)
+
+        def percentil(valores, fracao):
+            return round(valores[min(int(len(valores) * fracao), len(valores) - 1)], 4) if valores else None
+
+        return {
+            "ativo": self.ativo,
+            "modelo": self.modelo,
+            "limiar": self.limiar,
+            "escopos": len(self._indices),
+            "max_escopos": self.max_escopos,
+            "entradas": sum(indice.tamanho for indice in self._indices.values()),
+            "capacidade_por_escopo": self.capacidade,
+            "bytes": sum(indice.bytes() for indice in self._indices.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "erros": self.erros,
+            "ignoradas": self.ignoradas,
+            "taxa_acerto": round(self.hits / consultas, 4) if consultas else 0.0,
+            "suspenso": time.monotonic() < self._suspenso_ate,
+            # Maior similaridade encontrada em cada consulta (ajuda a calibrar o limiar)
+            "similaridade": {
+                "media": round(statistics.fmean(similaridades), 4) if similaridades else None,
+                "p50": percentil(similaridades, 0.5),
+                "p90": percentil(similaridades, 0.9),
+                "acima_do_limiar": sum(s >= self.limiar for s in similaridades),
+                "amostras": len(similaridades),
+            },
+            "tempo_embedding_ms": round(statistics.fmean(self._tempos_embedding) * 1000, 2) if self._tempos_embedding else None,
+            "tempo_busca_ms": round(statistics.fmean(self._tempos_busca) * 1000, 3) if self._tempos_busca else None,
+        }
@@ -0,0 +1,146 @@
+# cancelamento.py
+# Este módulo aplica prazos por requisição e detecta a desconexão do cliente. Quando o prazo vence ou
+# o cliente fecha a conexão, a geração em andamento é cancelada: o cancelamento fecha a resposta do
+# Ollama (que interrompe a geração no servidor) e a saída do contexto do agendador libera a vaga.
+# Cada cancelamento é registrado nas métricas com o motivo (prazo ou desconexão) e a rota.
+
+import asyncio
+import json
+
+from config_manager import obter_config
+from metricas import CANCELAMENTOS
+
+# Folga (segundos) do timeout da chamada ao Ollama em relação ao prazo: o prazo vence primeiro e é registrado
+FOLGA_TIMEOUT = 5
+
+
+# O prazo da requisição venceu antes da geração terminar
+class PrazoExcedido(Exception):
+    def __init__(self, prazo):
+        super().__init__(f"Prazo da requisição excedido ({prazo:g}s).")
+        self.prazo = prazo
+
+
+# O cliente fechou a conexão antes da resposta ficar pronta
+class ClienteDesconectado(Exception):
+    pass
+
+
+# Prazo da requisição em segundos: padrão da configuração (maior no modo Thinkkn e nas perguntas sobre
+# documentos), que o cliente pode trocar com o cabeçalho X-Prazo, sem passar do máximo configurado
+def ler_prazo(thinkkn_mode=False, cabecalho=None, documento=False):
+    if documento:
+        prazo = obter_config("PRAZOS", "PRAZO_DOCUMENTO", 900, float)
+    elif thinkkn_mode:
+        prazo = obter_config("PRAZOS", "PRAZO_THINKKN", 600, float)
+    else:
+        prazo = obter_config("PRAZOS", "PRAZO_PADRAO", 120, float)
+    maximo = obter_config("PRAZOS", "PRAZO_MAXIMO", 900, float)
+    if cabecalho:
+        try:
+            solicitado = float(cabecalho)
+            if solicitado > 0:
+                prazo = solicitado
+        except ValueError:
+            print(f"Cabeçalho X-Prazo inválido: {cabecalho!r}")
+    return min(prazo, maximo)
+
+
+# Timeout da chamada ao Ollama para uma requisição com este prazo
+def timeout_upstream(prazo):
+    return prazo + FOLGA_TIMEOUT
+
+
+def registrar_cancelamento(motivo, rota):
+    CANCELAMENTOS.incrementar(motivo=motivo, rota=rota)
+    print(f"Geração cancelada ({motivo}) em {rota}")
+
+
+# Termina quando o cliente desconecta (o corpo da requisição já foi lido pela rota)
+async def aguardar_desconexao(request):
+    while True:
+        mensagem = await request.receive()
+        if mensagem["type"] == "http.disconnect":
+            return
+
+
+def _vigiar(request):
+    if request is None:
+        return None
+    return asyncio.create_task(aguardar_desconexao(request))
+
+
+async def _encerrar(tarefa):
+    tarefa.cancel()
+    await asyncio.gather(tarefa, return_exceptions=True)
+
+
+# Executa a corrotina até terminar, vencer o prazo ou o cliente desconectar (nesses dois casos ela é cancelada)
+async def executar_com_prazo(corrotina, prazo, rota, request=None):
+    tarefa = asyncio.create_task(corrotina)
+    vigia = _vigiar(request)
+    try:
+        feitas, _ = await asyncio.wait(
+            [t for t in (tarefa, vigia) if t is not None], timeout=prazo, return_when=asyncio.FIRST_COMPLETED
+        )
+        if tarefa in feitas:
+            return tarefa.result()
+        await _encerrar(tarefa)
+        if vigia is not None and vigia in feitas:
+            registrar_cancelamento("desconexao", rota)
+            raise ClienteDesconectado()
+        registrar_cancelamento("prazo", rota)
+        raise PrazoExcedido(prazo)
+    except asyncio.CancelledError:
+        # A própria requisição foi cancelada (ex.: shutdown): cancelar também a geração
+        await _encerrar(tarefa)
+        raise
+    finally:
+        if vigia is not None:
+            await _encerrar(vigia)
+
+
+# Envolve um gerador de streaming com o prazo da requisição e a detecção de desconexão.
+# Ao vencer o prazo, envia um frame de erro e fecha o gerador (cancelando a geração no Ollama).
+async def limitar_prazo(gerador, prazo, rota, request=None):
+    loop = asyncio.get_running_loop()
+    limite = loop.time() + prazo
+    vigia = _vigiar(request)
+    proximo = None
+    concluido = False
+    try:
+        while True:
+            proximo = asyncio.ensure_future(gerador.__anext__())
+            feitas, _ = await asyncio.wait(
+                [t for t in (proximo, vigia) if t is not None],
+                timeout=max(limite - loop.time(), 0),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if proximo in feitas:
+                try:
+                    linha = proximo.result()
+                except StopAsyncIteration:
+                    concluido = True
+                    return
+                yield linha
+                continue
+            await _encerrar(proximo)
+            concluido = True
+            if vigia is not None and vigia in feitas:
+                registrar_cancelamento("desconexao", rota)
+                return
+            registrar_cancelamento("prazo", rota)
+            yield json.dumps({"error": str(PrazoExcedido(prazo)), "deadline": prazo}) + "\n"
+            return
+    except (asyncio.CancelledError, GeneratorExit):
+        # O servidor cancelou o streaming porque o cliente desconectou
+        if not concluido:
+            registrar_cancelamento("desconexao", rota)
+        raise
+    finally:
+        # O gerador não pode ser fechado enquanto um __anext__ ainda roda em outra tarefa
+        if proximo is not None and not proximo.done():
+            await _encerrar(proximo)
+        if vigia is not None:
+            await _encerrar(vigia)
+        await gerador.aclose()
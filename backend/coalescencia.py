@@ -0,0 +1,93 @@
+# coalescencia.py
+# Este módulo junta requisições idênticas que chegam enquanto uma geração ainda está em andamento
+# (single-flight): a primeira conduz um único streaming do Ollama e as demais assinam esse streaming,
+# recebendo os frames já produzidos e depois acompanhando ao vivo.
+
+import asyncio
+
+
+# Normaliza o texto usado na chave de coalescência (espaços e maiúsculas não mudam a pergunta)
+def normalizar_texto(texto):
+    return " ".join(texto.split()).casefold()
+
+
+class GeracaoCompartilhada:
+    def __init__(self, chave, gerador, ao_terminar):
+        self.chave = chave
+        self.frames = []
+        self.concluida = False
+        self.assinantes = 0
+        self._novo_frame = asyncio.Event()
+        self._ao_terminar = ao_terminar
+        self._tarefa = asyncio.create_task(self._conduzir(gerador))
+
+    async def _conduzir(self, gerador):
+        try:
+            async for frame in gerador:
+                self.frames.append(frame)
+                self._avisar()
+        except asyncio.CancelledError:
+            print(f"Geração compartilhada cancelada (sem assinantes): {self.chave[:12]}")
+        except Exception as e:
+            print(f"Erro na geração compartilhada: {str(e)}")
+        finally:
+            await gerador.aclose()
+            self.concluida = True
+            self._avisar()
+            self._ao_terminar(self)
+
+    def _avisar(self):
+        evento, self._novo_frame = self._novo_frame, asyncio.Event()
+        evento.set()
+
+    async def assinar(self):
+        self.assinantes += 1
+        indice = 0
+        try:
+            while True:
+                evento = self._novo_frame
+                while indice < len(self.frames):
+                    yield self.frames[indice]
+                    indice += 1
+                if self.concluida:
+                    return
+                await evento.wait()
+        finally:
+            self.assinantes -= 1
+            # Só cancela a geração quando o último assinante desiste
+            if self.assinantes == 0 and not self.concluida:
+                self._tarefa.cancel()
+
+
+class Coalescedor:
+    def __init__(self):
+        self._em_andamento = {}
+        self.geracoes = 0
+        self.coalescidas = 0
+
+    def em_andamento(self, chave):
+        return chave in self._em_andamento
+
+    # Retorna um gerador de frames: reaproveita a geração em andamento ou inicia uma nova com criar_gerador()
+    def assinar(self, chave, criar_gerador):
+        geracao = self._em_andamento.get(chave)
+        if geracao is None:
+            self.geracoes += 1
+            geracao = GeracaoCompartilhada(chave, criar_gerador(), self._remover)
+            self._em_andamento[chave] = geracao
+        else:
+            self.coalescidas += 1
+            print(f"Requisição coalescida com geração em andamento ({geracao.assinantes} assinantes)")
+        return geracao.assinar()
+
+    def estatisticas(self):
+        return {
+            "em_andamento": len(self._em_andamento),
+            "assinantes": sum(g.assinantes for g in self._em_andamento.values()),
+            "geracoes": self.geracoes,
+            "coalescidas": self.coalescidas,
+        }
+
+    def _remover(self, geracao):
+        if self._em_andamento.get(geracao.chave) is geracao:
+            del self._em_andamento[geracao.chave]
@@ -5,9 +5,52 @@
 import configparser
 import os
 
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
+
+_config_cache = None
+
 # Função de exemplo para carregar configurações
 
 def carregar_configuracoes():
-    config = configparser.ConfigParser()
-    config.read('config.ini')
-    return config 
\ No newline at end of file
+    config = configparser.ConfigParser(inline_comment_prefixes=('#', ';'))
+    config.read(['config.ini', CONFIG_PATH])
+    return config
+
+# Função para obter uma configuração individual
+# Variáveis de ambiente (ex.: OLLAMA_POOL_LIMITE) têm prioridade sobre o config.ini
+
+def obter_config(secao, chave, padrao=None, tipo=str):
+    global _config_cache
+
+    valor = os.getenv(chave.upper())
+    if valor is None:
+        if _config_cache is None:
+            _config_cache = carregar_configuracoes()
+        valor = _config_cache.get(secao, chave.lower(), fallback=None)
+    if valor is None or valor == '':
+        return padrao
+
+    try:
+        if tipo is bool:
+            return str(valor).strip().lower() in ('1', 'true', 'sim', 'yes', 'on')
+        return tipo(valor)
+    except (TypeError, ValueError):
+        print(f"Aviso: valor inválido para {chave} ({valor!r}). Usando padrão: {padrao}")
+        return padrao
+
+# Número de workers do servidor. O lançador (servidor.py) exporta GPTPOL_WORKERS para os processos
+# que ele inicia; um uvicorn avulso roda como worker único
+
+def workers_servidor():
+    try:
+        return max(int(os.getenv("GPTPOL_WORKERS", "1")), 1)
+    except ValueError:
+        return 1
+
+# Parte de um limite global (gerações simultâneas no Ollama, processos de extração, memória de cache)
+# que cabe a cada worker, para que a soma dos workers respeite o valor configurado. Arredonda para baixo;
+# o mínimo de 1 só ultrapassa o total com mais workers do que o limite, o que o lançador (servidor.py)
+# não permite para as gerações simultâneas
+
+def cota_por_worker(total):
+    return max(1, total // workers_servidor())
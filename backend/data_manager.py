@@ -1,11 +1,194 @@
 # data_manager.py
 # Este módulo gerencia o armazenamento e processamento de dados no banco de dados SQLite.
+# As conexões são reaproveitadas por um pool compartilhado (modo WAL: leituras não bloqueiam a escrita).
+# Os inquéritos usam o engine SQLAlchemy compartilhado de models.py: gravação em lotes (upsert pelo número)
+# e consultas por prazo apoiadas nos índices de data_vencimento/data_criacao.
 
 # Importar bibliotecas necessárias
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
-# Função de exemplo para conectar ao banco de dados
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from config_manager import obter_config
+from models import Inquerito, obter_engine, caminho_banco
+
+
+# Ajustes aplicados a toda conexão nova com o banco
+def _configurar_conexao(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+# Pool de conexões SQLite compartilhado entre as threads de trabalho (asyncio.to_thread)
+class PoolConexoes:
+    def __init__(self, caminho=None, tamanho=None, timeout=None):
+        # Sem caminho, usa o banco da aplicação (models.caminho_banco), resolvido na primeira conexão
+        self._caminho = caminho
+        self.tamanho = tamanho or obter_config("DATABASE", "DB_POOL_TAMANHO", 4, int)
+        # Espera (segundos) por um lock de escrita antes de falhar com "database is locked"
+        self.timeout = timeout or obter_config("DATABASE", "DB_TIMEOUT", 10, float)
+        self._livres = queue.LifoQueue()
+        self._criadas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def caminho(self):
+        if self._caminho is None:
+            self._caminho = caminho_banco()
+        return self._caminho
+
+    def _nova_conexao(self):
+        conn = sqlite3.connect(self.caminho, timeout=self.timeout, check_same_thread=False)
+        return _configurar_conexao(conn)
+
+    # Empresta uma conexão do pool; a transação é confirmada ao sair (ou desfeita em caso de erro)
+    @contextmanager
+    def conexao(self):
+        try:
+            conn = self._livres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                criar = self._criadas < self.tamanho
+                if criar:
+                    self._criadas += 1
+            if criar:
+                try:
+                    conn = self._nova_conexao()
+                except Exception:
+                    with self._lock:
+                        self._criadas -= 1
+                    raise
+            else:
+                conn = self._livres.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._livres.put(conn)
+
+    def fechar(self):
+        while True:
+            try:
+                conn = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._criadas -= 1
+
+
+pool_conexoes = PoolConexoes()
+
+# Função de exemplo para conectar ao banco de dados (conexão avulsa; prefira pool_conexoes.conexao())
 
 def conectar_banco_dados():
-    conn = sqlite3.connect('inqueritos.db')
-    return conn 
\ No newline at end of file
+    return _configurar_conexao(sqlite3.connect(pool_conexoes.caminho))
+
+# Função para listar (numero, descricao) de todos os inquéritos cadastrados
+
+def listar_inqueritos():
+    try:
+        with pool_conexoes.conexao() as conn:
+            return conn.execute('SELECT numero, descricao FROM inqueritos').fetchall()
+    except sqlite3.OperationalError:
+        # Banco ainda sem a tabela de inquéritos
+        return []
+
+COLUNAS_INQUERITO = ("numero", "descricao", "data_criacao", "data_vencimento")
+
+def _converter_data(valor):
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    return datetime.fromisoformat(str(valor))
+
+def _normalizar_inquerito(registro):
+    if not registro.get("numero"):
+        raise ValueError("Inquérito sem número")
+    return {
+        "numero": str(registro["numero"]).strip(),
+        "descricao": registro.get("descricao"),
+        "data_criacao": _converter_data(registro.get("data_criacao")),
+        "data_vencimento": _converter_data(registro.get("data_vencimento")),
+    }
+
+# Grava inquéritos em lotes (cada lote em uma única transação): insere os novos e atualiza os existentes
+# pelo número. Linhas sem mudança não são regravadas. Devolve quantos registros foram processados.
+
+def salvar_inqueritos(registros, tamanho_lote=None):
+    tamanho_lote = tamanho_lote or obter_config("DATABASE", "DB_TAMANHO_LOTE", 1000, int)
+    inserir = insert(Inquerito)
+    novos = inserir.excluded
+    comando = inserir.on_conflict_do_update(
+        index_elements=[Inquerito.numero],
+        set_={coluna: getattr(novos, coluna) for coluna in COLUNAS_INQUERITO[1:]},
+        where=(
+            Inquerito.descricao.is_distinct_from(novos.descricao)
+            | Inquerito.data_criacao.is_distinct_from(novos.data_criacao)
+            | Inquerito.data_vencimento.is_distinct_from(novos.data_vencimento)
+        ),
+    )
+    engine = obter_engine()
+    total = 0
+    lote = {}
+    for registro in registros:
+        registro = _normalizar_inquerito(registro)
+        # Número repetido no mesmo lote: vale o último
+        lote[registro["numero"]] = registro
+        if len(lote) >= tamanho_lote:
+            with engine.begin() as conn:
+                conn.execute(comando, list(lote.values()))
+            total += len(lote)
+            lote = {}
+    if lote:
+        with engine.begin() as conn:
+            conn.execute(comando, list(lote.values()))
+        total += len(lote)
+    return total
+
+def _consultar_inqueritos(condicoes, ordem, limite=None):
+    consulta = select(*(getattr(Inquerito, coluna) for coluna in COLUNAS_INQUERITO)).where(*condicoes).order_by(ordem)
+    if limite:
+        consulta = consulta.limit(limite)
+    with obter_engine().connect() as conn:
+        return [dict(linha._mapping) for linha in conn.execute(consulta)]
+
+# Inquéritos que vencem nos próximos "dias" dias (a partir de "referencia"), do prazo mais próximo ao mais distante
+
+def inqueritos_vencendo(dias, referencia=None, limite=None):
+    inicio = referencia or datetime.now()
+    fim = inicio + timedelta(days=dias)
+    return _consultar_inqueritos(
+        (Inquerito.data_vencimento >= inicio, Inquerito.data_vencimento < fim),
+        Inquerito.data_vencimento, limite
+    )
+
+# Inquéritos com prazo já vencido (do mais antigo ao mais recente)
+
+def inqueritos_vencidos(referencia=None, limite=None):
+    return _consultar_inqueritos(
+        (Inquerito.data_vencimento < (referencia or datetime.now()),),
+        Inquerito.data_vencimento, limite
+    )
+
+# Inquéritos criados no período [inicio, fim)
+
+def inqueritos_criados_entre(inicio, fim, limite=None):
+    return _consultar_inqueritos(
+        (Inquerito.data_criacao >= inicio, Inquerito.data_criacao < fim),
+        Inquerito.data_criacao, limite
+    )
+
+# Inquéritos pelos números (todos, se numeros=None), na ordem do número
+
+def obter_inqueritos(numeros=None, limite=None):
+    condicoes = ()
+    if numeros is not None:
+        condicoes = (Inquerito.numero.in_([str(numero).strip() for numero in numeros]),)
+    return _consultar_inqueritos(condicoes, Inquerito.numero, limite)
@@ -0,0 +1,331 @@
+# diagnostico.py
+# Este módulo mostra onde o event loop está perdendo tempo em produção:
+# - MonitorLoop mede o atraso do loop (quanto um sleep curto demora além do previsto) e, quando o loop fica
+#   travado, uma thread de vigia captura a pilha do que está bloqueando (chamada síncrona de rede, parse de
+#   arquivo, I/O de disco...) enquanto o bloqueio ainda acontece.
+# - Perfis sob demanda do worker em execução: por amostragem (pilhas de todas as threads a cada poucos ms,
+#   custo baixo) ou cProfile (todas as chamadas do event loop, custo alto) por um tempo limitado.
+# - TempoRotasMiddleware mede cada requisição por rota (tempo até o primeiro byte e duração total).
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+import metricas
+from config_manager import obter_config
+
+DIRETORIO_BACKEND = os.path.dirname(os.path.abspath(__file__))
+
+
+# Ordenações aceitas no perfil cProfile
+ORDENACOES_CPROFILE = ("cumulative", "tottime", "calls")
+
+
+# Já existe um perfil em andamento neste worker
+class PerfilEmAndamento(Exception):
+    pass
+
+
+# Arquivos do backend aparecem relativos ao diretório dele; os de bibliotecas, com o caminho completo
+def nome_arquivo(arquivo):
+    return arquivo[len(DIRETORIO_BACKEND) + 1:] if arquivo.startswith(DIRETORIO_BACKEND + os.sep) else arquivo
+
+
+def descrever_quadro(quadro):
+    return f"{nome_arquivo(quadro.f_code.co_filename)}:{quadro.f_lineno} {quadro.f_code.co_name}"
+
+
+# Pilha de um quadro como lista de "arquivo:linha função", do mais externo ao mais interno (com limite,
+# só os quadros mais internos). Percorre f_back direto, sem ler o código-fonte: é chamada a cada amostra
+def resumir_pilha(quadro, limite=None):
+    pilha = []
+    while quadro is not None and (limite is None or len(pilha) < limite):
+        pilha.append(descrever_quadro(quadro))
+        quadro = quadro.f_back
+    return pilha[::-1]
+
+
+# Quadro mais interno que pertence ao código do backend (a linha do nosso código que chamou o bloqueio)
+def origem_pilha(quadro):
+    while quadro is not None:
+        arquivo = quadro.f_code.co_filename
+        if arquivo.startswith(DIRETORIO_BACKEND + os.sep) and arquivo != __file__:
+            return descrever_quadro(quadro)
+        quadro = quadro.f_back
+    return None
+
+
+class MonitorLoop:
+    def __init__(self, intervalo=None, limiar=None):
+        self.ativo = obter_config("DIAGNOSTICO", "DIAGNOSTICO_ATIVO", True, bool)
+        # Período da medição (s): o loop deveria acordar a cada intervalo
+        self.intervalo = intervalo or obter_config("DIAGNOSTICO", "DIAGNOSTICO_INTERVALO", 0.1, float)
+        # Atraso (s) a partir do qual o loop é considerado travado e a pilha é capturada
+        self.limiar = limiar or obter_config("DIAGNOSTICO", "DIAGNOSTICO_LIMIAR_TRAVAMENTO", 0.25, float)
+        self.quadros_pilha = obter_config("DIAGNOSTICO", "DIAGNOSTICO_QUADROS_PILHA", 30, int)
+        self._travamentos = deque(maxlen=obter_config("DIAGNOSTICO", "DIAGNOSTICO_MAX_TRAVAMENTOS", 50, int))
+        self._atrasos = deque(maxlen=1000)
+        # Tempo total travado por linha do backend que estava bloqueando
+        self._origens = Counter()
+        self._ocorrencias = Counter()
+        self.total_travamentos = 0
+        self.maior_atraso = 0.0
+        self._tarefa = None
+        self._vigia = None
+        self._parar = threading.Event()
+        self._thread_loop = None
+        self._ultima_batida = 0.0
+        # (batida, pilha, origem) capturada pela vigia durante o travamento em curso
+        self._captura = None
+
+    def iniciar(self):
+        if not self.ativo or self._tarefa is not None:
+            return
+        self._thread_loop = threading.get_ident()
+        self._ultima_batida = time.monotonic()
+        self._parar.clear()
+        self._tarefa = asyncio.create_task(self._medir())
+        self._vigia = threading.Thread(target=self._vigiar, name="vigia-event-loop", daemon=True)
+        self._vigia.start()
+        print(f"Monitor do event loop: intervalo {self.intervalo * 1000:.0f} ms, travamento a partir de {self.limiar * 1000:.0f} ms")
+
+    async def encerrar(self):
+        self._parar.set()
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+        if self._vigia is not None:
+            await asyncio.to_thread(self._vigia.join, 1)
+            self._vigia = None
+
+    async def _medir(self):
+        while True:
+            batida = time.monotonic()
+            self._ultima_batida = batida
+            await asyncio.sleep(self.intervalo)
+            atraso = max(time.monotonic() - batida - self.intervalo, 0.0)
+            self._atrasos.append(atraso)
+            metricas.ATRASO_LOOP.observar(atraso)
+            if atraso >= self.limiar:
+                captura = self._captura
+                if captura is not None and captura[0] == batida:
+                    self._registrar(atraso, captura[1], captura[2])
+                else:
+                    # Bloqueio curto demais para a vigia ver (ou a vigia atrasou pelo GIL)
+                    self._registrar(atraso, None, None)
+            self._captura = None
+
+    # Thread de vigia: se o loop não volta a tempo, o que está na pilha dele é o que está bloqueando
+    def _vigiar(self):
+        while not self._parar.wait(self.limiar / 2):
+            batida = self._ultima_batida
+            if self._captura is not None and self._captura[0] == batida:
+                continue
+            if time.monotonic() - batida < self.intervalo + self.limiar:
+                continue
+            quadro = sys._current_frames().get(self._thread_loop)
+            if quadro is not None:
+                self._captura = (batida, resumir_pilha(quadro, self.quadros_pilha), origem_pilha(quadro))
+
+    def _registrar(self, atraso, pilha, origem):
+        self.total_travamentos += 1
+        self.maior_atraso = max(self.maior_atraso, atraso)
+        metricas.TRAVAMENTOS_LOOP.incrementar()
+        chave = origem or "desconhecida"
+        self._origens[chave] += atraso
+        self._ocorrencias[chave] += 1
+        self._travamentos.append({
+            "momento": time.time(),
+            "duracao_ms": round(atraso * 1000, 1),
+            "origem": origem,
+            "pilha": pilha,
+        })
+        print(f"Event loop travado por {atraso * 1000:.0f} ms" + (f" em {origem}" if origem else ""))
+
+    def travamentos(self, limite=20):
+        return list(self._travamentos)[-limite:][::-1]
+
+    def estatisticas(self):
+        atrasos = sorted(self._atrasos)
+
+        def percentil(fracao):
+            return round(atrasos[min(int(len(atrasos) * fracao), len(atrasos) - 1)] * 1000, 2) if atrasos else None
+
+        return {
+            "ativo": self._tarefa is not None,
+            "intervalo_ms": self.intervalo * 1000,
+            "limiar_travamento_ms": self.limiar * 1000,
+            "atraso_ms": {"p50": percentil(0.5), "p99": percentil(0.99), "max": percentil(1.0), "amostras": len(atrasos)},
+            "travamentos": self.total_travamentos,
+            "maior_travamento_ms": round(self.maior_atraso * 1000, 1),
+            # Linhas do backend que mais tempo bloquearam o loop desde o início do worker
+            "origens": [
+                {"origem": origem, "travamentos": self._ocorrencias[origem], "total_ms": round(total * 1000, 1)}
+                for origem, total in self._origens.most_common(10)
+            ],
+        }
+
+
+class Perfilador:
+    def __init__(self):
+        self.duracao_maxima = obter_config("DIAGNOSTICO", "DIAGNOSTICO_PERFIL_DURACAO_MAXIMA", 60, float)
+        self._em_andamento = False
+
+    def _reservar(self, duracao):
+        if self._em_andamento:
+            raise PerfilEmAndamento("Já existe um perfil em andamento neste worker.")
+        self._em_andamento = True
+        return min(max(duracao, 0.1), self.duracao_maxima)
+
+    # Amostragem: pilhas das threads a cada intervalo, numa thread separada (o loop segue atendendo)
+    async def amostrar(self, duracao, intervalo=0.005, todas_threads=False, limite=30):
+        duracao = self._reservar(duracao)
+        try:
+            thread_loop = threading.get_ident()
+            return await asyncio.to_thread(self._amostrar, duracao, intervalo, thread_loop, todas_threads, limite)
+        finally:
+            self._em_andamento = False
+
+    def _amostrar(self, duracao, intervalo, thread_loop, todas_threads, limite):
+        propria = threading.get_ident()
+        nomes = {thread.ident: thread.name for thread in threading.enumerate()}
+        pilhas = Counter()
+        proprias = Counter()
+        inclusivas = Counter()
+        amostras = 0
+        fim = time.monotonic() + duracao
+        while time.monotonic() < fim:
+            for ident, quadro in sys._current_frames().items():
+                if ident == propria or (not todas_threads and ident != thread_loop):
+                    continue
+                pilha = tuple(resumir_pilha(quadro))
+                pilhas[(nomes.get(ident, str(ident)),) + pilha] += 1
+                proprias[pilha[-1]] += 1
+                for funcao in set(pilha):
+                    inclusivas[funcao] += 1
+            amostras += 1
+            time.sleep(intervalo)
+        total = sum(proprias.values()) or 1
+        return {
+            "modo": "amostragem",
+            "duracao_s": duracao,
+            "amostras": amostras,
+            "intervalo_ms": intervalo * 1000,
+            # Onde o tempo foi gasto (quadro mais interno) e por quem passou (qualquer ponto da pilha)
+            "funcoes_proprias": [
+                {"funcao": funcao, "amostras": n, "percentual": round(100 * n / total, 1)}
+                for funcao, n in proprias.most_common(limite)
+            ],
+            "funcoes_inclusivas": [
+                {"funcao": funcao, "amostras": n, "percentual": round(100 * n / total, 1)}
+                for funcao, n in inclusivas.most_common(limite)
+            ],
+            # Formato "collapsed" (flamegraph.pl, speedscope): "thread;externo;...;interno contagem"
+            "pilhas_colapsadas": "\n".join(f"{';'.join(pilha)} {n}" for pilha, n in pilhas.most_common()),
+        }
+
+    # cProfile no event loop: registra todas as chamadas feitas na thread do loop durante a janela
+    async def perfil_cprofile(self, duracao, ordenar="cumulative", limite=30):
+        duracao = self._reservar(duracao)
+        try:
+            perfil = cProfile.Profile()
+            perfil.enable()
+            try:
+                await asyncio.sleep(duracao)
+            finally:
+                perfil.disable()
+        finally:
+            self._em_andamento = False
+        saida = io.StringIO()
+        estatisticas = pstats.Stats(perfil, stream=saida).sort_stats(ordenar)
+        estatisticas.print_stats(limite)
+        funcoes = []
+        for (arquivo, linha, nome) in estatisticas.fcn_list[:limite]:
+            primitivas, chamadas, tempo_proprio, tempo_total, _ = estatisticas.stats[(arquivo, linha, nome)]
+            funcoes.append({
+                "funcao": f"{nome_arquivo(arquivo)}:{linha} {nome}",
+                "chamadas": chamadas,
+                "tempo_proprio_ms": round(tempo_proprio * 1000, 2),
+                "tempo_total_ms": round(tempo_total * 1000, 2),
+            })
+        return {
+            "modo": "cprofile",
+            "duracao_s": duracao,
+            "ordenacao": ordenar,
+            "funcoes": funcoes,
+            "texto": saida.getvalue(),
+        }
+
+
+# Tempo de cada requisição por rota (modelo da rota, não o caminho, para não explodir os rótulos)
+class TemposRotas:
+    def __init__(self, amostras=500):
+        self._amostras = amostras
+        self._rotas = {}
+
+    def registrar(self, metodo, rota, status, duracao, primeiro_byte):
+        metricas.DURACAO_REQUISICAO.observar(duracao, metodo=metodo, rota=rota, status=str(status))
+        if primeiro_byte is not None:
+            metricas.PRIMEIRO_BYTE_REQUISICAO.observar(primeiro_byte, metodo=metodo, rota=rota)
+        dados = self._rotas.get((metodo, rota))
+        if dados is None:
+            dados = self._rotas[(metodo, rota)] = {"requisicoes": 0, "erros": 0, "duracoes": deque(maxlen=self._amostras)}
+        dados["requisicoes"] += 1
+        dados["erros"] += status >= 500
+        dados["duracoes"].append(duracao)
+
+    def estatisticas(self):
+        resultado = []
+        for (metodo, rota), dados in self._rotas.items():
+            duracoes = sorted(dados["duracoes"])
+            resultado.append({
+                "rota": f"{metodo} {rota}",
+                "requisicoes": dados["requisicoes"],
+                "erros": dados["erros"],
+                "p50_ms": round(duracoes[len(duracoes) // 2] * 1000, 1),
+                "p95_ms": round(duracoes[min(int(len(duracoes) * 0.95), len(duracoes) - 1)] * 1000, 1),
+                "max_ms": round(duracoes[-1] * 1000, 1),
+            })
+        return sorted(resultado, key=lambda rota: -rota["p95_ms"])
+
+
+class TempoRotasMiddleware:
+    def __init__(self, app, tempos):
+        self.app = app
+        self.tempos = tempos
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        status = 500
+        primeiro_byte = None
+
+        async def send_medido(mensagem):
+            nonlocal status, primeiro_byte
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+                primeiro_byte = time.perf_counter() - inicio
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, send_medido)
+        finally:
+            # O roteador do Starlette grava a rota encontrada no próprio scope
+            rota = scope.get("route")
+            self.tempos.registrar(
+                scope["method"], getattr(rota, "path", "nao_encontrada"), status,
+                time.perf_counter() - inicio, primeiro_byte
+            )
@@ -0,0 +1,181 @@
+# documentos.py
+# Este módulo responde perguntas sobre documentos longos em etapas (map-reduce):
+# o texto é dividido em trechos com sobreposição, cada trecho é analisado em paralelo (map, com
+# concorrência limitada), os resultados parciais são combinados (reduce) e a resposta final é
+# enviada por streaming NDJSON, junto com eventos de progresso. O número de trechos por documento é
+# limitado, e as anotações que ainda passam do limite do reduce depois das rodadas de condensação
+# são cortadas.
+
+import asyncio
+import re
+
+from config_manager import obter_config
+from orcamento_tokens import CARACTERES_POR_TOKEN, cortar_texto, estimar_tokens
+from relay_ndjson import frame_ndjson
+
+RESPOSTA_SEM_RELEVANCIA = "NADA RELEVANTE"
+
+# Rodadas de condensação das anotações antes do reduce final
+MAX_RODADAS_REDUCAO = 3
+
+SYSTEM_PROMPT_MAP = f"""Você é um assistente policial e jurídico brasileiro especializado no sistema legal do Brasil.
+Você receberá um trecho de um documento e uma pergunta. Extraia do trecho, de forma objetiva, apenas os fatos,
+nomes, datas, valores e fundamentos que ajudam a responder a pergunta. Não responda a pergunta ainda.
+Se o trecho não tiver nada relevante, responda apenas: {RESPOSTA_SEM_RELEVANCIA}"""
+
+SYSTEM_PROMPT_REDUCE = """Você é um assistente policial e jurídico brasileiro especializado no sistema legal do Brasil.
+Você receberá anotações extraídas de partes de um documento longo, na ordem em que aparecem no documento.
+Com base apenas nessas anotações, responda a pergunta de forma clara, direta e em português correto."""
+
+
+# Remove o raciocínio <think>...</think> das respostas intermediárias
+def remover_raciocinio(texto):
+    return re.sub(r"<think>.*?</think>", "", texto, flags=re.DOTALL).replace("<think>", "").strip()
+
+
+# Divide o texto em trechos de até tokens_por_trecho, com sobreposição entre trechos vizinhos.
+# O corte é feito preferencialmente em quebra de parágrafo, de linha ou espaço.
+def dividir_em_trechos(texto, tokens_por_trecho, sobreposicao):
+    tamanho = tokens_por_trecho * CARACTERES_POR_TOKEN
+    recuo = min(sobreposicao * CARACTERES_POR_TOKEN, tamanho // 2)
+    trechos = []
+    inicio = 0
+    while inicio < len(texto):
+        fim = min(inicio + tamanho, len(texto))
+        if fim < len(texto):
+            minimo = inicio + tamanho // 2
+            for separador in ("\n\n", "\n", " "):
+                corte = texto.rfind(separador, minimo, fim)
+                if corte > 0:
+                    fim = corte + len(separador)
+                    break
+        trecho = texto[inicio:fim].strip()
+        if trecho:
+            trechos.append(trecho)
+        if fim >= len(texto):
+            break
+        inicio = max(fim - recuo, inicio + 1)
+    return trechos
+
+
+# O documento geraria mais trechos do que o permitido ([DOCUMENTOS] documentos_max_trechos)
+class DocumentoGrandeDemais(Exception):
+    def __init__(self, trechos, maximo):
+        super().__init__(
+            f"Documento grande demais: {trechos} trechos (máximo {maximo}). Divida o documento ou envie só a parte relevante."
+        )
+        self.trechos = trechos
+        self.maximo = maximo
+
+
+def montar_prompt(system_prompt, conteudo):
+    return f"<|system|>\n{system_prompt}\n<|user|>\n{conteudo}\n<|assistant|>\n"
+
+
+class PipelineDocumento:
+    # gerar(prompt) -> texto da resposta (sem streaming)
+    # gerar_stream(prompt, thinkkn_mode) -> gerador assíncrono de frames NDJSON
+    def __init__(self, gerar, gerar_stream, tokens_por_trecho=None, sobreposicao=None, concorrencia=None, limite_reducao=None,
+                 max_trechos=None):
+        self.gerar = gerar
+        self.gerar_stream = gerar_stream
+        self.tokens_por_trecho = tokens_por_trecho or obter_config("DOCUMENTOS", "DOCUMENTOS_TOKENS_POR_TRECHO", 2500, int)
+        self.sobreposicao = sobreposicao if sobreposicao is not None else obter_config("DOCUMENTOS", "DOCUMENTOS_SOBREPOSICAO", 200, int)
+        self.concorrencia = concorrencia or obter_config("DOCUMENTOS", "DOCUMENTOS_CONCORRENCIA", 4, int)
+        # Tamanho máximo (em tokens) das anotações enviadas de uma vez para a etapa de reduce
+        self.limite_reducao = limite_reducao or obter_config("DOCUMENTOS", "DOCUMENTOS_LIMITE_REDUCAO", 2500, int)
+        # Cada trecho é uma geração na etapa de map: documentos maiores são recusados antes de começar
+        self.max_trechos = max_trechos or obter_config("DOCUMENTOS", "DOCUMENTOS_MAX_TRECHOS", 64, int)
+
+    # Trechos do documento; levanta DocumentoGrandeDemais acima de max_trechos
+    def dividir(self, texto):
+        trechos = dividir_em_trechos(texto, self.tokens_por_trecho, self.sobreposicao)
+        if len(trechos) > self.max_trechos:
+            raise DocumentoGrandeDemais(len(trechos), self.max_trechos)
+        return trechos
+
+    async def responder(self, pergunta, texto, thinkkn_mode=False, trechos=None):
+        if trechos is None:
+            trechos = self.dividir(texto)
+
+        # Documento curto: uma única geração com o texto inteiro
+        if len(trechos) <= 1:
+            conteudo = f"Documento:\n{texto}\n\nPergunta: {pergunta}"
+            async for frame in self.gerar_stream(montar_prompt(SYSTEM_PROMPT_REDUCE, conteudo), thinkkn_mode):
+                yield frame
+            return
+
+        yield frame_ndjson({"progress": {"etapa": "map", "concluidos": 0, "total": len(trechos)}})
+
+        anotacoes = [None] * len(trechos)
+        async for indice, resultado, erro in self._mapear(pergunta, trechos):
+            anotacoes[indice] = resultado
+            evento = {"etapa": "map", "concluidos": sum(a is not None for a in anotacoes), "total": len(trechos)}
+            if erro:
+                evento["erro"] = erro
+            yield frame_ndjson({"progress": evento})
+
+        relevantes = [a for a in anotacoes if a and RESPOSTA_SEM_RELEVANCIA not in a.upper()]
+        if not relevantes:
+            relevantes = ["Nenhum trecho do documento trouxe informação relevante para a pergunta."]
+
+        # Anotações longas demais para um único reduce são condensadas em rodadas adicionais
+        rodada = 1
+        while rodada <= MAX_RODADAS_REDUCAO and len(relevantes) > 1 and estimar_tokens("\n\n".join(relevantes)) > self.limite_reducao:
+            grupos = self._agrupar(relevantes)
+            yield frame_ndjson({"progress": {"etapa": "reduce", "rodada": rodada, "grupos": len(grupos)}})
+            condensados = [None] * len(grupos)
+            async for indice, resultado, _ in self._mapear(pergunta, grupos, condensar=True):
+                condensados[indice] = resultado
+            relevantes = [c for c in condensados if c]
+            rodada += 1
+
+        # Ainda acima do limite depois das rodadas: cada anotação é cortada na sua parte do limite
+        if relevantes and estimar_tokens("\n\n".join(relevantes)) > self.limite_reducao:
+            parte = max(self.limite_reducao // len(relevantes) - 8, 1)
+            relevantes = [cortar_texto(a, parte) for a in relevantes]
+            yield frame_ndjson({"progress": {"etapa": "reduce", "rodada": rodada, "cortado": True}})
+
+        yield frame_ndjson({"progress": {"etapa": "resposta"}})
+        anotacoes_formatadas = "\n\n".join(f"[Parte {i + 1}]\n{a}" for i, a in enumerate(relevantes))
+        conteudo = f"Anotações do documento:\n{anotacoes_formatadas}\n\nPergunta: {pergunta}"
+        async for frame in self.gerar_stream(montar_prompt(SYSTEM_PROMPT_REDUCE, conteudo), thinkkn_mode):
+            yield frame
+
+    # Executa a etapa de map com concorrência limitada, entregando os resultados conforme terminam
+    async def _mapear(self, pergunta, partes, condensar=False):
+        semaforo = asyncio.Semaphore(self.concorrencia)
+
+        async def processar(indice, parte):
+            async with semaforo:
+                if condensar:
+                    conteudo = f"Anotações:\n{parte}\n\nPergunta: {pergunta}\n\nCondense as anotações mantendo apenas o que ajuda a responder a pergunta."
+                else:
+                    conteudo = f"Trecho {indice + 1} de {len(partes)}:\n{parte}\n\nPergunta: {pergunta}"
+                try:
+                    resposta = await self.gerar(montar_prompt(SYSTEM_PROMPT_MAP, conteudo))
+                    return indice, remover_raciocinio(resposta), None
+                except Exception as e:
+                    print(f"Erro ao processar trecho {indice + 1}: {str(e)}")
+                    return indice, "", str(getattr(e, "detail", e))
+
+        tarefas = [asyncio.create_task(processar(i, parte)) for i, parte in enumerate(partes)]
+        try:
+            for tarefa in asyncio.as_completed(tarefas):
+                yield await tarefa
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+
+    def _agrupar(self, anotacoes):
+        grupos, atual, tokens = [], [], 0
+        for anotacao in anotacoes:
+            custo = estimar_tokens(anotacao)
+            if atual and tokens + custo > self.limite_reducao:
+                grupos.append("\n\n".join(atual))
+                atual, tokens = [], 0
+            atual.append(anotacao)
+            tokens += custo
+        if atual:
+            grupos.append("\n\n".join(atual))
+        return grupos
@@ -0,0 +1,333 @@
+# extracao.py
+# Este módulo extrai texto de PDF, DOCX, XLSX e TXT. A extração roda em um pool de processos,
+# fora do event loop da API, com timeout por tarefa. PDFs grandes são divididos em faixas de páginas
+# processadas em paralelo e juntadas na ordem original.
+
+import asyncio
+import importlib
+import importlib.util
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metricas
+from config_manager import obter_config, cota_por_worker
+
+# Bibliotecas para processar diferentes tipos de arquivos. Só a presença é verificada aqui: a importação
+# (centenas de ms) fica para o primeiro uso, e os processos do pool já sobem com elas carregadas
+BIBLIOTECAS = {"PyPDF2": "pypdf2", "docx": "python-docx", "openpyxl": "openpyxl"}
+LIBS_DISPONÍVEIS = all(importlib.util.find_spec(modulo) is not None for modulo in BIBLIOTECAS)
+if not LIBS_DISPONÍVEIS:
+    print("Aviso: Algumas bibliotecas para processamento de arquivos não estão instaladas.")
+    print("Para usar todas as funcionalidades, instale: pip install pypdf2 python-docx openpyxl")
+
+# Carrega as bibliotecas de extração
+def carregar_bibliotecas():
+    for modulo in BIBLIOTECAS:
+        importlib.import_module(modulo)
+
+# Inicializador dos processos do pool: informa o PID ao processo da API (que encerra os processos de um
+# pool trocado sem depender dos atributos internos do ProcessPoolExecutor) e carrega as bibliotecas
+def iniciar_processo(pids):
+    pids.put(os.getpid())
+    if LIBS_DISPONÍVEIS:
+        carregar_bibliotecas()
+
+TIPOS_PDF = ["application/pdf"]
+TIPOS_DOCX = ["application/msword", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]
+TIPOS_XLSX = ["application/vnd.ms-excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"]
+TIPOS_TEXTO = ["text/plain"]
+
+
+# Os extratores são geradores: produzem o texto em partes (uma página, um parágrafo, uma linha da planilha),
+# então o custo é linear no tamanho do documento e quem consome pode parar assim que tiver texto suficiente.
+
+# Texto de um PDF, página a página (faixa [inicio, fim) de páginas)
+def gerar_texto_pdf(arquivo, inicio=0, fim=None):
+    import PyPDF2
+    pdf_reader = PyPDF2.PdfReader(arquivo)
+    for pagina in range(inicio, len(pdf_reader.pages) if fim is None else fim):
+        yield (pdf_reader.pages[pagina].extract_text() or "") + "\n"
+
+# Texto de um DOCX, parágrafo a parágrafo
+def gerar_texto_docx(arquivo):
+    import docx
+    doc = docx.Document(arquivo)
+    for paragrafo in doc.paragraphs:
+        yield paragrafo.text + "\n"
+
+# Texto de um XLSX, linha a linha. O modo somente leitura do openpyxl lê a planilha em fluxo, sem montar
+# o workbook inteiro em memória (planilhas=None: todas, na ordem do arquivo)
+def gerar_texto_xlsx(arquivo, planilhas=None):
+    import openpyxl
+    workbook = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        for planilha in planilhas or workbook.sheetnames:
+            sheet = workbook[planilha]
+            yield f"Planilha: {planilha}\n"
+            for linha in sheet.iter_rows(values_only=True):
+                yield " | ".join([str(celula) if celula is not None else "" for celula in linha]) + "\n"
+            yield "\n"
+    finally:
+        # No modo somente leitura o arquivo fica aberto até close()
+        workbook.close()
+
+def gerar_texto(arquivo, tipo_arquivo):
+    if tipo_arquivo in TIPOS_PDF:
+        return gerar_texto_pdf(arquivo)
+    elif tipo_arquivo in TIPOS_DOCX:
+        return gerar_texto_docx(arquivo)
+    elif tipo_arquivo in TIPOS_XLSX:
+        return gerar_texto_xlsx(arquivo)
+    raise ValueError(f"Tipo de arquivo não suportado: {tipo_arquivo}")
+
+# Repassa as partes até completar max_caracteres (None = sem limite); a última parte é cortada e o
+# extrator é encerrado sem ler o resto do arquivo
+def limitar_texto(partes, max_caracteres=None):
+    if max_caracteres is None:
+        yield from partes
+        return
+    restantes = max_caracteres
+    try:
+        for parte in partes:
+            if len(parte) >= restantes:
+                if restantes:
+                    yield parte[:restantes]
+                return
+            restantes -= len(parte)
+            yield parte
+    finally:
+        if hasattr(partes, "close"):
+            partes.close()
+
+# Junta partes pequenas (linhas de planilha, parágrafos) em blocos de ~tamanho caracteres
+def agrupar_texto(partes, tamanho):
+    bloco = []
+    acumulado = 0
+    for parte in partes:
+        bloco.append(parte)
+        acumulado += len(parte)
+        if acumulado >= tamanho:
+            yield "".join(bloco)
+            bloco = []
+            acumulado = 0
+    if bloco:
+        yield "".join(bloco)
+
+# Função para extrair texto de um arquivo PDF
+def extrair_texto_pdf(arquivo, max_caracteres=None):
+    try:
+        return "".join(limitar_texto(gerar_texto_pdf(arquivo), max_caracteres))
+    except Exception as e:
+        print(f"Erro ao processar PDF: {e}")
+        return f"Erro ao processar PDF: {str(e)}"
+
+# Função para extrair texto de um arquivo DOCX
+def extrair_texto_docx(arquivo, max_caracteres=None):
+    try:
+        return "".join(limitar_texto(gerar_texto_docx(arquivo), max_caracteres))
+    except Exception as e:
+        print(f"Erro ao processar DOCX: {e}")
+        return f"Erro ao processar DOCX: {str(e)}"
+
+# Função para extrair texto de um arquivo XLSX
+def extrair_texto_xlsx(arquivo, max_caracteres=None):
+    try:
+        return "".join(limitar_texto(gerar_texto_xlsx(arquivo), max_caracteres))
+    except Exception as e:
+        print(f"Erro ao processar XLSX: {e}")
+        return f"Erro ao processar XLSX: {str(e)}"
+
+# Função para processar arquivos enviados
+def processar_arquivo(arquivo, tipo_arquivo, max_caracteres=None):
+    if tipo_arquivo in TIPOS_PDF:
+        return extrair_texto_pdf(arquivo, max_caracteres)
+    elif tipo_arquivo in TIPOS_DOCX:
+        return extrair_texto_docx(arquivo, max_caracteres)
+    elif tipo_arquivo in TIPOS_XLSX:
+        return extrair_texto_xlsx(arquivo, max_caracteres)
+    elif tipo_arquivo in TIPOS_TEXTO:
+        return arquivo.read().decode("utf-8")[:max_caracteres]
+    else:
+        return "Tipo de arquivo não suportado."
+
+# Extrai o texto de um arquivo salvo em disco (executado nos processos do pool)
+def extrair_arquivo(caminho, tipo_arquivo, max_caracteres=None):
+    if tipo_arquivo in TIPOS_TEXTO:
+        with open(caminho, "r", encoding="utf-8") as f:
+            return f.read(max_caracteres if max_caracteres is not None else -1)
+    with open(caminho, "rb") as f:
+        return processar_arquivo(f, tipo_arquivo, max_caracteres)
+
+# Conta as páginas de um PDF (executado nos processos do pool)
+def contar_paginas_pdf(caminho):
+    import PyPDF2
+    return len(PyPDF2.PdfReader(caminho).pages)
+
+# Extrai uma faixa de páginas [inicio, fim) de um PDF (executado nos processos do pool)
+def extrair_paginas_pdf(caminho, inicio, fim, max_caracteres=None):
+    try:
+        return "".join(limitar_texto(gerar_texto_pdf(caminho, inicio, fim), max_caracteres))
+    except Exception as e:
+        print(f"Erro ao processar PDF (páginas {inicio + 1}-{fim}): {e}")
+        return f"Erro ao processar PDF (páginas {inicio + 1}-{fim}): {str(e)}\n"
+
+# A extração passou do tempo limite configurado
+class TempoExtracaoExcedido(Exception):
+    pass
+
+
+class PoolExtracao:
+    def __init__(self, processos=None, timeout=None, paginas_por_tarefa=None):
+        # Com vários workers do servidor, os núcleos são divididos entre os pools de cada worker
+        self.processos = processos or cota_por_worker(obter_config("EXTRACAO", "EXTRACAO_PROCESSOS", os.cpu_count() or 2, int))
+        self.timeout = timeout or obter_config("EXTRACAO", "EXTRACAO_TIMEOUT", 120, float)
+        self.paginas_por_tarefa = paginas_por_tarefa or obter_config("EXTRACAO", "EXTRACAO_PAGINAS_POR_TAREFA", 40, int)
+        self._executor = None
+        # PIDs informados pelos processos do pool atual (ver iniciar_processo)
+        self._pids = None
+        self.reinicios = 0
+
+    def iniciar(self):
+        if self._executor is None:
+            # "spawn" evita herdar o estado do event loop e das threads do processo da API
+            contexto = multiprocessing.get_context("spawn")
+            self._pids = contexto.SimpleQueue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processos,
+                mp_context=contexto,
+                initializer=iniciar_processo,
+                initargs=(self._pids,),
+            )
+            print(f"Pool de extração iniciado com {self.processos} processos")
+
+    def encerrar(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            print("Pool de extração encerrado")
+
+    # Troca o pool por um novo e encerra os processos do antigo. Uma tarefa que passou do tempo limite
+    # continua rodando no processo do pool (run_in_executor não interrompe o processo), ocupando um núcleo
+    # e uma vaga do pool até terminar; encerrar os processos é a única forma de pará-la
+    def _reiniciar(self, executor, motivo):
+        if executor is None or self._executor is not executor:
+            return
+        fila = self._pids
+        pids = set()
+        while not fila.empty():
+            pids.add(fila.get())
+        fila.close()
+        self._executor = None
+        self.iniciar()
+        # Tarefas de outros uploads que estavam no pool antigo falham com BrokenProcessPool e são
+        # reenviadas ao pool novo por _executar
+        executor.shutdown(wait=False)
+        processos = 0
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                processos += 1
+            except OSError:
+                # O processo já terminou
+                pass
+        self.reinicios += 1
+        metricas.REINICIOS_EXTRACAO.incrementar(motivo=motivo)
+        print(f"Pool de extração recriado ({motivo}); {processos} processos encerrados")
+
+    async def _executar(self, funcao, *args):
+        if self._executor is None:
+            self.iniciar()
+        executor = self._executor
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, funcao, *args)
+        except BrokenProcessPool:
+            if self._executor is not executor:
+                # Pool trocado depois do tempo limite de outra extração: esta tarefa vai para o pool novo
+                return await self._executar(funcao, *args)
+            # Um processo morreu (ex.: falta de memória num arquivo enorme): recriar o pool para os próximos uploads
+            print("Pool de extração quebrado; recriando")
+            self.encerrar()
+            self.iniciar()
+            self.reinicios += 1
+            metricas.REINICIOS_EXTRACAO.incrementar(motivo="processo_encerrado")
+            raise
+
+    async def extrair(self, caminho, tipo_arquivo, max_caracteres=None):
+        return "".join([parte async for parte in self.extrair_em_partes(caminho, tipo_arquivo, max_caracteres)])
+
+    # Texto em partes, na ordem do documento, conforme as tarefas do pool terminam. PDFs são divididos em
+    # faixas de páginas (os demais formatos são uma tarefa só: cada tarefa de XLSX teria de carregar de novo
+    # todas as strings compartilhadas do workbook); no máximo "processos" tarefas ficam adiantadas. Com
+    # max_caracteres as tarefas vão uma de cada vez (uma tarefa já iniciada no pool não pode ser
+    # interrompida) e as que sobram depois de atingido o limite nem chegam a ser executadas
+    async def extrair_em_partes(self, caminho, tipo_arquivo, max_caracteres=None):
+        prazo = asyncio.get_running_loop().time() + self.timeout
+        # Pool que recebe as tarefas deste arquivo (recriado se alguma passar do tempo limite)
+        if self._executor is None:
+            self.iniciar()
+        executor = self._executor
+        try:
+            tarefas = await self._planejar(caminho, tipo_arquivo, prazo)
+        except asyncio.TimeoutError:
+            self._reiniciar(executor, "tempo_limite")
+            raise TempoExtracaoExcedido(f"A extração de texto excedeu {self.timeout:.0f}s.")
+        if isinstance(tarefas, str):
+            yield tarefas
+            return
+
+        restantes = max_caracteres
+        adiantadas = self.processos if max_caracteres is None else 1
+        pendentes = []
+        tarefas = iter(tarefas)
+        try:
+            while True:
+                while len(pendentes) < adiantadas:
+                    proxima = next(tarefas, None)
+                    if proxima is None:
+                        break
+                    funcao, *args = proxima
+                    pendentes.append(asyncio.ensure_future(self._executar(funcao, *args, restantes)))
+                if not pendentes:
+                    return
+                try:
+                    parte = await asyncio.wait_for(
+                        asyncio.shield(pendentes[0]), prazo - asyncio.get_running_loop().time()
+                    )
+                except asyncio.TimeoutError:
+                    self._reiniciar(executor, "tempo_limite")
+                    raise TempoExtracaoExcedido(f"A extração de texto excedeu {self.timeout:.0f}s.")
+                pendentes.pop(0)
+                if restantes is not None:
+                    parte = parte[:restantes]
+                    restantes -= len(parte)
+                if parte:
+                    yield parte
+                if restantes == 0:
+                    return
+        finally:
+            for pendente in pendentes:
+                pendente.cancel()
+
+    # Tarefas (funcao, *args) da extração, ou o texto de erro se o PDF não puder ser aberto
+    async def _planejar(self, caminho, tipo_arquivo, prazo):
+        if tipo_arquivo not in TIPOS_PDF:
+            return [(extrair_arquivo, caminho, tipo_arquivo)]
+
+        tarefa = self._executar(contar_paginas_pdf, caminho)
+        try:
+            total_paginas = await asyncio.wait_for(tarefa, prazo - asyncio.get_running_loop().time())
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            print(f"Erro ao processar PDF: {e}")
+            return f"Erro ao processar PDF: {str(e)}"
+
+        # PDFs grandes: uma tarefa por faixa de páginas, juntadas na ordem original
+        return [
+            (extrair_paginas_pdf, caminho, inicio, min(inicio + self.paginas_por_tarefa, total_paginas))
+            for inicio in range(0, total_paginas, self.paginas_por_tarefa)
+        ]
@@ -0,0 +1,329 @@
+# historico.py
+# Este módulo guarda o histórico das conversas (chats) no banco SQLite da aplicação, usando o pool de
+# conexões compartilhado do data_manager. A listagem é paginada por cursor (atualização, id), sem OFFSET.
+# Conversas longas são compactadas em segundo plano: as mensagens antigas viram um resumo acumulado,
+# e os turnos seguintes recebem só o resumo e as mensagens recentes, com tamanho limitado.
+
+import asyncio
+import base64
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+from config_manager import obter_config
+from data_manager import pool_conexoes
+from documentos import remover_raciocinio
+from orcamento_tokens import cortar_texto
+
+PROMPT_RESUMO = """Você mantém o resumo de uma conversa entre um usuário e um assistente policial e jurídico.
+Atualize o resumo anterior incorporando as novas mensagens. Preserve fatos, nomes, números de inquéritos,
+datas, pedidos do usuário e conclusões já dadas. Escreva em português, em no máximo {palavras} palavras,
+sem comentários sobre a tarefa."""
+
+
+def _iso(instante):
+    return datetime.fromtimestamp(instante, tz=timezone.utc).isoformat()
+
+
+def codificar_cursor(atualizada_em, conversa_id):
+    return base64.urlsafe_b64encode(json.dumps([atualizada_em, conversa_id]).encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        atualizada_em, conversa_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(atualizada_em), str(conversa_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+class HistoricoConversas:
+    def __init__(self, resumir, pool=None):
+        # resumir(prompt) -> texto: geração usada na compactação (passa pelo agendador com prioridade de lote)
+        self.resumir = resumir
+        self.pool = pool or pool_conexoes
+        self.ativo = obter_config("HISTORICO", "HISTORICO_ATIVO", True, bool)
+        # Mensagens ainda fora do resumo que disparam uma compactação
+        self.limite_compactacao = obter_config("HISTORICO", "HISTORICO_LIMITE_COMPACTACAO", 12, int)
+        # Mensagens mais recentes que ficam fora do resumo (vão literalmente no prompt)
+        self.manter_recentes = obter_config("HISTORICO", "HISTORICO_MANTER_RECENTES", 4, int)
+        self.resumo_max_tokens = obter_config("HISTORICO", "HISTORICO_RESUMO_MAX_TOKENS", 600, int)
+        self.mensagem_max_tokens = obter_config("HISTORICO", "HISTORICO_MENSAGEM_MAX_TOKENS", 400, int)
+        # Contexto do Ollama acima deste tamanho é descartado e o turno recomeça do resumo
+        self.max_tokens_contexto = obter_config("HISTORICO", "HISTORICO_MAX_TOKENS_CONTEXTO", 3000, int)
+        self.mensagens_por_conversa = obter_config("HISTORICO", "HISTORICO_MENSAGENS_POR_CONVERSA", 20, int)
+        self._compactando = {}
+        self.compactacoes = 0
+        self.falhas_compactacao = 0
+
+    def abrir(self):
+        with self.pool.conexao() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS conversas (
+                    id TEXT PRIMARY KEY,
+                    usuario TEXT NOT NULL DEFAULT '',
+                    nome TEXT NOT NULL,
+                    criada_em REAL NOT NULL,
+                    atualizada_em REAL NOT NULL,
+                    total_mensagens INTEGER NOT NULL DEFAULT 0,
+                    resumo TEXT,
+                    resumo_ate INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_conversas_usuario ON conversas (usuario, atualizada_em DESC, id DESC);
+                CREATE TABLE IF NOT EXISTS mensagens (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversa_id TEXT NOT NULL REFERENCES conversas (id) ON DELETE CASCADE,
+                    papel TEXT NOT NULL,
+                    conteudo TEXT NOT NULL,
+                    criada_em REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_mensagens_conversa ON mensagens (conversa_id, id);
+            """)
+
+    async def encerrar(self):
+        tarefas = list(self._compactando.values())
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        self._compactando.clear()
+
+    def _formatar_conversa(self, linha, mensagens=()):
+        conversa_id, usuario, nome, criada_em, atualizada_em, total = linha
+        # Mesmo formato dos chats usados pelo frontend
+        return {
+            "_id": conversa_id,
+            "userId": usuario,
+            "name": nome,
+            "totalMessages": total,
+            "messages": [self._formatar_mensagem(m) for m in mensagens],
+            "createdAt": _iso(criada_em),
+            "updatedAt": _iso(atualizada_em),
+        }
+
+    def _formatar_mensagem(self, linha):
+        mensagem_id, papel, conteudo, criada_em = linha
+        return {"id": mensagem_id, "role": papel, "content": conteudo, "timestamp": int(criada_em * 1000)}
+
+    # Dono da conversa, ou None se ela não existe
+    def dono(self, conversa_id):
+        with self.pool.conexao() as conn:
+            linha = conn.execute("SELECT usuario FROM conversas WHERE id = ?", (conversa_id,)).fetchone()
+        return linha[0] if linha else None
+
+    # Cria a conversa do usuário (ou devolve a existente); None se o id já pertence a outro usuário
+    def criar_conversa(self, conversa_id=None, usuario="", nome=None):
+        agora = time.time()
+        conversa_id = conversa_id or uuid.uuid4().hex
+        with self.pool.conexao() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO conversas (id, usuario, nome, criada_em, atualizada_em) VALUES (?, ?, ?, ?, ?)",
+                (conversa_id, usuario or "", nome or "Novo Chat", agora, agora),
+            )
+            linha = conn.execute(
+                "SELECT id, usuario, nome, criada_em, atualizada_em, total_mensagens FROM conversas WHERE id = ?",
+                (conversa_id,),
+            ).fetchone()
+        if linha[1] != (usuario or ""):
+            return None
+        return self._formatar_conversa(linha)
+
+    # Guarda a pergunta e a resposta de um turno; devolve quantas mensagens ainda estão fora do resumo.
+    # Conversa de outro usuário não é alterada (devolve 0)
+    def registrar_turno(self, conversa_id, pergunta, resposta, usuario=""):
+        agora = time.time()
+        with self.pool.conexao() as conn:
+            alterada = conn.execute(
+                """INSERT INTO conversas (id, usuario, nome, criada_em, atualizada_em, total_mensagens)
+                   VALUES (?, ?, ?, ?, ?, 2)
+                   ON CONFLICT (id) DO UPDATE SET atualizada_em = excluded.atualizada_em,
+                                                  total_mensagens = total_mensagens + 2
+                   WHERE conversas.usuario = excluded.usuario""",
+                (conversa_id, usuario or "", pergunta.strip()[:60] or "Novo Chat", agora, agora),
+            ).rowcount
+            if not alterada:
+                print(f"Histórico: turno da conversa {conversa_id} ignorado (a conversa pertence a outro usuário)")
+                return 0
+            conn.executemany(
+                "INSERT INTO mensagens (conversa_id, papel, conteudo, criada_em) VALUES (?, ?, ?, ?)",
+                [(conversa_id, "user", pergunta, agora), (conversa_id, "assistant", resposta, agora)],
+            )
+            return conn.execute(
+                """SELECT COUNT(*) FROM mensagens
+                   WHERE conversa_id = ? AND id > (SELECT resumo_ate FROM conversas WHERE id = ?)""",
+                (conversa_id, conversa_id),
+            ).fetchone()[0]
+
+    # Página de conversas da mais para a menos recente; devolve (conversas, cursor da próxima página)
+    def listar_conversas(self, usuario="", limite=20, cursor=None):
+        parametros = [usuario or ""]
+        filtro = ""
+        if cursor:
+            atualizada_em, conversa_id = decodificar_cursor(cursor)
+            filtro = "AND (atualizada_em < ? OR (atualizada_em = ? AND id < ?))"
+            parametros += [atualizada_em, atualizada_em, conversa_id]
+        with self.pool.conexao() as conn:
+            linhas = conn.execute(
+                f"""SELECT id, usuario, nome, criada_em, atualizada_em, total_mensagens FROM conversas
+                    WHERE usuario = ? {filtro}
+                    ORDER BY atualizada_em DESC, id DESC LIMIT ?""",
+                parametros + [limite + 1],
+            ).fetchall()
+            proximo = None
+            if len(linhas) > limite:
+                linhas = linhas[:limite]
+                proximo = codificar_cursor(linhas[-1][4], linhas[-1][0])
+            conversas = []
+            for linha in linhas:
+                mensagens = []
+                if self.mensagens_por_conversa:
+                    mensagens = conn.execute(
+                        "SELECT id, papel, conteudo, criada_em FROM mensagens WHERE conversa_id = ? ORDER BY id DESC LIMIT ?",
+                        (linha[0], self.mensagens_por_conversa),
+                    ).fetchall()[::-1]
+                conversas.append(self._formatar_conversa(linha, mensagens))
+        return conversas, proximo
+
+    # Página de mensagens de uma conversa (ordem cronológica); "antes" é o id da mensagem mais antiga já vista
+    def listar_mensagens(self, conversa_id, limite=50, antes=None):
+        with self.pool.conexao() as conn:
+            linhas = conn.execute(
+                """SELECT id, papel, conteudo, criada_em FROM mensagens
+                   WHERE conversa_id = ? AND id < ? ORDER BY id DESC LIMIT ?""",
+                (conversa_id, antes if antes is not None else 2 ** 63 - 1, limite + 1),
+            ).fetchall()
+        proximo = None
+        if len(linhas) > limite:
+            linhas = linhas[:limite]
+            proximo = linhas[-1][0]
+        return [self._formatar_mensagem(linha) for linha in reversed(linhas)], proximo
+
+    # Com usuario, só altera a conversa se ela for dele (None = administrador, qualquer conversa)
+    def renomear(self, conversa_id, nome, usuario=None):
+        with self.pool.conexao() as conn:
+            return conn.execute(
+                "UPDATE conversas SET nome = ? WHERE id = ? AND (? IS NULL OR usuario = ?)", (nome, conversa_id, usuario, usuario)
+            ).rowcount > 0
+
+    def remover(self, conversa_id, usuario=None):
+        with self.pool.conexao() as conn:
+            return conn.execute(
+                "DELETE FROM conversas WHERE id = ? AND (? IS NULL OR usuario = ?)", (conversa_id, usuario, usuario)
+            ).rowcount > 0
+
+    def _mensagens_pendentes(self, conn, conversa_id):
+        resumo, resumo_ate = conn.execute(
+            "SELECT resumo, resumo_ate FROM conversas WHERE id = ?", (conversa_id,)
+        ).fetchone() or (None, 0)
+        mensagens = conn.execute(
+            "SELECT id, papel, conteudo FROM mensagens WHERE conversa_id = ? AND id > ? ORDER BY id",
+            (conversa_id, resumo_ate),
+        ).fetchall()
+        return resumo, resumo_ate, mensagens
+
+    def _formatar_transcricao(self, mensagens):
+        linhas = []
+        for _, papel, conteudo in mensagens:
+            if papel == "assistant":
+                conteudo = remover_raciocinio(conteudo)
+            rotulo = "Usuário" if papel == "user" else "Assistente"
+            linhas.append(f"{rotulo}: {cortar_texto(conteudo.strip(), self.mensagem_max_tokens)}")
+        return "\n".join(linhas)
+
+    # Memória da conversa para recomeçar um turno sem o contexto do Ollama: resumo + mensagens recentes.
+    # As mensagens além do limite de compactação ficam de fora (a compactação em andamento vai cobri-las).
+    # Conversa de outro usuário não entra no prompt
+    def memoria(self, conversa_id, usuario=""):
+        with self.pool.conexao() as conn:
+            if conn.execute("SELECT 1 FROM conversas WHERE id = ? AND usuario <> ?", (conversa_id, usuario or "")).fetchone():
+                return None
+            resumo, _, mensagens = self._mensagens_pendentes(conn, conversa_id)
+        mensagens = mensagens[-self.limite_compactacao:]
+        partes = []
+        if resumo:
+            partes.append(f"Resumo da conversa até aqui:\n{resumo}")
+        if mensagens:
+            partes.append(f"Mensagens recentes:\n{self._formatar_transcricao(mensagens)}")
+        return "\n\n".join(partes) or None
+
+    def precisa_compactar(self, pendentes):
+        return self.ativo and pendentes > self.limite_compactacao
+
+    # Dispara a compactação em segundo plano (no máximo uma por conversa)
+    def agendar_compactacao(self, conversa_id):
+        if conversa_id in self._compactando:
+            return
+        self._compactando[conversa_id] = asyncio.create_task(self._compactar(conversa_id))
+
+    async def _compactar(self, conversa_id):
+        try:
+            await self.compactar(conversa_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.falhas_compactacao += 1
+            print(f"Erro ao compactar a conversa {conversa_id}: {str(e)}")
+        finally:
+            self._compactando.pop(conversa_id, None)
+
+    # Incorpora ao resumo as mensagens pendentes, exceto as manter_recentes mais novas
+    async def compactar(self, conversa_id):
+        def ler():
+            with self.pool.conexao() as conn:
+                return self._mensagens_pendentes(conn, conversa_id)
+
+        resumo, resumo_ate, mensagens = await asyncio.to_thread(ler)
+        mensagens = mensagens[:len(mensagens) - self.manter_recentes]
+        if not mensagens:
+            return False
+
+        palavras = self.resumo_max_tokens * 3 // 4
+        conteudo = f"Resumo anterior:\n{resumo or '(vazio)'}\n\nNovas mensagens:\n{self._formatar_transcricao(mensagens)}"
+        prompt = f"<|system|>\n{PROMPT_RESUMO.format(palavras=palavras)}\n<|user|>\n{conteudo}\n<|assistant|>\n"
+        novo_resumo = cortar_texto(remover_raciocinio(await self.resumir(prompt)), self.resumo_max_tokens)
+        if not novo_resumo:
+            raise RuntimeError("resumo vazio")
+
+        def gravar():
+            with self.pool.conexao() as conn:
+                # Só grava se nenhuma outra compactação avançou o resumo enquanto este era gerado
+                return conn.execute(
+                    "UPDATE conversas SET resumo = ?, resumo_ate = ? WHERE id = ? AND resumo_ate = ?",
+                    (novo_resumo, mensagens[-1][0], conversa_id, resumo_ate),
+                ).rowcount > 0
+
+        gravado = await asyncio.to_thread(gravar)
+        if gravado:
+            self.compactacoes += 1
+            print(f"Conversa {conversa_id} compactada: {len(mensagens)} mensagens incorporadas ao resumo")
+        return gravado
+
+    def estatisticas(self):
+        with self.pool.conexao() as conn:
+            conversas, com_resumo = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(resumo IS NOT NULL), 0) FROM conversas"
+            ).fetchone()
+            mensagens = conn.execute("SELECT COUNT(*) FROM mensagens").fetchone()[0]
+        return {
+            "ativo": self.ativo,
+            "conversas": conversas,
+            "conversas_com_resumo": com_resumo,
+            "mensagens": mensagens,
+            "compactando": len(self._compactando),
+            "compactacoes": self.compactacoes,
+            "falhas_compactacao": self.falhas_compactacao,
+        }
+
+    async def registrar_turno_async(self, conversa_id, pergunta, resposta, usuario=""):
+        pendentes = await asyncio.to_thread(self.registrar_turno, conversa_id, pergunta, resposta, usuario)
+        if self.precisa_compactar(pendentes):
+            self.agendar_compactacao(conversa_id)
+
+    async def memoria_async(self, conversa_id, usuario=""):
+        return await asyncio.to_thread(self.memoria, conversa_id, usuario)
+
+    async def listar_conversas_async(self, usuario="", limite=20, cursor=None):
+        return await asyncio.to_thread(self.listar_conversas, usuario, limite, cursor)
+
+    async def listar_mensagens_async(self, conversa_id, limite=50, antes=None):
+        return await asyncio.to_thread(self.listar_mensagens, conversa_id, limite, antes)
@@ -0,0 +1,264 @@
+# indice_busca.py
+# Este módulo mantém um índice invertido em disco (SQLite) sobre os documentos enviados e os inquéritos,
+# com ranqueamento BM25 por passagem. A tokenização é adaptada ao português (minúsculas, remoção de
+# acentos, stopwords e normalização simples de plural). Documentos podem ser adicionados e removidos
+# incrementalmente, e a busca devolve só as passagens mais relevantes para montar o prompt. Cada documento
+# enviado guarda o usuário que o enviou, e a busca de um usuário só vê os próprios documentos (e os inquéritos).
+
+import asyncio
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from config_manager import obter_config
+
+STOPWORDS = frozenset("""
+a ao aos as ate com como da das de dela dele deles do dos e ela elas ele eles em entre era eram essa
+esse esta estao este eu foi foram ha isso isto ja la lhe mais mas me mesmo meu minha muito na nas nao
+nem no nos nossa nosso num numa o os ou para pela pelas pelo pelos por qual quando que quem se sem ser
+seu seus sua suas so tambem te tem tinha tu um uma umas uns voce voces sobre apos qualquer pode podem
+""".split())
+
+PADRAO_PALAVRA = re.compile(r"[a-z0-9]+")
+
+
+def remover_acentos(texto):
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+
+
+# Normalização leve de plural (ex.: "inqueritos" -> "inquerito", "acoes" -> "acao")
+def normalizar_termo(termo):
+    if len(termo) <= 3 or termo.isdigit():
+        return termo
+    for sufixo, troca in (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("res", "r"), ("ns", "m")):
+        if termo.endswith(sufixo) and len(termo) > len(sufixo) + 2:
+            return termo[: -len(sufixo)] + troca
+    if termo.endswith("s") and not termo.endswith("ss"):
+        return termo[:-1]
+    return termo
+
+
+def tokenizar(texto):
+    texto = remover_acentos(texto.lower())
+    return [normalizar_termo(p) for p in PADRAO_PALAVRA.findall(texto) if p not in STOPWORDS and len(p) > 1]
+
+
+# Divide o texto em passagens de até palavras_por_passagem palavras, com pequena sobreposição
+def dividir_em_passagens(texto, palavras_por_passagem=150, sobreposicao=30):
+    palavras = texto.split()
+    passo = max(palavras_por_passagem - sobreposicao, 1)
+    passagens = []
+    for inicio in range(0, len(palavras), passo):
+        passagens.append(" ".join(palavras[inicio:inicio + palavras_por_passagem]))
+        if inicio + palavras_por_passagem >= len(palavras):
+            break
+    return passagens
+
+
+class IndiceBusca:
+    def __init__(self, caminho=None, k1=1.2, b=0.75):
+        self.caminho = caminho or obter_config(
+            "BUSCA", "BUSCA_INDICE_PATH",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "indice_busca.db")
+        )
+        self.k1 = k1
+        self.b = b
+        self._conn = None
+        self._lock = threading.Lock()
+        self._total_passagens = 0
+        self._total_tokens = 0
+        self._versao_dados = None
+
+    def abrir(self):
+        with self._lock:
+            if self._conn is not None:
+                return
+            self._conn = sqlite3.connect(self.caminho, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS documentos (
+                    id TEXT PRIMARY KEY, origem TEXT, titulo TEXT, assinatura TEXT, indexado_em REAL NOT NULL,
+                    dono TEXT NOT NULL DEFAULT ''
+                );
+                CREATE INDEX IF NOT EXISTS idx_documentos_origem ON documentos (origem);
+                CREATE TABLE IF NOT EXISTS passagens (
+                    id INTEGER PRIMARY KEY, documento_id TEXT NOT NULL, posicao INTEGER NOT NULL,
+                    texto TEXT NOT NULL, tamanho INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_passagens_documento ON passagens (documento_id);
+                CREATE TABLE IF NOT EXISTS termos (
+                    termo TEXT NOT NULL, passagem_id INTEGER NOT NULL, frequencia INTEGER NOT NULL,
+                    PRIMARY KEY (termo, passagem_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_termos_passagem ON termos (passagem_id);
+            """)
+            if "dono" not in {linha[1] for linha in self._conn.execute("PRAGMA table_info(documentos)")}:
+                self._conn.execute("ALTER TABLE documentos ADD COLUMN dono TEXT NOT NULL DEFAULT ''")
+            self._versao_dados = None
+            self._atualizar_totais()
+            print(f"Índice de busca: {self.caminho} ({self._total_passagens} passagens)")
+
+    # Os totais do BM25 ficam em memória e são atualizados a cada escrita desta conexão. Escritas de outros
+    # processos (outros workers do servidor) mudam o data_version do SQLite, e aí os totais são relidos
+    def _atualizar_totais(self):
+        versao = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if versao != self._versao_dados:
+            total, tokens = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM passagens").fetchone()
+            self._total_passagens, self._total_tokens = total, tokens
+            self._versao_dados = versao
+
+    def fechar(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def contem(self, documento_id):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documentos WHERE id = ?", (documento_id,)).fetchone() is not None
+
+    # Adiciona (ou substitui) um documento no índice; dono é o usuário que enviou o documento
+    def adicionar(self, documento_id, texto, origem="upload", titulo=None, dono=""):
+        passagens = dividir_em_passagens(texto)
+        tokenizadas = [tokenizar(p) for p in passagens]
+        assinatura = hashlib.sha256(texto.encode("utf-8")).hexdigest()
+        with self._lock:
+            with self._conn:
+                self._remover(documento_id)
+                self._conn.execute(
+                    "INSERT INTO documentos (id, origem, titulo, assinatura, indexado_em, dono) VALUES (?, ?, ?, ?, ?, ?)",
+                    (documento_id, origem, titulo, assinatura, time.time(), dono or ""),
+                )
+                for posicao, (passagem, termos) in enumerate(zip(passagens, tokenizadas)):
+                    if not termos:
+                        continue
+                    cursor = self._conn.execute(
+                        "INSERT INTO passagens (documento_id, posicao, texto, tamanho) VALUES (?, ?, ?, ?)",
+                        (documento_id, posicao, passagem, len(termos)),
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO termos (termo, passagem_id, frequencia) VALUES (?, ?, ?)",
+                        ((termo, cursor.lastrowid, freq) for termo, freq in Counter(termos).items()),
+                    )
+                    self._total_passagens += 1
+                    self._total_tokens += len(termos)
+
+    def remover(self, documento_id):
+        with self._lock:
+            with self._conn:
+                return self._remover(documento_id)
+
+    def _remover(self, documento_id):
+        removidas = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM passagens WHERE documento_id = ?", (documento_id,)
+        ).fetchone()
+        self._conn.execute(
+            "DELETE FROM termos WHERE passagem_id IN (SELECT id FROM passagens WHERE documento_id = ?)", (documento_id,)
+        )
+        self._conn.execute("DELETE FROM passagens WHERE documento_id = ?", (documento_id,))
+        cursor = self._conn.execute("DELETE FROM documentos WHERE id = ?", (documento_id,))
+        self._total_passagens -= removidas[0]
+        self._total_tokens -= removidas[1]
+        return cursor.rowcount > 0
+
+    # Sincroniza os inquéritos: (re)indexa só os que mudaram e remove os que não existem mais
+    def sincronizar_inqueritos(self, inqueritos):
+        with self._lock:
+            existentes = dict(self._conn.execute(
+                "SELECT id, assinatura FROM documentos WHERE origem = 'inquerito'"
+            ).fetchall())
+        atualizados = 0
+        vistos = set()
+        for numero, descricao in inqueritos:
+            documento_id = f"inquerito:{numero}"
+            vistos.add(documento_id)
+            texto = f"Inquérito {numero}\n{descricao or ''}"
+            if existentes.get(documento_id) == hashlib.sha256(texto.encode("utf-8")).hexdigest():
+                continue
+            self.adicionar(documento_id, texto, origem="inquerito", titulo=f"Inquérito {numero}")
+            atualizados += 1
+        removidos = 0
+        for documento_id in set(existentes) - vistos:
+            removidos += self.remover(documento_id)
+        return {"atualizados": atualizados, "removidos": removidos, "total": len(vistos)}
+
+    # Busca BM25: devolve as k passagens mais relevantes para a consulta. Com dono, só entram os documentos
+    # desse usuário e, com inqueritos=True, os inquéritos (dono=None: todo o índice, para o administrador)
+    def buscar(self, consulta, k=5, dono=None, inqueritos=True):
+        termos = set(tokenizar(consulta))
+        if not termos:
+            return []
+        filtro, parametros = "", ()
+        if dono is not None:
+            filtro = " AND (d.dono = ? AND d.origem <> 'inquerito' OR ? AND d.origem = 'inquerito')"
+            parametros = (dono, int(bool(inqueritos)))
+        with self._lock:
+            self._atualizar_totais()
+            total = self._total_passagens
+            if total == 0:
+                return []
+            media = self._total_tokens / total
+            pontuacao = Counter()
+            tamanhos = {}
+            for termo in termos:
+                postings = self._conn.execute(
+                    "SELECT t.passagem_id, t.frequencia, p.tamanho FROM termos t "
+                    "JOIN passagens p ON p.id = t.passagem_id JOIN documentos d ON d.id = p.documento_id "
+                    f"WHERE t.termo = ?{filtro}",
+                    (termo, *parametros),
+                ).fetchall()
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                for passagem_id, freq, tamanho in postings:
+                    tamanhos[passagem_id] = tamanho
+                    pontuacao[passagem_id] += idf * freq * (self.k1 + 1) / (
+                        freq + self.k1 * (1 - self.b + self.b * tamanho / media)
+                    )
+            melhores = pontuacao.most_common(k)
+            if not melhores:
+                return []
+            linhas = {
+                linha[0]: linha[1:]
+                for linha in self._conn.execute(
+                    f"SELECT p.id, p.documento_id, p.texto, d.titulo, d.origem FROM passagens p "
+                    f"JOIN documentos d ON d.id = p.documento_id WHERE p.id IN ({','.join('?' * len(melhores))})",
+                    [passagem_id for passagem_id, _ in melhores],
+                )
+            }
+        return [
+            {
+                "documento_id": linhas[passagem_id][0],
+                "titulo": linhas[passagem_id][2],
+                "origem": linhas[passagem_id][3],
+                "texto": linhas[passagem_id][1],
+                "pontuacao": round(valor, 4),
+            }
+            for passagem_id, valor in melhores
+            if passagem_id in linhas
+        ]
+
+    def estatisticas(self):
+        with self._lock:
+            self._atualizar_totais()
+            documentos = self._conn.execute("SELECT COUNT(*) FROM documentos").fetchone()[0]
+        return {
+            "documentos": documentos,
+            "passagens": self._total_passagens,
+            "tamanho_medio": round(self._total_tokens / self._total_passagens, 2) if self._total_passagens else 0,
+        }
+
+    # Versões assíncronas (o trabalho em SQLite roda fora do event loop)
+    async def adicionar_async(self, documento_id, texto, origem="upload", titulo=None, dono=""):
+        await asyncio.to_thread(self.adicionar, documento_id, texto, origem, titulo, dono)
+
+    async def buscar_async(self, consulta, k=5, dono=None, inqueritos=True):
+        return await asyncio.to_thread(self.buscar, consulta, k, dono, inqueritos)
@@ -0,0 +1,185 @@
+# ingestao.py
+# Este módulo recebe os uploads com memória limitada: o corpo é copiado em blocos de tamanho fixo
+# para um arquivo temporário, o limite de tamanho é verificado durante a cópia (e já na chegada do
+# corpo da requisição, pelo middleware), e os bytes iniciais são conferidos com o tipo declarado.
+# Os extratores recebem apenas o caminho do arquivo, sem cópias em memória.
+
+import asyncio
+import codecs
+import hashlib
+import json
+import os
+import uuid
+
+from fastapi import HTTPException
+
+from config_manager import obter_config
+
+
+# Limite de tamanho dos uploads (lido na hora do uso, depois que o .env foi carregado)
+def limite_upload_bytes():
+    return obter_config("UPLOAD", "UPLOAD_MAX_BYTES", 10 * 1024 * 1024, int)
+
+
+def mensagem_arquivo_grande(limite_bytes):
+    if limite_bytes >= 1024 * 1024:
+        return f"Arquivo muito grande. O limite é de {limite_bytes // (1024 * 1024)}MB."
+    return f"Arquivo muito grande. O limite é de {limite_bytes // 1024}KB."
+
+# Assinaturas (magic bytes) aceitas para cada tipo declarado
+ASSINATURA_PDF = b"%PDF-"
+ASSINATURA_ZIP = b"PK\x03\x04"                          # DOCX/XLSX (Office Open XML)
+ASSINATURA_OLE2 = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"   # DOC/XLS (formato binário antigo)
+
+ASSINATURAS = {
+    "application/pdf": (ASSINATURA_PDF,),
+    "application/msword": (ASSINATURA_OLE2, ASSINATURA_ZIP),
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": (ASSINATURA_ZIP,),
+    "application/vnd.ms-excel": (ASSINATURA_OLE2, ASSINATURA_ZIP),
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": (ASSINATURA_ZIP,),
+}
+
+
+class ArquivoRecebido:
+    def __init__(self, caminho, tamanho, nome, tipo_arquivo, sha256=None):
+        self.caminho = caminho
+        self.tamanho = tamanho
+        self.nome = nome
+        self.tipo_arquivo = tipo_arquivo
+        self.sha256 = sha256
+
+    def remover(self):
+        if os.path.exists(self.caminho):
+            os.unlink(self.caminho)
+            print(f"Arquivo temporário removido: {self.caminho}")
+
+
+# Confere se o início do arquivo corresponde ao tipo declarado
+def verificar_assinatura(cabecalho, tipo_arquivo):
+    if tipo_arquivo == "text/plain":
+        # Texto: sem bytes nulos e UTF-8 válido (um caractere cortado no fim do bloco é aceito)
+        if b"\x00" in cabecalho:
+            return False
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(cabecalho, final=False)
+            return True
+        except UnicodeDecodeError:
+            return False
+    assinaturas = ASSINATURAS.get(tipo_arquivo)
+    if assinaturas is None:
+        return False
+    return any(cabecalho.startswith(assinatura) for assinatura in assinaturas)
+
+
+# Copia o upload em blocos para o destino, abortando assim que passar do limite (roda em thread).
+# O SHA-256 do conteúdo é calculado na mesma passada, para o cache de extração.
+def _copiar_em_blocos(origem, caminho_destino, limite_bytes, tamanho_bloco):
+    tamanho = 0
+    cabecalho = b""
+    resumo = hashlib.sha256()
+    with open(caminho_destino, "wb") as destino:
+        while True:
+            bloco = origem.read(tamanho_bloco)
+            if not bloco:
+                break
+            if not cabecalho:
+                cabecalho = bloco[:4096]
+            tamanho += len(bloco)
+            if tamanho > limite_bytes:
+                return tamanho, cabecalho, None
+            resumo.update(bloco)
+            destino.write(bloco)
+    return tamanho, cabecalho, resumo.hexdigest()
+
+
+async def receber_upload(file, diretorio, extensao="", limite_bytes=None, tamanho_bloco=None):
+    limite_bytes = limite_bytes or limite_upload_bytes()
+    tamanho_bloco = tamanho_bloco or obter_config("UPLOAD", "UPLOAD_TAMANHO_BLOCO", 1024 * 1024, int)
+    os.makedirs(diretorio, exist_ok=True)
+
+    # Nome único para evitar colisões
+    caminho = os.path.join(diretorio, f"{uuid.uuid4()}{extensao}")
+    arquivo = ArquivoRecebido(caminho, 0, file.filename, file.content_type)
+    try:
+        tamanho, cabecalho, sha256 = await asyncio.to_thread(
+            _copiar_em_blocos, file.file, caminho, limite_bytes, tamanho_bloco
+        )
+        if sha256 is None:
+            raise HTTPException(status_code=400, detail=mensagem_arquivo_grande(limite_bytes))
+        if not verificar_assinatura(cabecalho, file.content_type):
+            raise HTTPException(
+                status_code=400,
+                detail=f"O conteúdo do arquivo não corresponde ao tipo declarado ({file.content_type})."
+            )
+    except BaseException:
+        arquivo.remover()
+        raise
+    arquivo.tamanho = tamanho
+    arquivo.sha256 = sha256
+    return arquivo
+
+
+# Estouro do limite detectado enquanto o corpo da requisição ainda está chegando
+class CorpoExcedido(Exception):
+    pass
+
+
+# Middleware ASGI que limita o corpo das rotas de upload antes mesmo do parse do multipart:
+# rejeita pelo Content-Length e, sem ele (chunked), interrompe a leitura ao passar do limite.
+class LimiteUploadMiddleware:
+    def __init__(self, app, caminhos, limite_bytes=None):
+        self.app = app
+        self.caminhos = set(caminhos)
+        self.limite_arquivo = limite_bytes or limite_upload_bytes()
+        # Margem para os cabeçalhos do multipart
+        self.limite_bytes = self.limite_arquivo + 64 * 1024
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.caminhos:
+            await self.app(scope, receive, send)
+            return
+
+        for nome, valor in scope.get("headers", []):
+            if nome == b"content-length" and valor.isdigit() and int(valor) > self.limite_bytes:
+                await self._rejeitar(send)
+                return
+
+        recebidos = 0
+        excedido = False
+        resposta_enviada = False
+
+        async def receive_limitado():
+            nonlocal recebidos, excedido
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                recebidos += len(mensagem.get("body", b""))
+                if recebidos > self.limite_bytes:
+                    excedido = True
+                    raise CorpoExcedido()
+            return mensagem
+
+        async def send_controlado(mensagem):
+            nonlocal resposta_enviada
+            if excedido:
+                # Substituir a resposta de erro genérica do parse pela mensagem de limite
+                if mensagem["type"] == "http.response.start" and not resposta_enviada:
+                    resposta_enviada = True
+                    await self._rejeitar(send)
+                return
+            resposta_enviada = resposta_enviada or mensagem["type"] == "http.response.start"
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive_limitado, send_controlado)
+        except CorpoExcedido:
+            if not resposta_enviada:
+                await self._rejeitar(send)
+
+    async def _rejeitar(self, send):
+        corpo = json.dumps({"detail": mensagem_arquivo_grande(self.limite_arquivo)}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 400,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode())],
+        })
+        await send({"type": "http.response.body", "body": corpo})
@@ -0,0 +1,403 @@
+# lotes.py
+# Este módulo processa trabalhos em lote: a mesma pergunta (ou uma lista de perguntas) para centenas de
+# inquéritos. Lotes e itens ficam no banco SQLite da aplicação, então sobrevivem a reinícios (itens que
+# estavam em processamento voltam para a fila). Poucos trabalhadores em segundo plano consomem os itens
+# com prioridade de lote no agendador, abaixo do chat interativo, e cada item tem novas tentativas com espera.
+
+import asyncio
+import string
+import time
+import uuid
+
+from agendador import FilaCheia
+from config_manager import obter_config
+from data_manager import pool_conexoes
+
+ESTADOS_FINAIS = ("concluido", "falhou", "cancelado")
+
+
+# Cliente com o máximo de lotes em andamento
+class LimiteLotes(Exception):
+    pass
+
+
+# Campos de um inquérito disponíveis no modelo de pergunta ({numero}, {descricao}, ...); campos ausentes ficam vazios
+class _CamposInquerito(dict):
+    def __missing__(self, chave):
+        return ""
+
+
+def preencher_modelo(modelo, inquerito):
+    campos = _CamposInquerito({chave: "" if valor is None else valor for chave, valor in inquerito.items()})
+    return string.Formatter().vformat(modelo, (), campos)
+
+
+class GerenciadorLotes:
+    def __init__(self, responder, pool=None):
+        # responder(pergunta, thinkkn_mode, dono) -> texto: geração de um item (passa pelo agendador com prioridade
+        # de lote); dono é o cliente que criou o lote (as passagens do índice de busca vêm dos documentos dele)
+        self.responder = responder
+        self.pool = pool or pool_conexoes
+        # Itens em processamento ao mesmo tempo no servidor inteiro: a contagem fica no banco, compartilhada
+        # pelos workers (cada worker roda até esse número de trabalhadores, mas só reserva item se houver vaga)
+        self.trabalhadores = obter_config("LOTES", "LOTES_TRABALHADORES", 1, int)
+        # Reserva de um item em processamento (s), renovada enquanto ele roda; vencida (worker encerrado no
+        # meio do item sem devolvê-lo), o item volta para a fila e libera a vaga
+        self.prazo_reserva = obter_config("LOTES", "LOTES_PRAZO_RESERVA", 300, float)
+        self._sem_vaga = False
+        self.max_itens = obter_config("LOTES", "LOTES_MAX_ITENS", 5000, int)
+        # Lotes pendentes ou em processamento por cliente (dono); novos lotes acima disso são recusados
+        self.max_pendentes = obter_config("LOTES", "LOTES_MAX_PENDENTES_POR_CLIENTE", 3, int)
+        self.max_tentativas = obter_config("LOTES", "LOTES_MAX_TENTATIVAS", 3, int)
+        # Espera antes da nova tentativa: espera_base * 2^(tentativa - 1) segundos
+        self.espera_base = obter_config("LOTES", "LOTES_ESPERA_BASE", 10, float)
+        self._tarefas = []
+        self._novo_item = asyncio.Event()
+        # lote_id -> evento disparado quando um item do lote termina (para o streaming de resultados)
+        self._avisos = {}
+        self.processados = 0
+
+    # recuperar=False quando outro processo já devolveu à fila os itens interrompidos (com vários workers,
+    # o lançador faz isso uma vez antes de iniciá-los; um worker não pode mexer nos itens de outro)
+    def abrir(self, recuperar=True):
+        with self.pool.conexao() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS lotes (
+                    id TEXT PRIMARY KEY,
+                    nome TEXT,
+                    estado TEXT NOT NULL,
+                    thinkkn INTEGER NOT NULL DEFAULT 0,
+                    max_tentativas INTEGER NOT NULL,
+                    total INTEGER NOT NULL,
+                    criado_em REAL NOT NULL,
+                    concluido_em REAL,
+                    dono TEXT NOT NULL DEFAULT ''
+                );
+                CREATE INDEX IF NOT EXISTS idx_lotes_criacao ON lotes (criado_em DESC);
+                CREATE TABLE IF NOT EXISTS itens_lote (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    lote_id TEXT NOT NULL REFERENCES lotes (id) ON DELETE CASCADE,
+                    posicao INTEGER NOT NULL,
+                    referencia TEXT,
+                    pergunta TEXT NOT NULL,
+                    estado TEXT NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    disponivel_em REAL NOT NULL DEFAULT 0,
+                    resposta TEXT,
+                    erro TEXT,
+                    concluido_em REAL,
+                    ordem INTEGER,
+                    reservado_em REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_itens_lote_fila ON itens_lote (estado, disponivel_em, id);
+                CREATE INDEX IF NOT EXISTS idx_itens_lote_lote ON itens_lote (lote_id, estado);
+                CREATE INDEX IF NOT EXISTS idx_itens_lote_ordem ON itens_lote (lote_id, ordem);
+            """)
+            colunas = {linha[1] for linha in conn.execute("PRAGMA table_info(itens_lote)")}
+            if "reservado_em" not in colunas:
+                conn.execute("ALTER TABLE itens_lote ADD COLUMN reservado_em REAL")
+            if "dono" not in {linha[1] for linha in conn.execute("PRAGMA table_info(lotes)")}:
+                conn.execute("ALTER TABLE lotes ADD COLUMN dono TEXT NOT NULL DEFAULT ''")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lotes_dono ON lotes (dono, estado)")
+            if not recuperar:
+                return
+            # Itens interrompidos por um reinício voltam para a fila (a tentativa interrompida não conta)
+            recuperados = conn.execute(
+                "UPDATE itens_lote SET estado = 'pendente', tentativas = MAX(tentativas - 1, 0) WHERE estado = 'processando'"
+            ).rowcount
+        if recuperados:
+            print(f"Lotes: {recuperados} itens interrompidos voltaram para a fila")
+
+    def iniciar(self):
+        if not self._tarefas:
+            self._tarefas = [asyncio.create_task(self._trabalhar(indice)) for indice in range(self.trabalhadores)]
+
+    async def encerrar(self):
+        tarefas, self._tarefas = self._tarefas, []
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+
+    # Cria um lote com uma pergunta por item; itens = [(referencia, pergunta)]. dono identifica o cliente
+    # que pediu o lote (limite de lotes em andamento e permissão para cancelar)
+    def criar(self, itens, nome=None, thinkkn_mode=False, max_tentativas=None, dono=""):
+        if not itens:
+            raise ValueError("O lote não tem perguntas.")
+        if len(itens) > self.max_itens:
+            raise ValueError(f"O lote tem {len(itens)} perguntas; o máximo é {self.max_itens}.")
+        lote_id = uuid.uuid4().hex
+        with self.pool.conexao() as conn:
+            # Contagem e criação sob o lock de escrita: requisições simultâneas (ou em outro worker) não passam do limite
+            conn.execute("BEGIN IMMEDIATE")
+            em_andamento = conn.execute(
+                "SELECT COUNT(*) FROM lotes WHERE dono = ? AND estado IN ('pendente', 'processando')", (dono,)
+            ).fetchone()[0]
+            if em_andamento >= self.max_pendentes:
+                raise LimiteLotes(
+                    f"Já existem {em_andamento} lotes em andamento para este cliente; o máximo é {self.max_pendentes}."
+                )
+            conn.execute(
+                "INSERT INTO lotes (id, nome, estado, thinkkn, max_tentativas, total, criado_em, dono) "
+                "VALUES (?, ?, 'pendente', ?, ?, ?, ?, ?)",
+                (lote_id, nome, int(thinkkn_mode), max_tentativas or self.max_tentativas, len(itens), time.time(), dono),
+            )
+            conn.executemany(
+                "INSERT INTO itens_lote (lote_id, posicao, referencia, pergunta) VALUES (?, ?, ?, ?)",
+                [(lote_id, posicao, referencia, pergunta) for posicao, (referencia, pergunta) in enumerate(itens)],
+            )
+        self._novo_item.set()
+        return self.obter(lote_id)
+
+    def _contagens(self, conn, lote_id):
+        return dict(conn.execute(
+            "SELECT estado, COUNT(*) FROM itens_lote WHERE lote_id = ? GROUP BY estado", (lote_id,)
+        ).fetchall())
+
+    def _formatar_lote(self, linha, contagens):
+        lote_id, nome, estado, thinkkn, max_tentativas, total, criado_em, concluido_em, dono = linha
+        finalizados = sum(contagens.get(e, 0) for e in ESTADOS_FINAIS)
+        return {
+            "id": lote_id,
+            "nome": nome,
+            "estado": estado,
+            "thinkknMode": bool(thinkkn),
+            "max_tentativas": max_tentativas,
+            "total": total,
+            "itens": {e: contagens.get(e, 0) for e in ("pendente", "processando") + ESTADOS_FINAIS},
+            "progresso": round(finalizados / total, 4) if total else 1.0,
+            "criado_em": criado_em,
+            "concluido_em": concluido_em,
+            "dono": dono,
+        }
+
+    def obter(self, lote_id):
+        with self.pool.conexao() as conn:
+            linha = conn.execute(
+                "SELECT id, nome, estado, thinkkn, max_tentativas, total, criado_em, concluido_em, dono FROM lotes WHERE id = ?",
+                (lote_id,),
+            ).fetchone()
+            if linha is None:
+                return None
+            return self._formatar_lote(linha, self._contagens(conn, lote_id))
+
+    # Lotes mais recentes; com dono, somente os desse cliente
+    def listar(self, limite=50, dono=None):
+        filtro, parametros = ("WHERE dono = ? ", (dono,)) if dono is not None else ("", ())
+        with self.pool.conexao() as conn:
+            linhas = conn.execute(
+                "SELECT id, nome, estado, thinkkn, max_tentativas, total, criado_em, concluido_em, dono FROM lotes "
+                f"{filtro}ORDER BY criado_em DESC LIMIT ?",
+                (*parametros, limite),
+            ).fetchall()
+            return [self._formatar_lote(linha, self._contagens(conn, linha[0])) for linha in linhas]
+
+    # Itens finalizados em ordem de conclusão (cursor: "ordem" do último item recebido). Novas tentativas
+    # terminam fora da ordem de criação, então cada item recebe a próxima ordem do lote ao ser finalizado.
+    def resultados(self, lote_id, depois=0, limite=100):
+        with self.pool.conexao() as conn:
+            linhas = conn.execute(
+                """SELECT ordem, posicao, referencia, pergunta, estado, tentativas, resposta, erro, concluido_em
+                   FROM itens_lote WHERE lote_id = ? AND ordem > ? ORDER BY ordem LIMIT ?""",
+                (lote_id, depois, limite),
+            ).fetchall()
+        return [
+            {
+                "ordem": ordem, "posicao": posicao, "referencia": referencia, "pergunta": pergunta, "estado": estado,
+                "tentativas": tentativas, "resposta": resposta, "erro": erro, "concluido_em": concluido_em,
+            }
+            for ordem, posicao, referencia, pergunta, estado, tentativas, resposta, erro, concluido_em in linhas
+        ]
+
+    def _proxima_ordem(self, conn, lote_id):
+        return conn.execute("SELECT COALESCE(MAX(ordem), 0) + 1 FROM itens_lote WHERE lote_id = ?", (lote_id,)).fetchone()[0]
+
+    def cancelar(self, lote_id):
+        agora = time.time()
+        with self.pool.conexao() as conn:
+            alterado = conn.execute(
+                "UPDATE lotes SET estado = 'cancelado', concluido_em = ? WHERE id = ? AND estado IN ('pendente', 'processando')",
+                (agora, lote_id),
+            ).rowcount
+            if alterado:
+                ordem = self._proxima_ordem(conn, lote_id)
+                pendentes = conn.execute(
+                    "SELECT id FROM itens_lote WHERE lote_id = ? AND estado = 'pendente' ORDER BY id", (lote_id,)
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE itens_lote SET estado = 'cancelado', concluido_em = ?, ordem = ? WHERE id = ?",
+                    [(agora, ordem + indice, item_id) for indice, (item_id,) in enumerate(pendentes)],
+                )
+        self._avisar(lote_id)
+        return bool(alterado)
+
+    # Reserva o próximo item disponível (lotes mais antigos primeiro), se houver vaga no servidor
+    def _reservar_item(self):
+        agora = time.time()
+        with self.pool.conexao() as conn:
+            # Contagem e reserva sob o lock de escrita: dois workers não ocupam a mesma vaga
+            conn.execute("BEGIN IMMEDIATE")
+            vencidos = conn.execute(
+                "UPDATE itens_lote SET estado = 'pendente' WHERE estado = 'processando' AND reservado_em < ?",
+                (agora - self.prazo_reserva,),
+            ).rowcount
+            if vencidos:
+                print(f"Lotes: {vencidos} itens com reserva vencida voltaram para a fila")
+            em_processamento = conn.execute("SELECT COUNT(*) FROM itens_lote WHERE estado = 'processando'").fetchone()[0]
+            self._sem_vaga = em_processamento >= self.trabalhadores
+            if self._sem_vaga:
+                return None
+            linha = conn.execute(
+                """SELECT i.id, i.lote_id, i.pergunta, i.tentativas, l.thinkkn, l.max_tentativas, l.dono
+                   FROM itens_lote i JOIN lotes l ON l.id = i.lote_id
+                   WHERE i.estado = 'pendente' AND i.disponivel_em <= ? ORDER BY i.id LIMIT 1""",
+                (agora,),
+            ).fetchone()
+            if linha is None:
+                return None
+            conn.execute(
+                "UPDATE itens_lote SET estado = 'processando', tentativas = tentativas + 1, reservado_em = ? WHERE id = ?",
+                (agora, linha[0]),
+            )
+            conn.execute("UPDATE lotes SET estado = 'processando' WHERE id = ? AND estado = 'pendente'", (linha[1],))
+            return linha
+
+    def _renovar_reserva(self, item_id):
+        with self.pool.conexao() as conn:
+            conn.execute(
+                "UPDATE itens_lote SET reservado_em = ? WHERE id = ? AND estado = 'processando'", (time.time(), item_id)
+            )
+
+    async def _manter_reserva(self, item_id):
+        while True:
+            await asyncio.sleep(self.prazo_reserva / 3)
+            try:
+                await asyncio.to_thread(self._renovar_reserva, item_id)
+            except Exception as e:
+                print(f"Lotes: erro ao renovar a reserva do item {item_id}: {str(e)}")
+
+    def _proxima_disponibilidade(self):
+        with self.pool.conexao() as conn:
+            return conn.execute("SELECT MIN(disponivel_em) FROM itens_lote WHERE estado = 'pendente'").fetchone()[0]
+
+    def _finalizar_item(self, item_id, lote_id, estado, resposta=None, erro=None, disponivel_em=0, devolver_tentativa=False):
+        agora = time.time()
+        final = estado in ESTADOS_FINAIS
+        with self.pool.conexao() as conn:
+            conn.execute(
+                """UPDATE itens_lote SET estado = ?, resposta = ?, erro = ?, disponivel_em = ?,
+                          tentativas = tentativas - ?, concluido_em = ?, ordem = ? WHERE id = ? AND estado = 'processando'""",
+                (estado, resposta, erro, disponivel_em, int(devolver_tentativa),
+                 agora if final else None, self._proxima_ordem(conn, lote_id) if final else None, item_id),
+            )
+            # Lote terminado quando não restam itens pendentes ou em processamento
+            restantes = conn.execute(
+                "SELECT COUNT(*) FROM itens_lote WHERE lote_id = ? AND estado IN ('pendente', 'processando')", (lote_id,)
+            ).fetchone()[0]
+            if not restantes:
+                conn.execute(
+                    "UPDATE lotes SET estado = 'concluido', concluido_em = ? WHERE id = ? AND estado = 'processando'",
+                    (agora, lote_id),
+                )
+
+    async def _aguardar_item(self):
+        proxima = await asyncio.to_thread(self._proxima_disponibilidade)
+        espera = 60.0 if proxima is None else min(max(proxima - time.time(), 0.1), 60.0)
+        if self._sem_vaga:
+            # A vaga pode ser liberada por outro worker, que não avisa este processo
+            espera = min(espera, 1.0)
+        self._novo_item.clear()
+        try:
+            await asyncio.wait_for(self._novo_item.wait(), espera)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _trabalhar(self, indice):
+        while True:
+            try:
+                item = await asyncio.to_thread(self._reservar_item)
+            except Exception as e:
+                print(f"Lotes: erro ao buscar item (trabalhador {indice}): {str(e)}")
+                await asyncio.sleep(self.espera_base)
+                continue
+            if item is None:
+                await self._aguardar_item()
+                continue
+            await self._processar(*item)
+
+    async def _processar(self, item_id, *item):
+        renovacao = asyncio.create_task(self._manter_reserva(item_id))
+        try:
+            await self._executar_item(item_id, *item)
+        finally:
+            renovacao.cancel()
+
+    async def _executar_item(self, item_id, lote_id, pergunta, tentativas, thinkkn, max_tentativas, dono=""):
+        tentativa = tentativas + 1
+        try:
+            resposta = await self.responder(pergunta, bool(thinkkn), dono)
+        except asyncio.CancelledError:
+            # Encerramento: o item volta para a fila sem gastar a tentativa
+            await asyncio.to_thread(self._finalizar_item, item_id, lote_id, "pendente", devolver_tentativa=True)
+            raise
+        except FilaCheia as e:
+            # Fila interativa cheia: esperar e tentar de novo sem gastar a tentativa
+            await asyncio.to_thread(
+                self._finalizar_item, item_id, lote_id, "pendente",
+                disponivel_em=time.time() + e.retry_after, devolver_tentativa=True
+            )
+            return
+        except Exception as e:
+            erro = str(getattr(e, "detail", e)) or type(e).__name__
+            if tentativa < max_tentativas:
+                espera = self.espera_base * 2 ** (tentativa - 1)
+                print(f"Lotes: item {item_id} falhou (tentativa {tentativa}/{max_tentativas}); nova tentativa em {espera:.0f}s: {erro}")
+                await asyncio.to_thread(
+                    self._finalizar_item, item_id, lote_id, "pendente", erro=erro, disponivel_em=time.time() + espera
+                )
+            else:
+                print(f"Lotes: item {item_id} falhou após {tentativa} tentativas: {erro}")
+                await asyncio.to_thread(self._finalizar_item, item_id, lote_id, "falhou", erro=erro)
+                self._avisar(lote_id)
+            return
+        await asyncio.to_thread(self._finalizar_item, item_id, lote_id, "concluido", resposta=resposta)
+        self.processados += 1
+        self._avisar(lote_id)
+
+    def _avisar(self, lote_id):
+        evento = self._avisos.pop(lote_id, None)
+        if evento is not None:
+            evento.set()
+
+    # Resultados em NDJSON conforme os itens terminam; encerra quando o lote termina
+    async def acompanhar(self, lote_id, depois=0):
+        while True:
+            evento = self._avisos.setdefault(lote_id, asyncio.Event())
+            # O lote é lido antes dos resultados: se ele já terminou, nenhum item finalizado fica de fora
+            lote = await asyncio.to_thread(self.obter, lote_id)
+            if lote is None:
+                return
+            resultados = await asyncio.to_thread(self.resultados, lote_id, depois)
+            for resultado in resultados:
+                depois = resultado["ordem"]
+                yield {"item": resultado}
+            if len(resultados) == 100:
+                continue
+            if lote["estado"] in ("concluido", "cancelado") and not lote["itens"]["processando"]:
+                yield {"lote": lote}
+                return
+            yield {"progresso": lote["progresso"], "itens": lote["itens"]}
+            try:
+                await asyncio.wait_for(evento.wait(), 15)
+            except asyncio.TimeoutError:
+                pass
+
+    def estatisticas(self):
+        with self.pool.conexao() as conn:
+            itens = dict(conn.execute("SELECT estado, COUNT(*) FROM itens_lote GROUP BY estado").fetchall())
+            lotes = dict(conn.execute("SELECT estado, COUNT(*) FROM lotes GROUP BY estado").fetchall())
+        return {
+            "trabalhadores": self.trabalhadores,
+            "processados": self.processados,
+            "lotes": lotes,
+            "itens": itens,
+        }
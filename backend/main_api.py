@@ -1,19 +1,40 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Response, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Response, Request, Header, Depends
 from pydantic import BaseModel
 import os
-import requests
 import json
 from fastapi.middleware.cors import CORSMiddleware
 import sys
-import shutil
-import tempfile
 from typing import Optional, AsyncGenerator
-import io
 from fastapi.responses import StreamingResponse
-import aiohttp
 import asyncio
-import uuid
 import pathlib
+import re
+import secrets
+from contextlib import asynccontextmanager
+
+from pool_ollama import PoolOllama, SemBackendDisponivel
+from aquecimento import GerenciadorModelos
+from agendador import Agendador, FilaCheia, TempoEsperaExcedido, PRIORIDADE_INTERATIVA, PRIORIDADE_LOTE
+from cache_respostas import CacheRespostas, gerar_chave
+from cache_semantico import CacheSemantico, gerar_escopo
+from coalescencia import Coalescedor, normalizar_texto
+from sessoes import GerenciadorSessoes, SessaoDeOutroUsuario
+from extracao import PoolExtracao, TempoExtracaoExcedido, LIBS_DISPONÍVEIS
+from ingestao import receber_upload, LimiteUploadMiddleware
+from cache_extracao import CacheExtracao, SUFIXOS_TIPO
+from documentos import DocumentoGrandeDemais, PipelineDocumento, SYSTEM_PROMPT_MAP
+from indice_busca import IndiceBusca
+from orcamento_tokens import OrcamentoTokens, PromptGrandeDemais, CARACTERES_POR_TOKEN
+from data_manager import listar_inqueritos, pool_conexoes, salvar_inqueritos, inqueritos_vencendo, inqueritos_vencidos, obter_inqueritos
+from models import criar_banco_dados, encerrar_engines
+from historico import HistoricoConversas
+from lotes import GerenciadorLotes, LimiteLotes, preencher_modelo
+from cancelamento import ler_prazo, timeout_upstream, executar_com_prazo, limitar_prazo, PrazoExcedido, ClienteDesconectado
+from relay_ndjson import DivisorLinhas, AgrupadorTokens, ler_chunks, carregar_json, frame_ndjson, ErroJSON
+from config_manager import obter_config, workers_servidor
+from diagnostico import MonitorLoop, Perfilador, TemposRotas, TempoRotasMiddleware, PerfilEmAndamento, ORDENACOES_CPROFILE
+import time
+import metricas
 
 # AQUI DEFINIMOS EXPLICITAMENTE AS VARIÁVEIS ANTES DE QUALQUER CARREGAMENTO
 # Configuração FIXA do Ollama - SEMPRE vai usar esses valores independente do .env
@@ -24,42 +45,106 @@ OLLAMA_MODEL = "deepseek-r1:32b"  # Forçado explicitamente - NUNCA será sobres
 # DEPOIS carregamos .env apenas para outras variáveis
 from dotenv import load_dotenv
 
-# Bibliotecas para processar diferentes tipos de arquivos
-try:
-    import PyPDF2  # Para arquivos PDF
-    import docx    # Para arquivos DOCX
-    import openpyxl # Para arquivos XLSX
-    LIBS_DISPONÍVEIS = True
-except ImportError:
-    LIBS_DISPONÍVEIS = False
-    print("Aviso: Algumas bibliotecas para processamento de arquivos não estão instaladas.")
-    print("Para usar todas as funcionalidades, instale: pip install pypdf2 python-docx openpyxl")
-
-# Tentar carregar variáveis de ambiente de múltiplos locais possíveis
-ENV_PATHS = [
-    ".env",                                           # No diretório atual
-    "../.env",                                        # No diretório pai
-    os.path.join(os.path.dirname(__file__), "../.env"), # No diretório pai relativo a este arquivo
-    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../.env"), # Caminho absoluto
-    "/mnt/projetos_nexor/Servidor_Nexortech/Projetos/GPTPOL_OLLAMA/.env"  # Caminho completo
+# Variáveis de ambiente do .env (GPTPOL_ENV aponta outro arquivo): primeiro o do backend, depois o da raiz
+# do projeto. Variáveis já definidas no ambiente têm prioridade
+DIRETORIO_BACKEND = os.path.dirname(os.path.abspath(__file__))
+ENV_PATHS = [os.getenv("GPTPOL_ENV")] if os.getenv("GPTPOL_ENV") else [
+    os.path.join(DIRETORIO_BACKEND, ".env"),
+    os.path.join(os.path.dirname(DIRETORIO_BACKEND), ".env"),
 ]
+ENV_CARREGADO = next((env_path for env_path in ENV_PATHS if load_dotenv(env_path)), None)
+
+# Cliente Ollama compartilhado (pool de conexões keep-alive durante toda a vida da aplicação).
+# As gerações são distribuídas entre os servidores de [OLLAMA] ollama_backends (padrão: OLLAMA_API_BASE)
+cliente_ollama = PoolOllama(obter_config("OLLAMA", "OLLAMA_BACKENDS", OLLAMA_API_BASE))
+
+# Modelos pré-carregados no startup e mantidos na memória do Ollama (keep_alive)
+gerenciador_modelos = GerenciadorModelos(
+    cliente_ollama,
+    [modelo.strip() for modelo in obter_config("AQUECIMENTO", "AQUECIMENTO_MODELOS", OLLAMA_MODEL).split(",") if modelo.strip()]
+)
+
+# Agendador que limita as gerações simultâneas e mantém a fila de espera
+agendador = Agendador()
+
+# Cache de respostas para perguntas idênticas (memória + SQLite opcional)
+cache_respostas = CacheRespostas()
+
+# Cache semântico: paráfrases de perguntas já respondidas (similaridade dos embeddings do Ollama)
+cache_semantico = CacheSemantico(cliente_ollama)
+
+# Geração única para perguntas idênticas em andamento (as demais requisições assinam o mesmo streaming)
+coalescedor = Coalescedor()
+
+# Sessões de conversa: guardam o "context" do Ollama entre turnos
+sessoes = GerenciadorSessoes()
+
+# Pool de processos para extração de texto dos uploads (fora do event loop)
+pool_extracao = PoolExtracao()
+
+# Cache do texto extraído, indexado pelo SHA-256 do documento
+cache_extracao = CacheExtracao()
+
+# Diagnóstico do worker: atraso e travamentos do event loop, perfis sob demanda e tempo por rota
+monitor_loop = MonitorLoop()
+perfilador = Perfilador()
+tempos_rotas = TemposRotas()
 
-env_loaded = False
-for env_path in ENV_PATHS:
-    if os.path.exists(env_path):
-        print(f"Carregando variáveis de ambiente de: {env_path}")
-        load_dotenv(env_path)
-        env_loaded = True
-        break
+# Índice de busca (BM25) sobre os documentos enviados e os inquéritos
+indice_busca = IndiceBusca()
 
-if not env_loaded:
-    print("Aviso: Arquivo .env não encontrado. Usando valores padrão.")
+# Orçamento de tokens: num_ctx/num_predict escolhidos por requisição, com corte de anexos e histórico
+orcamento_tokens = OrcamentoTokens()
 
-print(f"URL da API Ollama: {OLLAMA_API_URL}")
-print(f"Modelo Ollama: {OLLAMA_MODEL}")
+# Preparação única do armazenamento: tabelas, índices e itens de lote interrompidos voltando à fila.
+# Com vários workers o lançador (servidor.py) chama esta função uma vez antes de iniciá-los
+def preparar_armazenamento():
+    criar_banco_dados()
+    historico_conversas.abrir()
+    gerenciador_lotes.abrir()
+
+# Ciclo de vida da aplicação: cada worker cria os seus recursos (pools, caches, conexões) no startup e
+# os libera no shutdown; nada disso é criado na importação do módulo
+@asynccontextmanager
+async def lifespan(app):
+    print(f"Worker {os.getpid()} iniciando ({workers_servidor()} workers no servidor)")
+    print(f"Variáveis de ambiente: {ENV_CARREGADO or 'arquivo .env não encontrado, usando valores padrão'}")
+    print(f"URL da API Ollama: {OLLAMA_API_URL}")
+    print(f"Modelo Ollama: {OLLAMA_MODEL}")
+    print(f"Diretório de uploads: {UPLOAD_DIR}")
+    if chave_admin() is None:
+        print("Aviso: GPTPOL_ADMIN_KEY não definida; as rotas administrativas respondem 503")
+    if chave_servico() is None:
+        print("Aviso: GPTPOL_SERVICO_KEY não definida; somente o administrador acessa as rotas por usuário")
+    monitor_loop.iniciar()
+    await cliente_ollama.iniciar()
+    gerenciador_modelos.iniciar()
+    cache_respostas.iniciar()
+    pool_extracao.iniciar()
+    await cache_extracao.iniciar()
+    await asyncio.to_thread(indice_busca.abrir)
+    if workers_servidor() == 1:
+        await asyncio.to_thread(preparar_armazenamento)
+    gerenciador_lotes.iniciar()
+    try:
+        yield
+    finally:
+        await gerenciador_lotes.encerrar()
+        await historico_conversas.encerrar()
+        indice_busca.fechar()
+        pool_extracao.encerrar()
+        cache_respostas.encerrar()
+        await gerenciador_modelos.encerrar()
+        await cliente_ollama.encerrar()
+        pool_conexoes.fechar()
+        encerrar_engines()
+        await monitor_loop.encerrar()
 
 # App FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Limite de tamanho aplicado enquanto o corpo do upload ainda está chegando
+app.add_middleware(LimiteUploadMiddleware, caminhos=["/api/upload", "/upload-file"])
 
 app.add_middleware(
     CORSMiddleware,
@@ -69,113 +154,337 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Mais externo: mede a requisição inteira, incluindo os demais middlewares
+app.add_middleware(TempoRotasMiddleware, tempos=tempos_rotas)
+
 # Configuração da pasta para uploads temporários
-UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+UPLOAD_DIR = os.path.join(DIRETORIO_BACKEND, "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-print(f"Diretório de uploads: {UPLOAD_DIR}")
 
 # Modelo da requisição
 class Pergunta(BaseModel):
     pergunta: str
     thinkknMode: bool = False
+    sessao_id: Optional[str] = None  # Identificador da conversa (turnos seguintes reaproveitam o contexto)
+
+# Proteção das rotas administrativas. A chave vem do ambiente (GPTPOL_ADMIN_KEY, ou API_KEY / [API] api_key
+# para instalações antigas); sem chave definida, ou com o valor de exemplo, as rotas ficam indisponíveis
+CHAVE_ADMIN_EXEMPLO = "sua-chave-api"
+
+def chave_admin():
+    chave = os.getenv("GPTPOL_ADMIN_KEY") or obter_config("API", "API_KEY")
+    if not chave or chave.strip() == CHAVE_ADMIN_EXEMPLO:
+        return None
+    return chave.strip()
+
+# Chave de serviço do frontend: o servidor Next.js autentica o usuário (Clerk) e repassa o id dele em
+# X-Usuario junto com esta chave em X-Servico-Key. Sem a chave, X-Usuario não identifica ninguém
+def chave_servico():
+    chave = os.getenv("GPTPOL_SERVICO_KEY") or obter_config("API", "SERVICO_KEY")
+    return chave.strip() if chave and chave.strip() else None
+
+def chave_confere(recebida, chave):
+    return bool(recebida) and chave is not None and secrets.compare_digest(recebida.encode("utf-8"), chave.encode("utf-8"))
+
+def verificar_admin(x_api_key: Optional[str] = Header(None)):
+    chave = chave_admin()
+    if chave is None:
+        raise HTTPException(status_code=503, detail="Rotas administrativas desativadas: defina GPTPOL_ADMIN_KEY no ambiente.")
+    if not chave_confere(x_api_key, chave):
+        raise HTTPException(status_code=403, detail="Acesso administrativo negado.")
+
+# Identidade de quem chama: (usuario, admin). O administrador (X-API-Key) pode agir por um usuário
+# informando X-Usuario; os demais precisam da chave de serviço junto com X-Usuario
+def identificar_cliente(x_api_key: Optional[str] = Header(None), x_servico_key: Optional[str] = Header(None),
+                        x_usuario: Optional[str] = Header(None)):
+    usuario = (x_usuario or "").strip()
+    if chave_confere(x_api_key, chave_admin()):
+        return usuario, True
+    if usuario and chave_confere(x_servico_key, chave_servico()):
+        return usuario, False
+    if chave_admin() is None and chave_servico() is None:
+        raise HTTPException(status_code=503, detail="Rotas autenticadas desativadas: defina GPTPOL_ADMIN_KEY ou GPTPOL_SERVICO_KEY.")
+    raise HTTPException(status_code=401, detail="Identificação obrigatória: X-API-Key, ou X-Usuario com X-Servico-Key.")
+
+# Identidade em uma rota aberta (perguntas, uploads): as mesmas regras de identificar_cliente, ou None (anônimo)
+def identidade_requisicao(request):
+    try:
+        return identificar_cliente(
+            request.headers.get("X-API-Key"), request.headers.get("X-Servico-Key"), request.headers.get("X-Usuario")
+        )
+    except HTTPException:
+        return None
+
+# Usuário identificado de uma rota aberta, ou "" (anônimo)
+def usuario_requisicao(request):
+    identidade = identidade_requisicao(request)
+    return identidade[0] if identidade else ""
+
+# Dono dos documentos que a requisição pode consultar no índice de busca: o usuário identificado, ou None
+# para anônimos (sem passagens de documentos nem de inquéritos)
+def dono_busca(request):
+    identidade = identidade_requisicao(request)
+    return identidade[0] if identidade else None
+
+# Sessão da pergunta, vinculada ao usuário que a abriu (o contexto e o histórico não passam para outro usuário)
+def obter_sessao(sessao_id, usuario):
+    if not sessao_id:
+        return None
+    try:
+        return sessoes.obter_ou_criar(sessao_id, usuario)
+    except SessaoDeOutroUsuario:
+        raise HTTPException(status_code=403, detail="Sessão de outro usuário.")
+
+# Pergunta sobre um documento completo (enviado antes por /upload-file ou com o texto no corpo)
+class PerguntaDocumento(BaseModel):
+    pergunta: str
+    documento_id: Optional[str] = None
+    texto: Optional[str] = None
+    thinkknMode: bool = False
 
 # Rota raiz
 @app.get("/")
 async def root():
     return {"message": "API GPTPOL está ativa."}
 
-# Função para extrair texto de um arquivo PDF
-def extrair_texto_pdf(arquivo):
-    try:
-        pdf_reader = PyPDF2.PdfReader(arquivo)
-        texto = ""
-        for pagina in range(len(pdf_reader.pages)):
-            texto += pdf_reader.pages[pagina].extract_text() + "\n"
-        return texto
-    except Exception as e:
-        print(f"Erro ao processar PDF: {e}")
-        return f"Erro ao processar PDF: {str(e)}"
+# Saúde do processo (liveness)
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
 
-# Função para extrair texto de um arquivo DOCX
-def extrair_texto_docx(arquivo):
-    try:
-        doc = docx.Document(arquivo)
-        texto = ""
-        for paragrafo in doc.paragraphs:
-            texto += paragrafo.text + "\n"
-        return texto
-    except Exception as e:
-        print(f"Erro ao processar DOCX: {e}")
-        return f"Erro ao processar DOCX: {str(e)}"
+# Prontidão (readiness): 200 só quando os modelos estão carregados em algum servidor Ollama saudável
+@app.get("/health/ready")
+async def health_ready(response: Response):
+    estado = gerenciador_modelos.estatisticas()
+    if not estado["pronto"]:
+        response.status_code = 503
+    return estado
 
-# Função para extrair texto de um arquivo XLSX
-def extrair_texto_xlsx(arquivo):
-    try:
-        workbook = openpyxl.load_workbook(arquivo)
-        texto = ""
-        for planilha in workbook.sheetnames:
-            sheet = workbook[planilha]
-            texto += f"Planilha: {planilha}\n"
-            for linha in sheet.iter_rows(values_only=True):
-                texto += " | ".join([str(celula) if celula is not None else "" for celula in linha]) + "\n"
-            texto += "\n"
-        return texto
-    except Exception as e:
-        print(f"Erro ao processar XLSX: {e}")
-        return f"Erro ao processar XLSX: {str(e)}"
-
-# Função para processar arquivos enviados
-def processar_arquivo(arquivo, tipo_arquivo):
-    if tipo_arquivo == "application/pdf":
-        return extrair_texto_pdf(arquivo)
-    elif tipo_arquivo in ["application/msword", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
-        return extrair_texto_docx(arquivo)
-    elif tipo_arquivo in ["application/vnd.ms-excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"]:
-        return extrair_texto_xlsx(arquivo)
-    elif tipo_arquivo == "text/plain":
-        return arquivo.read().decode("utf-8")
-    else:
-        return "Tipo de arquivo não suportado."
+# Parâmetros de geração do Ollama (também fazem parte da chave do cache de respostas)
+OPCOES_OLLAMA = {
+    "num_ctx": 4096,           # Contexto padrão (o orçamento de tokens escolhe a faixa por requisição)
+    "num_thread": 8,           # Reduzido para adequar ao modelo menor
+    "temperature": 0.7,        # Temperatura padrão
+    "top_k": 40,               # Valor padrão
+    "top_p": 0.9,              # Valor padrão
+    "num_predict": 512,        # Tamanho razoável para resposta
+    "repeat_penalty": 1.1,     # Penalidade leve para repetição
+    "stop": ["<|end|>", "<|user|>"]  # Tokens de fim específicos para DeepSeek
+}
+
+# No streaming as respostas podem ser mais longas
+OPCOES_OLLAMA_STREAM = {
+    **OPCOES_OLLAMA,
+    "num_predict": 2048,       # Aumentando para respostas mais completas
+}
 
 # Função para gerar respostas via Ollama
-def gerar_resposta_ollama(prompt):
+async def gerar_resposta_ollama(prompt, opcoes=None, sessao=None, timeout=60):
     try:
         payload = {
             "model": OLLAMA_MODEL,
             "prompt": prompt,
             "stream": False,
-            "options": {
-                "num_ctx": 4096,           # Contexto para DeepSeek 14B
-                "num_thread": 8,           # Reduzido para adequar ao modelo menor
-                "temperature": 0.7,        # Temperatura padrão
-                "top_k": 40,               # Valor padrão
-                "top_p": 0.9,              # Valor padrão
-                "num_predict": 512,        # Tamanho razoável para resposta
-                "repeat_penalty": 1.1,     # Penalidade leve para repetição
-                "stop": ["<|end|>", "<|user|>"]  # Tokens de fim específicos para DeepSeek
-            }
+            "options": opcoes or OPCOES_OLLAMA,
+            "keep_alive": gerenciador_modelos.valor_keep_alive()
         }
+        if sessao is not None and sessao.contexto:
+            payload["context"] = sessao.contexto
         
         print(f"Enviando requisição ao modelo {OLLAMA_MODEL}")
-        # Aumentando timeout para 60 segundos (1 minuto) - modelo menor é mais rápido
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=60)
+        inicio = time.perf_counter()
+        # Timeout padrão de 60 segundos (1 minuto); as rotas com prazo passam o prazo da requisição
+        status, result = await cliente_ollama.gerar(payload, timeout=timeout)
         
-        if response.status_code == 200:
-            result = response.json()
+        if status == 200:
+            metricas.DURACAO_GERACAO.observar(time.perf_counter() - inicio, modelo=OLLAMA_MODEL, modo="completo")
+            metricas.registrar_frame_final(OLLAMA_MODEL, result)
+            if sessao is not None:
+                sessoes.atualizar_contexto(sessao, result.get("context"))
             return result.get("response", "Não foi possível gerar uma resposta.")
         else:
-            print(f"Erro Ollama: Status {response.status_code}")
-            raise HTTPException(status_code=response.status_code, detail=f"Erro ao conectar com o modelo: {response.status_code}")
-    except requests.exceptions.Timeout:
+            print(f"Erro Ollama: Status {status}")
+            metricas.ERROS_UPSTREAM.incrementar(tipo="status")
+            raise HTTPException(status_code=status, detail=f"Erro ao conectar com o modelo: {status}")
+    except HTTPException:
+        raise
+    except SemBackendDisponivel as e:
+        print(str(e))
+        metricas.ERROS_UPSTREAM.incrementar(tipo="sem_backend")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except asyncio.TimeoutError:
         print("Timeout ao chamar o modelo Ollama.")
+        metricas.TIMEOUTS.incrementar(etapa="geracao")
         raise HTTPException(status_code=408, detail="Tempo limite excedido. O modelo está demorando mais do que o esperado. Por favor, tente uma pergunta mais simples ou tente novamente mais tarde.")
     except Exception as e:
         print(f"Erro ao conectar com Ollama: {str(e)}")
+        metricas.ERROS_UPSTREAM.incrementar(tipo="conexao")
         raise HTTPException(status_code=500, detail=f"Erro ao conectar com o modelo: {str(e)}")
 
+# Extrai o texto de um upload, reaproveitando o cache quando o mesmo documento já foi processado.
+# dono: usuário que enviou o arquivo (o documento entra no índice de busca só para ele; None = não indexar)
+async def extrair_texto_upload(arquivo, dono=None):
+    tipo = SUFIXOS_TIPO.get(arquivo.tipo_arquivo, "outro")
+    metricas.TAMANHO_UPLOAD.observar(arquivo.tamanho, tipo=tipo)
+    inicio = time.perf_counter()
+    texto = await cache_extracao.obter(arquivo.sha256, arquivo.tipo_arquivo)
+    if texto is not None:
+        print(f"Texto extraído encontrado no cache: {arquivo.nome} ({arquivo.sha256[:12]})")
+        metricas.DURACAO_EXTRACAO.observar(time.perf_counter() - inicio, tipo=tipo, origem="cache")
+        await indexar_documento(arquivo, texto, dono)
+        return texto
+    
+    try:
+        texto = await pool_extracao.extrair(arquivo.caminho, arquivo.tipo_arquivo)
+    except TempoExtracaoExcedido:
+        metricas.TIMEOUTS.incrementar(etapa="extracao")
+        raise
+    metricas.DURACAO_EXTRACAO.observar(time.perf_counter() - inicio, tipo=tipo, origem="extrator")
+    # Falhas de extração não são guardadas
+    if not texto.startswith("Erro ao processar"):
+        await cache_extracao.guardar(arquivo.sha256, arquivo.tipo_arquivo, texto)
+        await indexar_documento(arquivo, texto, dono)
+    return texto
+
+# Texto de um upload em frames NDJSON ({"text": ...}) conforme é extraído, terminando com {"done": true, ...}.
+# A extração para ao atingir max_caracteres; só o texto completo vai para o cache e para o índice.
+# O arquivo temporário é removido ao final (ou se o cliente desconectar).
+async def transmitir_extracao(arquivo, max_caracteres=None, dono=None):
+    tipo = SUFIXOS_TIPO.get(arquivo.tipo_arquivo, "outro")
+    tamanho_parte = obter_config("EXTRACAO", "EXTRACAO_TAMANHO_PARTE", 8000, int)
+    inicio = time.perf_counter()
+    try:
+        texto = await cache_extracao.obter(arquivo.sha256, arquivo.tipo_arquivo)
+        origem = "cache"
+        if texto is not None:
+            partes = [texto[:max_caracteres]]
+        else:
+            origem = "extrator"
+            partes = []
+            async for parte in pool_extracao.extrair_em_partes(arquivo.caminho, arquivo.tipo_arquivo, max_caracteres):
+                partes.append(parte)
+                for inicio_bloco in range(0, len(parte), tamanho_parte):
+                    yield frame_ndjson({"text": parte[inicio_bloco:inicio_bloco + tamanho_parte]})
+            texto = "".join(partes)
+        metricas.DURACAO_EXTRACAO.observar(time.perf_counter() - inicio, tipo=tipo, origem=origem)
+        truncado = max_caracteres is not None and len(texto) >= max_caracteres
+        if origem == "cache":
+            for inicio_bloco in range(0, len(partes[0]), tamanho_parte):
+                yield frame_ndjson({"text": partes[0][inicio_bloco:inicio_bloco + tamanho_parte]})
+        elif not truncado and not texto.startswith("Erro ao processar"):
+            await cache_extracao.guardar(arquivo.sha256, arquivo.tipo_arquivo, texto)
+            await indexar_documento(arquivo, texto, dono)
+        yield frame_ndjson({
+            "done": True,
+            "filename": arquivo.nome,
+            "size": arquivo.tamanho,
+            "mimetype": arquivo.tipo_arquivo,
+            "truncated": truncado,
+            # Só há documento completo para /perguntar_documento se o texto não foi cortado
+            "documento_id": None if truncado else cache_extracao.chave(arquivo.sha256, arquivo.tipo_arquivo),
+        })
+    except TempoExtracaoExcedido as e:
+        metricas.TIMEOUTS.incrementar(etapa="extracao")
+        print(f"Timeout ao processar arquivo: {str(e)}")
+        yield frame_ndjson({"error": f"Tempo limite excedido ao processar o arquivo. {str(e)}"})
+    except Exception as e:
+        print(f"Erro ao processar arquivo: {str(e)}")
+        yield frame_ndjson({"error": f"Erro ao processar arquivo: {str(e)}"})
+    finally:
+        arquivo.remover()
+
+# Adiciona o documento ao índice de busca do usuário que o enviou (o mesmo conteúdo só é indexado uma vez
+# por usuário). Uploads anônimos não são indexados: nenhuma busca anônima consulta o índice
+async def indexar_documento(arquivo, texto, dono=None):
+    if dono is None:
+        return
+    documento_id = f"{cache_extracao.chave(arquivo.sha256, arquivo.tipo_arquivo)}@{dono}"
+    try:
+        if not await asyncio.to_thread(indice_busca.contem, documento_id):
+            await indice_busca.adicionar_async(documento_id, texto, origem="upload", titulo=arquivo.nome, dono=dono)
+            print(f"Documento indexado para busca: {arquivo.nome} ({documento_id})")
+    except Exception as e:
+        # Falha no índice não impede o upload
+        print(f"Erro ao indexar documento: {str(e)}")
+
+# Busca no índice as passagens mais relevantes para a pergunta (da mais para a menos relevante), entre os
+# documentos do dono e os inquéritos. Requisições anônimas (dono None) não recebem passagens
+async def recuperar_passagens(pergunta, dono=None):
+    if dono is None or not obter_config("BUSCA", "BUSCA_ATIVA", True, bool):
+        return []
+    try:
+        passagens = await indice_busca.buscar_async(pergunta, obter_config("BUSCA", "BUSCA_TOP_K", 4, int), dono)
+    except Exception as e:
+        print(f"Erro ao buscar no índice: {str(e)}")
+        return []
+    minimo = obter_config("BUSCA", "BUSCA_PONTUACAO_MINIMA", 1.0, float)
+    return [
+        f"[{passagem['titulo'] or passagem['documento_id']}]\n{passagem['texto']}"
+        for passagem in passagens
+        if passagem["pontuacao"] >= minimo
+    ]
+
+# Coloca as passagens recuperadas antes da pergunta
+def montar_pergunta(pergunta, passagens):
+    if not passagens:
+        return pergunta
+    contexto = "\n\n".join(passagens)
+    return f"Contexto relevante (trechos de documentos e inquéritos):\n{contexto}\n\nPergunta: {pergunta}"
+
+# Monta o prompt dentro do orçamento de tokens e devolve as opções (num_ctx/num_predict) da requisição.
+# Se não couber, as passagens menos relevantes são cortadas primeiro e o histórico da sessão por último.
+# A memória (resumo + mensagens recentes da conversa) entra junto com as instruções de sistema.
+def montar_prompt_orcado(system_prompt, pergunta, passagens, opcoes_base, sessao=None, memoria=None):
+    if memoria:
+        system_prompt = f"{system_prompt}\n\n{memoria}"
+    plano = orcamento_tokens.planejar(
+        f"<|system|>\n{system_prompt}\n<|user|>\n{pergunta}\n<|assistant|>\n",
+        passagens,
+        opcoes_base["num_predict"],
+        sessao.tamanho if sessao is not None else 0,
+    )
+    if not plano.manter_historico:
+        print(f"Histórico da sessão {sessao.id} descartado para caber no contexto")
+        sessoes.reiniciar_contexto(sessao)
+    print(f"Orçamento de tokens: {plano.descricao()}")
+    
+    conteudo = montar_pergunta(pergunta, plano.anexos)
+    # Formato validado para DeepSeek-R1. Em sessões, nos turnos seguintes o contexto do Ollama já
+    # contém o histórico, então só a nova mensagem do usuário é enviada para avaliação
+    if sessao is not None and sessao.tamanho:
+        prompt = f"<|user|>\n{conteudo}\n<|assistant|>\n"
+    else:
+        prompt = f"<|system|>\n{system_prompt}\n<|user|>\n{conteudo}\n<|assistant|>\n"
+    return prompt, plano.opcoes(opcoes_base)
+
+# Memória da conversa para um turno de sessão. O contexto do Ollama cresce a cada turno: acima do limite
+# ele é descartado e o turno recomeça do resumo acumulado e das mensagens recentes do histórico.
+async def carregar_memoria_conversa(sessao):
+    if sessao is None or not historico_conversas.ativo:
+        return None
+    if sessao.tamanho > historico_conversas.max_tokens_contexto:
+        print(f"Contexto da sessão {sessao.id} com {sessao.tamanho} tokens; recomeçando do resumo da conversa")
+        sessoes.reiniciar_contexto(sessao)
+    if sessao.tamanho:
+        return None
+    try:
+        return await historico_conversas.memoria_async(sessao.id, sessao.dono)
+    except Exception as e:
+        print(f"Erro ao carregar o histórico da conversa {sessao.id}: {str(e)}")
+        return None
+
+# Guarda o turno no histórico do dono da sessão (falhas no histórico não afetam a resposta)
+async def registrar_turno_conversa(sessao, pergunta, resposta):
+    if not historico_conversas.ativo:
+        return
+    try:
+        await historico_conversas.registrar_turno_async(sessao.id, pergunta, resposta, sessao.dono)
+    except Exception as e:
+        print(f"Erro ao guardar o histórico da conversa {sessao.id}: {str(e)}")
+
 # Rota para upload de arquivos
 @app.post("/api/upload")
-async def upload_arquivo(file: UploadFile = File(...)):
+async def upload_arquivo(request: Request, file: UploadFile = File(...)):
     try:
         # Verificar se as bibliotecas necessárias estão disponíveis
         if not LIBS_DISPONÍVEIS:
@@ -195,38 +504,33 @@ async def upload_arquivo(file: UploadFile = File(...)):
         if tipo_arquivo not in tipos_permitidos:
             raise HTTPException(status_code=400, detail=f"Tipo de arquivo não suportado: {tipo_arquivo}")
         
-        # Criar arquivo temporário para processar
-        with tempfile.NamedTemporaryFile(delete=False) as temp:
-            shutil.copyfileobj(file.file, temp)
-            temp_path = temp.name
+        # Copiar em blocos para um arquivo temporário, com limite de tamanho e conferência do conteúdo
+        arquivo = await receber_upload(file, UPLOAD_DIR)
         
         try:
-            # Processar o arquivo baseado no tipo
-            if tipo_arquivo == "application/pdf":
-                with open(temp_path, "rb") as f:
-                    texto = extrair_texto_pdf(f)
-            elif tipo_arquivo in ["application/msword", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
-                texto = extrair_texto_docx(temp_path)
-            elif tipo_arquivo in ["application/vnd.ms-excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"]:
-                texto = extrair_texto_xlsx(temp_path)
-            elif tipo_arquivo == "text/plain":
-                with open(temp_path, "r", encoding="utf-8") as f:
-                    texto = f.read()
-            else:
-                texto = "Tipo de arquivo não suportado."
+            # Processar o arquivo baseado no tipo (no pool de processos, ou direto do cache)
+            texto = await extrair_texto_upload(arquivo, dono_busca(request))
             
             return {"text": texto, "filename": file.filename}
         finally:
             # Remover arquivo temporário
-            os.unlink(temp_path)
+            arquivo.remover()
             
+    except HTTPException:
+        raise
+    except TempoExtracaoExcedido as e:
+        print(f"Timeout ao processar arquivo: {str(e)}")
+        raise HTTPException(status_code=408, detail=f"Tempo limite excedido ao processar o arquivo. {str(e)}")
     except Exception as e:
         print(f"Erro ao processar arquivo: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar arquivo: {str(e)}")
 
 # Nova rota para upload de arquivos (compatível com o frontend atualizado)
+# Com stream=true o texto é enviado em NDJSON conforme é extraído; max_caracteres (ou max_tokens)
+# encerra a extração assim que o orçamento do cliente é atingido
 @app.post("/upload-file")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(request: Request, file: UploadFile = File(...), stream: bool = False,
+                      max_caracteres: Optional[int] = None, max_tokens: Optional[int] = None):
     try:
         # Verificar se as bibliotecas necessárias estão disponíveis
         if not LIBS_DISPONÍVEIS:
@@ -252,14 +556,6 @@ async def upload_file(file: UploadFile = File(...)):
                 detail=f"Tipo de arquivo não suportado: {tipo_arquivo}. Formatos aceitos: PDF, DOC, DOCX, TXT, XLS, XLSX."
             )
         
-        # Verificar tamanho do arquivo (limite de 10MB)
-        contents = await file.read()
-        if len(contents) > 10 * 1024 * 1024:  # 10MB
-            raise HTTPException(
-                status_code=400, 
-                detail="Arquivo muito grande. O limite é de 10MB."
-            )
-        
         # Extrair extensão do arquivo
         extensao = pathlib.Path(file.filename).suffix.lower()
         extensoes_permitidas = [".pdf", ".doc", ".docx", ".txt", ".xls", ".xlsx"]
@@ -270,33 +566,26 @@ async def upload_file(file: UploadFile = File(...)):
                 detail=f"Extensão de arquivo não permitida: {extensao}. Extensões aceitas: .pdf, .doc, .docx, .txt, .xls, .xlsx"
             )
         
-        # Criar diretório de upload temporário
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        
-        # Gerar nome de arquivo único para evitar colisões
-        nome_arquivo_seguro = f"{uuid.uuid4()}{extensao}"
-        caminho_arquivo = os.path.join(UPLOAD_DIR, nome_arquivo_seguro)
+        # Gravar o arquivo em blocos no diretório de upload, verificando o tamanho (limite de 10MB)
+        # durante a cópia e conferindo os bytes iniciais com o tipo declarado
+        arquivo = await receber_upload(file, UPLOAD_DIR, extensao)
         
-        # Gravar arquivo temporariamente
-        with open(caminho_arquivo, "wb") as f:
-            f.write(contents)
+        if stream:
+            if max_tokens is not None:
+                limite_tokens = max_tokens * CARACTERES_POR_TOKEN
+                max_caracteres = limite_tokens if max_caracteres is None else min(max_caracteres, limite_tokens)
+            # O gerador remove o arquivo temporário quando termina
+            return StreamingResponse(
+                transmitir_extracao(
+                    arquivo, max(max_caracteres, 1) if max_caracteres is not None else None, dono_busca(request)
+                ),
+                media_type="application/x-ndjson"
+            )
         
         try:
-            # Resetar o arquivo lido para a posição inicial
-            file.file = io.BytesIO(contents)
-            
-            # Processar o arquivo baseado no tipo
-            texto = ""
-            if tipo_arquivo == "application/pdf":
-                with open(caminho_arquivo, "rb") as f:
-                    texto = extrair_texto_pdf(f)
-            elif tipo_arquivo in ["application/msword", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"]:
-                texto = extrair_texto_docx(caminho_arquivo)
-            elif tipo_arquivo in ["application/vnd.ms-excel", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"]:
-                texto = extrair_texto_xlsx(caminho_arquivo)
-            elif tipo_arquivo == "text/plain":
-                with open(caminho_arquivo, "r", encoding="utf-8") as f:
-                    texto = f.read()
+            # Processar o arquivo baseado no tipo (cache por conteúdo, senão no pool de processos
+            # com PDFs grandes divididos por páginas)
+            texto = await extrair_texto_upload(arquivo, dono_busca(request))
             
             # Limitar o tamanho do texto retornado
             max_chars = 15000  # Limitar para ~15k caracteres
@@ -304,30 +593,33 @@ async def upload_file(file: UploadFile = File(...)):
                 texto = texto[:max_chars] + f"\n\n[Texto truncado devido ao tamanho. O documento original contém {len(texto)} caracteres.]"
             
             # Registrar log de processamento bem-sucedido
-            print(f"Arquivo processado com sucesso: {file.filename} ({tipo_arquivo}, {len(contents)} bytes)")
+            print(f"Arquivo processado com sucesso: {file.filename} ({tipo_arquivo}, {arquivo.tamanho} bytes)")
             
             return {
                 "text": texto,
                 "filename": file.filename,
-                "size": len(contents),
-                "mimetype": tipo_arquivo
+                "size": arquivo.tamanho,
+                "mimetype": tipo_arquivo,
+                # Permite perguntar sobre o documento completo em /perguntar_documento
+                "documento_id": cache_extracao.chave(arquivo.sha256, tipo_arquivo)
             }
             
         finally:
             # Remover arquivo temporário após o processamento
-            if os.path.exists(caminho_arquivo):
-                os.unlink(caminho_arquivo)
-                print(f"Arquivo temporário removido: {caminho_arquivo}")
+            arquivo.remover()
     
     except HTTPException as e:
         # Repassar exceções HTTP já formatadas
         raise e
+    except TempoExtracaoExcedido as e:
+        print(f"Timeout ao processar arquivo: {str(e)}")
+        raise HTTPException(status_code=408, detail=f"Tempo limite excedido ao processar o arquivo. {str(e)}")
     except Exception as e:
         print(f"Erro ao processar arquivo: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar arquivo: {str(e)}")
 
 # Função para gerar respostas via Ollama com streaming
-async def gerar_resposta_ollama_stream(prompt, is_thinkkn_mode=False):
+async def gerar_resposta_ollama_stream(prompt, is_thinkkn_mode=False, opcoes=None, chave_cache=None, sessao=None, timeout=120, ao_concluir=None):
     try:
         # Sempre iniciar com <think> para modo de pensamento
         if is_thinkkn_mode:
@@ -338,106 +630,174 @@ async def gerar_resposta_ollama_stream(prompt, is_thinkkn_mode=False):
             "model": OLLAMA_MODEL,
             "prompt": prompt,
             "stream": True,  # Habilitando streaming
-            "options": {
-                "num_ctx": 4096,           # Contexto padrão
-                "num_thread": 8,           # Usar 8 threads para paralelização
-                "temperature": 0.7,        # Temperatura padrão
-                "top_k": 40,               # Valor padrão
-                "top_p": 0.9,              # Valor padrão
-                "num_predict": 2048,       # Aumentando para respostas mais completas
-                "repeat_penalty": 1.1,     # Penalidade leve para repetição
-                "stop": ["<|end|>", "<|user|>"]  # Tokens de fim específicos para DeepSeek
-            }
+            "options": opcoes or OPCOES_OLLAMA_STREAM,
+            "keep_alive": gerenciador_modelos.valor_keep_alive()
         }
+        if sessao is not None and sessao.contexto:
+            payload["context"] = sessao.contexto
         
         # IMPORTANTE: Esta função deve retornar um AsyncGenerator
-        async with aiohttp.ClientSession() as session:
-            try:
-                print(f"Iniciando streaming com o modelo {OLLAMA_MODEL}")
+        # A sessão HTTP é a do cliente compartilhado (conexões reaproveitadas entre requisições)
+        agrupador = AgrupadorTokens()
+        inicio = time.perf_counter()
+        primeiro_token = True
+        metricas.STREAMS_ATIVOS.incrementar()
+        try:
+            print(f"Iniciando streaming com o modelo {OLLAMA_MODEL}")
+            
+            # Timeout padrão de 120 segundos; as rotas com prazo passam o prazo da requisição
+            async with cliente_ollama.gerar_stream(payload, timeout=timeout) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    print(f"Erro na API do Ollama: {response.status} - {error_text}")
+                    metricas.ERROS_UPSTREAM.incrementar(tipo="status")
+                    yield json.dumps({"error": f"Erro na API do Ollama: {response.status}"}) + "\n"
+                    return
                 
-                # Usar timeout maior para modelos mais complexos
-                timeout = aiohttp.ClientTimeout(total=120)  # 120 segundos
+                # Processar o streaming: linhas divididas nos bytes e tokens agrupados por frame
+                divisor = DivisorLinhas()
+                think_mode = is_thinkkn_mode
+                # Texto completo enviado ao cliente, guardado no cache ao final
+                texto_resposta = ["<think>"] if is_thinkkn_mode else []
+                houve_erro = False
                 
-                async with session.post(
-                    OLLAMA_API_URL, 
-                    json=payload, 
-                    timeout=timeout
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        print(f"Erro na API do Ollama: {response.status} - {error_text}")
-                        yield json.dumps({"error": f"Erro na API do Ollama: {response.status}"}) + "\n"
-                        return
-                    
-                    # Processar o streaming de forma mais robusta
-                    buffer = ""
-                    think_mode = is_thinkkn_mode
-                    response_started = False
-                    
-                    async for chunk in response.content:
-                        if chunk:
-                            buffer += chunk.decode('utf-8')
-                            lines = buffer.split('\n')
-                            
-                            # Processar todas as linhas completas
-                            for i in range(len(lines) - 1):
-                                line = lines[i].strip()
-                                if line:
-                                    try:
-                                        # Cada linha é um objeto JSON
-                                        json_line = json.loads(line)
-                                        if 'response' in json_line:
-                                            token = json_line['response']
-                                            
-                                            # Detectar fim do pensamento e início da resposta
-                                            if think_mode and "</think>" in token:
-                                                think_mode = False
-                                                response_started = True
-                                            
-                                            yield json.dumps({"token": token}) + "\n"
-                                            
-                                    except json.JSONDecodeError:
-                                        print(f"Erro ao decodificar JSON: {line}")
-                                        yield json.dumps({"error": "Erro ao decodificar resposta"}) + "\n"
-                            
-                            # Manter o restante no buffer
-                            buffer = lines[-1]
-                    
-                    # Processar qualquer conteúdo restante no buffer
-                    if buffer.strip():
+                def processar_linhas(linhas):
+                    nonlocal think_mode, houve_erro, primeiro_token
+                    for linha in linhas:
                         try:
-                            json_line = json.loads(buffer)
-                            if 'response' in json_line:
-                                yield json.dumps({"token": json_line['response']}) + "\n"
-                        except json.JSONDecodeError:
-                            pass
-                    
-                    # Garantir que o pensamento seja fechado corretamente
-                    if think_mode:
-                        yield json.dumps({"token": "</think>"}) + "\n"
+                            # Cada linha é um objeto JSON
+                            json_line = carregar_json(linha)
+                        except (ErroJSON, ValueError):
+                            print(f"Erro ao decodificar JSON: {linha[:200]!r}")
+                            houve_erro = True
+                            yield frame_ndjson({"error": "Erro ao decodificar resposta"})
+                            continue
+                        
+                        # Erro no meio da geração (ex.: modelo descarregado, falta de memória): a resposta
+                        # parcial chega ao cliente, mas não vai para o cache nem para o histórico
+                        erro = json_line.get('error')
+                        if erro:
+                            print(f"Erro do Ollama durante o streaming: {erro}")
+                            metricas.ERROS_UPSTREAM.incrementar(tipo="stream")
+                            houve_erro = True
+                            frame = agrupador.esvaziar()
+                            if frame:
+                                yield frame
+                            yield frame_ndjson({"error": f"Erro na API do Ollama: {erro}"})
+                            continue
+                        
+                        token = json_line.get('response')
+                        if token:
+                            if primeiro_token:
+                                primeiro_token = False
+                                metricas.TEMPO_PRIMEIRO_TOKEN.observar(time.perf_counter() - inicio, modelo=OLLAMA_MODEL)
+                            # Detectar fim do pensamento e início da resposta
+                            if think_mode and "</think>" in token:
+                                think_mode = False
+                            
+                            texto_resposta.append(token)
+                            frame = agrupador.adicionar(token)
+                            if frame:
+                                yield frame
+                        
+                        # O frame final traz as estatísticas da geração e o contexto do próximo turno da sessão
+                        if json_line.get('done'):
+                            metricas.registrar_frame_final(OLLAMA_MODEL, json_line)
+                            if sessao is not None:
+                                sessoes.atualizar_contexto(sessao, json_line.get('context'))
                 
-                print("Streaming concluído com sucesso")
+                # Chunk None: a janela do agrupador fechou sem token novo (o modelo fez uma pausa)
+                async for chunk in ler_chunks(response.content.iter_any(), agrupador):
+                    if chunk is None:
+                        frame = agrupador.esvaziar()
+                        if frame:
+                            yield frame
+                        continue
+                    for frame in processar_linhas(divisor.alimentar(chunk)):
+                        yield frame
                 
-            except asyncio.TimeoutError:
-                print("Timeout excedido no streaming")
-                if is_thinkkn_mode:
-                    yield json.dumps({"token": "</think>"}) + "\n"
-                yield json.dumps({"error": "Tempo limite excedido. O modelo está demorando mais do que o esperado para responder. Por favor, tente uma pergunta mais simples."}) + "\n"
-            except Exception as e:
-                print(f"Erro durante o streaming: {str(e)}")
-                if is_thinkkn_mode:
-                    yield json.dumps({"token": "</think>"}) + "\n"
-                yield json.dumps({"error": f"Erro: {str(e)}"}) + "\n"
-    
+                # Processar qualquer conteúdo restante no buffer
+                for frame in processar_linhas(divisor.finalizar()):
+                    yield frame
+                frame = agrupador.esvaziar()
+                if frame:
+                    yield frame
+                
+                # Garantir que o pensamento seja fechado corretamente
+                if think_mode:
+                    texto_resposta.append("</think>")
+                    yield frame_ndjson({"token": "</think>"})
+                
+                # Guardar a resposta completa para as próximas perguntas idênticas
+                if chave_cache and not houve_erro:
+                    await cache_respostas.guardar(chave_cache, "".join(texto_resposta))
+                # Entregar a resposta completa a quem pediu (ex.: histórico da conversa)
+                if ao_concluir is not None and not houve_erro:
+                    await ao_concluir("".join(texto_resposta))
+            
+            metricas.DURACAO_GERACAO.observar(time.perf_counter() - inicio, modelo=OLLAMA_MODEL, modo="stream")
+            print("Streaming concluído com sucesso")
+            
+        except asyncio.TimeoutError:
+            print("Timeout excedido no streaming")
+            metricas.TIMEOUTS.incrementar(etapa="stream")
+            frame = agrupador.esvaziar()
+            if frame:
+                yield frame
+            if is_thinkkn_mode:
+                yield json.dumps({"token": "</think>"}) + "\n"
+            yield json.dumps({"error": "Tempo limite excedido. O modelo está demorando mais do que o esperado para responder. Por favor, tente uma pergunta mais simples."}) + "\n"
+        except Exception as e:
+            print(f"Erro durante o streaming: {str(e)}")
+            metricas.ERROS_UPSTREAM.incrementar(tipo="sem_backend" if isinstance(e, SemBackendDisponivel) else "conexao")
+            frame = agrupador.esvaziar()
+            if frame:
+                yield frame
+            if is_thinkkn_mode:
+                yield json.dumps({"token": "</think>"}) + "\n"
+            yield json.dumps({"error": f"Erro: {str(e)}"}) + "\n"
+        finally:
+            metricas.STREAMS_ATIVOS.decrementar()
+
     except Exception as e:
         print(f"Erro ao configurar streaming: {str(e)}")
         if is_thinkkn_mode:
             yield json.dumps({"token": "</think>"}) + "\n"
         yield json.dumps({"error": f"Erro: {str(e)}"}) + "\n"
 
+# Reproduz uma resposta do cache como frames de token NDJSON (mesmo protocolo do streaming)
+async def reproduzir_resposta_cache(texto):
+    for pedaco in re.findall(r"\S+\s*|\s+", texto):
+        yield json.dumps({"token": pedaco}) + "\n"
+
+# Envolve um gerador de streaming com o agendador: informa a posição na fila antes do primeiro token
+async def gerar_com_agendamento(gerador, prioridade=PRIORIDADE_INTERATIVA):
+    try:
+        reserva = agendador.reservar(prioridade)
+    except FilaCheia as e:
+        yield json.dumps({"error": str(e), "retry_after": e.retry_after}) + "\n"
+        return
+    
+    try:
+        async for posicao in reserva.posicoes():
+            yield json.dumps({"queue": {"position": posicao}}) + "\n"
+        async for linha in gerador:
+            yield linha
+    except TempoEsperaExcedido as e:
+        print(f"Requisição expirou na fila: {str(e)}")
+        yield json.dumps({"error": str(e), "retry_after": e.retry_after}) + "\n"
+    finally:
+        reserva.liberar()
+        await gerador.aclose()
+
+# Converte a rejeição do agendador em resposta HTTP com Retry-After
+def erro_agendador(e):
+    status_code = 429 if isinstance(e, FilaCheia) else 503
+    return HTTPException(status_code=status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
 # Rota que envia a pergunta para o modelo com streaming
 @app.post("/perguntar_stream")
-async def perguntar_stream(p: Pergunta):
+async def perguntar_stream(p: Pergunta, request: Request):
     try:
         # Verificar se o modo Thinkkn está ativo
         is_thinkkn_mode = p.thinkknMode
@@ -459,23 +819,192 @@ Use terminologia técnica adequada ao contexto jurídico brasileiro. Responda se
             print("Aplicando prompt padrão (sem modo Thinkkn)")
             system_prompt = "Você é um assistente policial e jurídico brasileiro especializado no sistema legal do Brasil. Responda de forma clara, direta e em português correto."
         
-        # Formato validado para DeepSeek-R1
-        prompt_completo = f"<|system|>\n{system_prompt}\n<|user|>\n{p.pergunta}\n<|assistant|>\n"
+        # Passagens relevantes do índice de busca entram junto com a pergunta, dentro do orçamento de tokens.
+        # Com passagens, as respostas guardadas em cache ficam restritas ao mesmo usuário
+        dono = dono_busca(request)
+        passagens = await recuperar_passagens(p.pergunta, dono)
+        dono_cache = dono if passagens else ""
+        sessao = obter_sessao(p.sessao_id, usuario_requisicao(request))
+        memoria = await carregar_memoria_conversa(sessao)
+        prompt_completo, opcoes = montar_prompt_orcado(system_prompt, p.pergunta, passagens, OPCOES_OLLAMA_STREAM, sessao, memoria)
+        # Prazo da requisição: ao vencer, ou se o cliente desconectar, a geração no Ollama é cancelada
+        prazo = ler_prazo(is_thinkkn_mode, request.headers.get("X-Prazo"))
+        
+        # Turnos de sessão dependem do contexto acumulado: não usam cache nem coalescência
+        if sessao is not None:
+            agendador.verificar_admissao()
+            
+            async def guardar_turno(resposta):
+                await registrar_turno_conversa(sessao, p.pergunta, resposta)
+            
+            generator = limitar_prazo(
+                gerar_com_agendamento(
+                    gerar_resposta_ollama_stream(
+                        prompt_completo, is_thinkkn_mode, opcoes=opcoes, sessao=sessao,
+                        timeout=timeout_upstream(prazo), ao_concluir=guardar_turno
+                    )
+                ),
+                prazo, "/perguntar_stream", request
+            )
+            return StreamingResponse(
+                generator,
+                media_type="application/x-ndjson",
+                headers={"X-Sessao-Id": sessao.id}
+            )
+        
+        # Respostas já geradas para a mesma pergunta saem direto do cache, sem passar pela fila
+        chave_cache = gerar_chave(OLLAMA_MODEL, prompt_completo, opcoes, is_thinkkn_mode, dono_cache)
+        resposta_cache = await cache_respostas.obter(chave_cache)
+        if resposta_cache is not None:
+            print("Resposta encontrada no cache")
+            return StreamingResponse(
+                reproduzir_resposta_cache(resposta_cache),
+                media_type="application/x-ndjson"
+            )
+        
+        # Pergunta idêntica já em geração: assinar o mesmo streaming em vez de abrir outro
+        chave_coalescencia = gerar_chave(OLLAMA_MODEL, normalizar_texto(prompt_completo), opcoes, is_thinkkn_mode, dono_cache)
+        escopo = gerar_escopo(OLLAMA_MODEL, is_thinkkn_mode, p.pergunta, passagens, dono_cache)
+        vetor = None
+        if not coalescedor.em_andamento(chave_coalescencia):
+            # Pergunta parecida com outra já respondida: reaproveita a resposta sem passar pela fila
+            resposta_cache, vetor = await cache_semantico.buscar(p.pergunta, escopo)
+            if resposta_cache is not None:
+                return StreamingResponse(
+                    reproduzir_resposta_cache(resposta_cache),
+                    media_type="application/x-ndjson"
+                )
+            # Rejeitar logo se a fila estiver cheia (antes de abrir o streaming)
+            agendador.verificar_admissao()
+        
+        async def guardar_semantico(resposta):
+            cache_semantico.guardar(vetor, p.pergunta, resposta, escopo)
         
         # Retorna um streaming response
         print(f"Iniciando streaming da resposta")
-        generator = gerar_resposta_ollama_stream(prompt_completo, is_thinkkn_mode)
+        # O prazo vale para cada assinante; a geração compartilhada só é cancelada quando o último desiste
+        generator = limitar_prazo(
+            coalescedor.assinar(
+                chave_coalescencia,
+                lambda: gerar_com_agendamento(
+                    gerar_resposta_ollama_stream(
+                        prompt_completo, is_thinkkn_mode, opcoes=opcoes, chave_cache=chave_cache,
+                        timeout=timeout_upstream(prazo), ao_concluir=guardar_semantico
+                    )
+                )
+            ),
+            prazo, "/perguntar_stream", request
+        )
         return StreamingResponse(
             generator,
             media_type="application/x-ndjson"
         )
+    except PromptGrandeDemais as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FilaCheia as e:
+        print(f"Requisição rejeitada pelo agendador: {str(e)}")
+        raise erro_agendador(e)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro ao processar pergunta com streaming: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar sua pergunta: {str(e)}")
 
+# Geração de um trecho da etapa de map ou de uma condensação (sem streaming, com prioridade de lote:
+# um documento longo não ocupa a fila na frente das perguntas do chat)
+async def gerar_trecho_documento(prompt):
+    opcoes = orcamento_tokens.planejar(prompt, num_predict=OPCOES_OLLAMA["num_predict"]).opcoes(OPCOES_OLLAMA)
+    async with agendador.slot(PRIORIDADE_LOTE):
+        return await gerar_resposta_ollama(prompt, opcoes=opcoes)
+
+# Geração da resposta final sobre o documento (streaming, passando pelo agendador)
+def gerar_resposta_documento(prompt, is_thinkkn_mode):
+    plano = orcamento_tokens.planejar(prompt, num_predict=OPCOES_OLLAMA_STREAM["num_predict"])
+    print(f"Orçamento de tokens (documento): {plano.descricao()}")
+    return gerar_com_agendamento(
+        gerar_resposta_ollama_stream(prompt, is_thinkkn_mode, opcoes=plano.opcoes(OPCOES_OLLAMA_STREAM))
+    )
+
+pipeline_documento = PipelineDocumento(gerar_trecho_documento, gerar_resposta_documento)
+
+# Geração do resumo acumulado de uma conversa longa (trabalho de fundo: prioridade de lote na fila)
+async def gerar_resumo_conversa(prompt):
+    opcoes = orcamento_tokens.planejar(prompt, num_predict=OPCOES_OLLAMA["num_predict"]).opcoes(OPCOES_OLLAMA)
+    async with agendador.slot(PRIORIDADE_LOTE):
+        return await gerar_resposta_ollama(prompt, opcoes=opcoes)
+
+# Histórico das conversas no SQLite, com compactação das conversas longas em um resumo
+historico_conversas = HistoricoConversas(gerar_resumo_conversa)
+
+INSTRUCOES_LOTE = {
+    False: "Você é um assistente policial e jurídico brasileiro especializado no sistema legal do Brasil. Responda de forma clara, direta e em português correto.",
+    True: """Você é um assistente policial e jurídico brasileiro especializado no sistema legal do Brasil.
+
+FORMATO OBRIGATÓRIO: 
+1. Inicie seu raciocínio SEMPRE com a tag <think>
+2. Desenvolva seu raciocínio detalhadamente
+3. Encerre seu raciocínio com a tag </think>
+4. Após isso, apresente sua resposta final de forma clara e direta
+
+Use terminologia técnica adequada ao contexto jurídico brasileiro. Responda sempre em português correto.""",
+}
+
+# Geração de um item de lote: mesmo prompt e cache de /perguntar, com prioridade de lote e sem limite de
+# espera na fila (o chat interativo sempre passa na frente). As passagens vêm dos documentos do dono do lote
+async def responder_item_lote(pergunta, is_thinkkn_mode, dono=""):
+    passagens = await recuperar_passagens(pergunta, dono)
+    prompt_completo, opcoes = montar_prompt_orcado(INSTRUCOES_LOTE[is_thinkkn_mode], pergunta, passagens, OPCOES_OLLAMA)
+    chave_cache = gerar_chave(OLLAMA_MODEL, prompt_completo, opcoes, is_thinkkn_mode, dono if passagens else "")
+    resposta = await cache_respostas.obter(chave_cache)
+    if resposta is not None:
+        return resposta
+    async with agendador.slot(PRIORIDADE_LOTE, max_espera=0):
+        resposta = await gerar_resposta_ollama(prompt_completo, opcoes=opcoes, timeout=ler_prazo(is_thinkkn_mode, None))
+    await cache_respostas.guardar(chave_cache, resposta)
+    return resposta
+
+# Trabalhos em lote persistidos no SQLite e processados em segundo plano
+gerenciador_lotes = GerenciadorLotes(responder_item_lote)
+
+# Rota que responde perguntas sobre documentos longos em etapas (map-reduce), com progresso via NDJSON
+@app.post("/perguntar_documento")
+async def perguntar_documento(p: PerguntaDocumento, request: Request):
+    try:
+        texto = p.texto
+        if p.documento_id:
+            texto = await cache_extracao.obter_por_chave(p.documento_id)
+            if texto is None:
+                raise HTTPException(status_code=404, detail="Documento não encontrado. Envie o arquivo novamente.")
+        if not texto:
+            raise HTTPException(status_code=400, detail="Informe documento_id ou o texto do documento.")
+        
+        # Cada trecho vai para o modelo junto com a pergunta
+        orcamento_tokens.verificar(f"{SYSTEM_PROMPT_MAP}\n{p.pergunta}", pipeline_documento.tokens_por_trecho)
+        trechos = pipeline_documento.dividir(texto)
+        agendador.verificar_admissao()
+        print(f"Pergunta sobre documento com {len(texto)} caracteres ({len(trechos)} trechos)")
+        prazo = ler_prazo(p.thinkknMode, request.headers.get("X-Prazo"), documento=True)
+        return StreamingResponse(
+            limitar_prazo(
+                pipeline_documento.responder(p.pergunta, texto, p.thinkknMode, trechos),
+                prazo, "/perguntar_documento", request,
+            ),
+            media_type="application/x-ndjson"
+        )
+    except (DocumentoGrandeDemais, PromptGrandeDemais) as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except FilaCheia as e:
+        print(f"Requisição rejeitada pelo agendador: {str(e)}")
+        raise erro_agendador(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Erro ao processar pergunta sobre documento: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao processar sua pergunta: {str(e)}")
+
 # Rota que envia a pergunta via método síncrono
 @app.post("/perguntar")
-async def perguntar(p: Pergunta):
+async def perguntar(p: Pergunta, request: Request):
     try:
         # Verificar se o modo Thinkkn está ativo
         is_thinkkn_mode = p.thinkknMode
@@ -495,27 +1024,74 @@ Use terminologia técnica adequada ao contexto jurídico brasileiro. Responda se
         else:
             system_prompt = "Você é um assistente policial e jurídico brasileiro especializado no sistema legal do Brasil. Responda de forma clara, direta e em português correto."
         
-        # Formato validado para DeepSeek-R1
-        prompt_completo = f"<|system|>\n{system_prompt}\n<|user|>\n{p.pergunta}\n<|assistant|>\n"
+        # Passagens relevantes do índice de busca entram junto com a pergunta, dentro do orçamento de tokens.
+        # Com passagens, as respostas guardadas em cache ficam restritas ao mesmo usuário
+        dono = dono_busca(request)
+        passagens = await recuperar_passagens(p.pergunta, dono)
+        dono_cache = dono if passagens else ""
+        sessao = obter_sessao(p.sessao_id, usuario_requisicao(request))
+        memoria = await carregar_memoria_conversa(sessao)
+        prompt_completo, opcoes = montar_prompt_orcado(system_prompt, p.pergunta, passagens, OPCOES_OLLAMA, sessao, memoria)
+        # Prazo da requisição: ao vencer, ou se o cliente desconectar, a geração no Ollama é cancelada
+        prazo = ler_prazo(is_thinkkn_mode, request.headers.get("X-Prazo"))
+        
+        # Espera na fila e geração, canceladas juntas (a saída do slot libera a vaga do agendador)
+        async def gerar_com_slot(sessao=None):
+            async with agendador.slot(PRIORIDADE_INTERATIVA):
+                return await gerar_resposta_ollama(prompt_completo, opcoes=opcoes, sessao=sessao, timeout=timeout_upstream(prazo))
+        
+        # Turnos de sessão dependem do contexto acumulado: não usam cache
+        if sessao is not None:
+            resposta = await executar_com_prazo(gerar_com_slot(sessao), prazo, "/perguntar", request)
+            await registrar_turno_conversa(sessao, p.pergunta, resposta)
+            return {"resposta": resposta, "sessao_id": sessao.id}
+        
+        # Respostas já geradas para a mesma pergunta saem direto do cache
+        chave_cache = gerar_chave(OLLAMA_MODEL, prompt_completo, opcoes, is_thinkkn_mode, dono_cache)
+        resposta = await cache_respostas.obter(chave_cache)
+        if resposta is not None:
+            return {"resposta": resposta}
+        
+        # Pergunta parecida com outra já respondida (mesmo modelo, modo, documentos e números citados)
+        escopo = gerar_escopo(OLLAMA_MODEL, is_thinkkn_mode, p.pergunta, passagens, dono_cache)
+        resposta, vetor = await cache_semantico.buscar(p.pergunta, escopo)
+        if resposta is not None:
+            return {"resposta": resposta}
         
-        # Gera resposta via Ollama
-        resposta = gerar_resposta_ollama(prompt_completo)
+        # Gera resposta via Ollama, respeitando o limite de gerações simultâneas
+        resposta = await executar_com_prazo(gerar_com_slot(), prazo, "/perguntar", request)
+        await cache_respostas.guardar(chave_cache, resposta)
+        cache_semantico.guardar(vetor, p.pergunta, resposta, escopo)
         
         return {"resposta": resposta}
+    except PromptGrandeDemais as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (FilaCheia, TempoEsperaExcedido) as e:
+        print(f"Requisição rejeitada pelo agendador: {str(e)}")
+        raise erro_agendador(e)
+    except PrazoExcedido as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClienteDesconectado:
+        # Ninguém vai ler esta resposta; 499 segue a convenção do nginx para "cliente fechou a conexão"
+        raise HTTPException(status_code=499, detail="Cliente desconectado")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro ao processar pergunta: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar sua pergunta: {str(e)}")
 
 # Rota que envia a pergunta via /api/chat (para compatibilidade com o frontend)
 @app.post("/api/chat")
-async def chat_api(p: Pergunta):
+async def chat_api(p: Pergunta, request: Request):
     try:
         # Verificar explicitamente se o modo Thinkkn está ativo
         is_thinkkn_mode = p.thinkknMode
         print(f"[API /api/chat] Recebido modo Thinkkn: {is_thinkkn_mode}")
         
         # Chamar a função principal de processamento
-        return await perguntar(p)
+        return await perguntar(p, request)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro no endpoint /api/chat: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar sua pergunta: {str(e)}")
@@ -554,13 +1130,23 @@ async def api_chat_ai(request: Request):
         # Criar um objeto Pergunta a partir do corpo
         p = Pergunta(
             pergunta=body.get("prompt", ""),
-            thinkknMode=body.get("thinkknMode", False)
+            thinkknMode=body.get("thinkknMode", False),
+            sessao_id=body.get("sessao_id") or body.get("chatId")
         )
         
         print(f"Requisição recebida em /api/chat/ai - redirecionando para perguntar_stream")
         
         # Simplesmente redirecionar para o endpoint de streaming
-        return await perguntar_stream(p)
+        return await perguntar_stream(p, request)
+    except HTTPException as e:
+        # Rejeições do agendador (429/503) seguem com Retry-After para o cliente
+        if e.status_code in (429, 503):
+            raise
+        print(f"Erro no endpoint /api/chat/ai: {e.detail}")
+        return StreamingResponse(
+            (json.dumps({"token": f"Erro ao processar sua solicitação: {e.detail}"}) + "\n" for _ in range(1)),
+            media_type="application/x-ndjson"
+        )
     except Exception as e:
         print(f"Erro no endpoint /api/chat/ai: {str(e)}")
         # Retornar uma resposta padrão em caso de erro
@@ -569,13 +1155,282 @@ async def api_chat_ai(request: Request):
             media_type="application/x-ndjson"
         )
 
-# Rota para buscar histórico de chats (implementação temporária)
+# Rota de estado do agendador (fila e gerações ativas)
+@app.get("/api/status/agendador")
+async def status_agendador():
+    return {**agendador.estatisticas(), "coalescencia": coalescedor.estatisticas()}
+
+# Rotas administrativas do cache de respostas
+@app.get("/api/admin/cache", dependencies=[Depends(verificar_admin)])
+async def estatisticas_cache():
+    return cache_respostas.estatisticas()
+
+@app.delete("/api/admin/cache", dependencies=[Depends(verificar_admin)])
+async def invalidar_cache(chave: Optional[str] = None):
+    removidos = await cache_respostas.invalidar(chave)
+    return {"removidos": removidos}
+
+# Rotas administrativas do cache semântico
+@app.get("/api/admin/cache/semantico", dependencies=[Depends(verificar_admin)])
+async def estatisticas_cache_semantico():
+    return cache_semantico.estatisticas()
+
+@app.delete("/api/admin/cache/semantico", dependencies=[Depends(verificar_admin)])
+async def invalidar_cache_semantico():
+    return {"removidos": cache_semantico.invalidar()}
+
+# Rotas administrativas do cache de extração de documentos
+@app.get("/api/admin/cache/extracao", dependencies=[Depends(verificar_admin)])
+async def estatisticas_cache_extracao():
+    return cache_extracao.estatisticas()
+
+@app.delete("/api/admin/cache/extracao", dependencies=[Depends(verificar_admin)])
+async def invalidar_cache_extracao():
+    removidos = await cache_extracao.invalidar()
+    return {"removidos": removidos}
+
+# Estado dos servidores Ollama (saúde, modelos carregados e gerações em andamento)
+@app.get("/api/status/ollama")
+async def status_ollama():
+    return cliente_ollama.estatisticas()
+
+# Métricas no formato texto do Prometheus
+def coletar_metricas_agendador():
+    metricas.FILA_TAMANHO.definir(agendador.em_fila)
+    metricas.GERACOES_ATIVAS.definir(agendador.ativos)
+
+metricas.REGISTRO.adicionar_coletor(coletar_metricas_agendador)
+
+@app.get("/metrics")
+async def exportar_metricas():
+    return Response(content=metricas.REGISTRO.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Rotas administrativas de diagnóstico (valem para o worker que atender a requisição; o pid vai na resposta)
+@app.get("/api/admin/diagnostico", dependencies=[Depends(verificar_admin)])
+async def diagnostico():
+    return {"pid": os.getpid(), "loop": monitor_loop.estatisticas(), "rotas": tempos_rotas.estatisticas()}
+
+@app.get("/api/admin/diagnostico/travamentos", dependencies=[Depends(verificar_admin)])
+async def travamentos_loop(limite: int = 20):
+    return {"pid": os.getpid(), "travamentos": monitor_loop.travamentos(max(1, min(limite, 100)))}
+
+# Perfil do worker em execução por um tempo limitado: "amostragem" (pilhas a cada intervalo_ms, todas as
+# threads se pedido) ou "cprofile" (todas as chamadas no event loop; mais preciso e bem mais caro)
+@app.post("/api/admin/perfil", dependencies=[Depends(verificar_admin)])
+async def perfil_worker(
+    modo: str = "amostragem", duracao: float = 10, intervalo_ms: float = 5, todas_threads: bool = False,
+    ordenar: str = "cumulative", limite: int = 30, formato: str = "json"
+):
+    limite = max(1, min(limite, 200))
+    try:
+        if modo == "amostragem":
+            resultado = await perfilador.amostrar(duracao, max(intervalo_ms, 1) / 1000, todas_threads, limite)
+            if formato == "colapsado":
+                return Response(content=resultado["pilhas_colapsadas"] + "\n", media_type="text/plain; charset=utf-8")
+        elif modo == "cprofile":
+            if ordenar not in ORDENACOES_CPROFILE:
+                raise HTTPException(status_code=400, detail=f"Ordenação inválida. Use: {', '.join(ORDENACOES_CPROFILE)}.")
+            resultado = await perfilador.perfil_cprofile(duracao, ordenar, limite)
+            if formato == "texto":
+                return Response(content=resultado["texto"], media_type="text/plain; charset=utf-8")
+        else:
+            raise HTTPException(status_code=400, detail="Modo inválido. Use: amostragem, cprofile.")
+    except PerfilEmAndamento as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"pid": os.getpid(), **resultado}
+
+# Rotas das sessões de conversa
+@app.get("/api/status/sessoes", dependencies=[Depends(verificar_admin)])
+async def status_sessoes():
+    return sessoes.estatisticas()
+
+# Só o dono encerra a própria sessão (o administrador encerra qualquer uma); sessão de outro usuário = 404
+@app.delete("/api/sessoes/{sessao_id}")
+async def encerrar_sessao(sessao_id: str, identidade: tuple = Depends(identificar_cliente)):
+    usuario, admin = identidade
+    sessao = sessoes.obter(sessao_id)
+    if sessao is None or not (admin or sessao.dono == usuario) or not sessoes.remover(sessao_id):
+        raise HTTPException(status_code=404, detail="Sessão não encontrada.")
+    return {"success": True}
+
+# Rotas do índice de busca. A busca devolve trechos literais de todos os documentos indexados (de qualquer
+# usuário e dos inquéritos), então fica restrita ao administrador
+@app.get("/api/admin/busca", dependencies=[Depends(verificar_admin)])
+async def buscar_documentos(q: str, k: int = 5):
+    return {"resultados": await indice_busca.buscar_async(q, max(1, min(k, 50)))}
+
+@app.get("/api/admin/indice", dependencies=[Depends(verificar_admin)])
+async def estatisticas_indice():
+    return await asyncio.to_thread(indice_busca.estatisticas)
+
+@app.post("/api/admin/indice/inqueritos", dependencies=[Depends(verificar_admin)])
+async def sincronizar_indice_inqueritos():
+    inqueritos = await asyncio.to_thread(listar_inqueritos)
+    return await asyncio.to_thread(indice_busca.sincronizar_inqueritos, inqueritos)
+
+@app.delete("/api/admin/indice/{documento_id}", dependencies=[Depends(verificar_admin)])
+async def remover_do_indice(documento_id: str):
+    if not await asyncio.to_thread(indice_busca.remover, documento_id):
+        raise HTTPException(status_code=404, detail="Documento não encontrado no índice.")
+    return {"success": True}
+
+# Rotas dos inquéritos (prazos consultados pelos índices de data_vencimento). Exigem identificação, como as
+# passagens de inquéritos na busca (usuários identificados pelo frontend ou o administrador)
+@app.get("/api/inqueritos/vencendo", dependencies=[Depends(identificar_cliente)])
+async def listar_inqueritos_vencendo(dias: int = 7, limite: int = 100):
+    return await asyncio.to_thread(inqueritos_vencendo, max(dias, 0), None, max(1, min(limite, 1000)))
+
+@app.get("/api/inqueritos/vencidos", dependencies=[Depends(identificar_cliente)])
+async def listar_inqueritos_vencidos(limite: int = 100):
+    return await asyncio.to_thread(inqueritos_vencidos, None, max(1, min(limite, 1000)))
+
+# Carga em lote: cada lote de [DATABASE] db_tamanho_lote registros é gravado em uma transação
+@app.post("/api/admin/inqueritos", dependencies=[Depends(verificar_admin)])
+async def importar_inqueritos(registros: list[dict]):
+    try:
+        total = await asyncio.to_thread(salvar_inqueritos, registros)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "processados": total}
+
+# Rotas do histórico de conversas (paginação por cursor: next_cursor volta em cursor na próxima página).
+# O usuário vem da identificação (identificar_cliente), nunca de um parâmetro: cada um só vê e altera as
+# próprias conversas; o administrador acessa qualquer conversa pelo id
+class ConversaNova(BaseModel):
+    chatId: Optional[str] = None
+    name: Optional[str] = None
+
+class ConversaAlteracao(BaseModel):
+    chatId: str
+    name: Optional[str] = None
+
 @app.get("/api/chat/get")
-async def get_chats():
-    return []
+async def get_chats(limite: int = 20, cursor: Optional[str] = None, identidade: tuple = Depends(identificar_cliente)):
+    try:
+        conversas, proximo = await historico_conversas.listar_conversas_async(identidade[0], max(1, min(limite, 100)), cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "data": conversas, "next_cursor": proximo}
+
+@app.get("/api/chat/{conversa_id}/mensagens")
+async def get_mensagens_chat(conversa_id: str, limite: int = 50, antes: Optional[int] = None,
+                             identidade: tuple = Depends(identificar_cliente)):
+    usuario, admin = identidade
+    dono = await asyncio.to_thread(historico_conversas.dono, conversa_id)
+    if dono is None or not (admin or dono == usuario):
+        raise HTTPException(status_code=404, detail="Conversa não encontrada.")
+    mensagens, proximo = await historico_conversas.listar_mensagens_async(conversa_id, max(1, min(limite, 200)), antes)
+    return {"success": True, "data": mensagens, "next_cursor": proximo}
+
+@app.post("/api/chat/create")
+async def criar_chat(c: ConversaNova, identidade: tuple = Depends(identificar_cliente)):
+    conversa = await asyncio.to_thread(historico_conversas.criar_conversa, c.chatId, identidade[0], c.name)
+    if conversa is None:
+        raise HTTPException(status_code=409, detail="Já existe uma conversa com este id.")
+    return {"success": True, "data": conversa}
+
+@app.post("/api/chat/rename")
+async def renomear_chat(c: ConversaAlteracao, identidade: tuple = Depends(identificar_cliente)):
+    usuario, admin = identidade
+    if not c.name or not await asyncio.to_thread(historico_conversas.renomear, c.chatId, c.name, None if admin else usuario):
+        raise HTTPException(status_code=404, detail="Conversa não encontrada.")
+    return {"success": True}
+
+@app.post("/api/chat/delete")
+async def remover_chat(c: ConversaAlteracao, identidade: tuple = Depends(identificar_cliente)):
+    usuario, admin = identidade
+    if not await asyncio.to_thread(historico_conversas.remover, c.chatId, None if admin else usuario):
+        raise HTTPException(status_code=404, detail="Conversa não encontrada.")
+    sessoes.remover(c.chatId)
+    return {"success": True}
+
+@app.get("/api/admin/historico", dependencies=[Depends(verificar_admin)])
+async def estatisticas_historico():
+    return await asyncio.to_thread(historico_conversas.estatisticas)
+
+# Rotas dos trabalhos em lote. Um lote é uma lista de perguntas ou um modelo de pergunta aplicado a
+# inquéritos ({numero}, {descricao}, {data_criacao}, {data_vencimento}). Todas exigem identificação
+# (identificar_cliente); cada lote pertence a quem o criou
+class LoteNovo(BaseModel):
+    nome: Optional[str] = None
+    perguntas: Optional[list[str]] = None
+    modelo: Optional[str] = None
+    numeros: Optional[list[str]] = None
+    vencendo_em_dias: Optional[int] = None
+    thinkknMode: bool = False
+    max_tentativas: Optional[int] = None
+
+def montar_itens_lote(l):
+    if l.perguntas:
+        return [(None, pergunta) for pergunta in l.perguntas if pergunta.strip()]
+    if not l.modelo:
+        raise ValueError("Informe perguntas ou um modelo de pergunta.")
+    if l.numeros is not None:
+        inqueritos = obter_inqueritos(l.numeros)
+    elif l.vencendo_em_dias is not None:
+        inqueritos = inqueritos_vencendo(max(l.vencendo_em_dias, 0))
+    else:
+        inqueritos = obter_inqueritos()
+    return [(inquerito["numero"], preencher_modelo(l.modelo, inquerito)) for inquerito in inqueritos]
+
+# Lote do cliente: o administrador vê todos, os demais só os próprios (lote de outro dono = 404)
+async def obter_lote_cliente(lote_id, identidade):
+    usuario, admin = identidade
+    lote = await asyncio.to_thread(gerenciador_lotes.obter, lote_id)
+    if lote is None or not (admin or lote["dono"] == usuario):
+        raise HTTPException(status_code=404, detail="Lote não encontrado.")
+    return lote
+
+@app.post("/api/lotes")
+async def criar_lote(l: LoteNovo, identidade: tuple = Depends(identificar_cliente)):
+    try:
+        itens = await asyncio.to_thread(montar_itens_lote, l)
+        for _, pergunta in itens:
+            orcamento_tokens.verificar(f"{INSTRUCOES_LOTE[l.thinkknMode]}\n{pergunta}")
+        max_tentativas = max(1, min(l.max_tentativas, 10)) if l.max_tentativas else None
+        return await asyncio.to_thread(gerenciador_lotes.criar, itens, l.nome, l.thinkknMode, max_tentativas, identidade[0])
+    except LimiteLotes as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except PromptGrandeDemais as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ValueError, KeyError, IndexError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/lotes")
+async def listar_lotes(limite: int = 50, identidade: tuple = Depends(identificar_cliente)):
+    usuario, admin = identidade
+    return await asyncio.to_thread(gerenciador_lotes.listar, max(1, min(limite, 200)), None if admin else usuario)
+
+@app.get("/api/lotes/{lote_id}")
+async def obter_lote(lote_id: str, identidade: tuple = Depends(identificar_cliente)):
+    return await obter_lote_cliente(lote_id, identidade)
+
+# Resultados já finalizados (paginados pela ordem do último item recebido) ou, com stream=true, em NDJSON
+# conforme os itens terminam, até o fim do lote
+@app.get("/api/lotes/{lote_id}/resultados")
+async def resultados_lote(lote_id: str, depois: int = 0, limite: int = 100, stream: bool = False,
+                          identidade: tuple = Depends(identificar_cliente)):
+    await obter_lote_cliente(lote_id, identidade)
+    if stream:
+        async def gerar():
+            async for evento in gerenciador_lotes.acompanhar(lote_id, depois):
+                yield frame_ndjson(evento)
+        return StreamingResponse(gerar(), media_type="application/x-ndjson")
+    resultados = await asyncio.to_thread(gerenciador_lotes.resultados, lote_id, depois, max(1, min(limite, 1000)))
+    return {"data": resultados, "next_cursor": resultados[-1]["ordem"] if resultados else depois}
+
+@app.delete("/api/lotes/{lote_id}")
+async def cancelar_lote(lote_id: str, identidade: tuple = Depends(identificar_cliente)):
+    await obter_lote_cliente(lote_id, identidade)
+    if not await asyncio.to_thread(gerenciador_lotes.cancelar, lote_id):
+        raise HTTPException(status_code=404, detail="Lote não encontrado ou já finalizado.")
+    return {"success": True}
+
+@app.get("/api/admin/lotes", dependencies=[Depends(verificar_admin)])
+async def estatisticas_lotes():
+    return await asyncio.to_thread(gerenciador_lotes.estatisticas)
 
-# Iniciar o servidor se este arquivo for executado diretamente
+# Iniciar o servidor se este arquivo for executado diretamente (mesmas opções do lançador servidor.py)
 if __name__ == "__main__":
-    import uvicorn
-    print("Iniciando servidor API GPTPOL na porta 8000...")
-    uvicorn.run("main_api:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    from servidor import main
+    main()
\ No newline at end of file
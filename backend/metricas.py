@@ -0,0 +1,239 @@
+# metricas.py
+# Este módulo mantém contadores, medidores e histogramas em memória e os exporta no formato texto
+# do Prometheus (rota /metrics). As métricas são declaradas aqui, em um registro único do processo,
+# e atualizadas nos pontos quentes: fila do agendador, gerações do Ollama, extração e uploads.
+
+import math
+import threading
+
+# Faixas (segundos) para tempos de requisição e geração
+FAIXAS_TEMPO = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+# Faixas para tokens por segundo
+FAIXAS_TOKENS_POR_SEGUNDO = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+# Faixas (bytes) para tamanho de arquivos
+FAIXAS_BYTES = (10_000, 100_000, 500_000, 1_000_000, 5_000_000, 10_000_000, 50_000_000)
+# Faixas (segundos) para o atraso do event loop
+FAIXAS_ATRASO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Faixas para similaridade de cosseno (cache semântico)
+FAIXAS_SIMILARIDADE = (0.5, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0)
+
+
+def _formatar_valor(valor):
+    if valor == math.inf:
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes, valores, extra=None):
+    pares = list(zip(nomes, valores))
+    if extra:
+        pares.append(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos):
+        if set(rotulos) != set(self.rotulos):
+            raise ValueError(f"{self.nome}: rótulos esperados {self.rotulos}, recebidos {tuple(rotulos)}")
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            itens = sorted(self._valores.items())
+        for chave, valor in itens:
+            linhas.extend(self._linhas(chave, valor))
+        return linhas
+
+    def _linhas(self, chave, valor):
+        return [f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_valor(valor)}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def incrementar(self, quantidade=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + quantidade
+
+
+class Medidor(_Metrica):
+    tipo = "gauge"
+
+    def definir(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = valor
+
+    def incrementar(self, quantidade=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + quantidade
+
+    def decrementar(self, quantidade=1, **rotulos):
+        self.incrementar(-quantidade, **rotulos)
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, descricao, rotulos=(), faixas=FAIXAS_TEMPO):
+        super().__init__(nome, descricao, rotulos)
+        self.faixas = tuple(sorted(faixas)) + (math.inf,)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            item = self._valores.get(chave)
+            if item is None:
+                # [contagem por faixa (não acumulada), soma, total]
+                item = self._valores[chave] = [[0] * len(self.faixas), 0.0, 0]
+            for indice, limite in enumerate(self.faixas):
+                if valor <= limite:
+                    item[0][indice] += 1
+                    break
+            item[1] += valor
+            item[2] += 1
+
+    def _linhas(self, chave, valor):
+        contagens, soma, total = valor
+        linhas = []
+        acumulado = 0
+        for limite, contagem in zip(self.faixas, contagens):
+            acumulado += contagem
+            rotulos = _formatar_rotulos(self.rotulos, chave, ("le", _formatar_valor(limite)))
+            linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+        rotulos = _formatar_rotulos(self.rotulos, chave)
+        linhas.append(f"{self.nome}_sum{rotulos} {_formatar_valor(soma)}")
+        linhas.append(f"{self.nome}_count{rotulos} {total}")
+        return linhas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+        # Funções chamadas antes de cada exportação (ex.: copiar o estado da fila para medidores)
+        self._coletores = []
+
+    def adicionar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def adicionar_coletor(self, funcao):
+        self._coletores.append(funcao)
+
+    def exportar(self):
+        for coletor in self._coletores:
+            try:
+                coletor()
+            except Exception as e:
+                print(f"Erro ao coletar métricas: {str(e)}")
+        linhas = []
+        for metrica in self._metricas:
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+
+REGISTRO = Registro()
+
+# Fila do agendador
+ESPERA_FILA = REGISTRO.adicionar(Histograma(
+    "gptpol_fila_espera_segundos", "Tempo de espera na fila do agendador até a geração começar", ("prioridade",)
+))
+FILA_TAMANHO = REGISTRO.adicionar(Medidor("gptpol_fila_tamanho", "Requisições aguardando na fila do agendador"))
+GERACOES_ATIVAS = REGISTRO.adicionar(Medidor("gptpol_geracoes_ativas", "Gerações em andamento no Ollama"))
+REJEICOES = REGISTRO.adicionar(Contador(
+    "gptpol_rejeicoes_total", "Requisições rejeitadas pelo agendador", ("motivo",)
+))
+
+# Gerações no Ollama
+TEMPO_PRIMEIRO_TOKEN = REGISTRO.adicionar(Histograma(
+    "gptpol_tempo_primeiro_token_segundos", "Tempo até o primeiro token do Ollama no streaming", ("modelo",)
+))
+DURACAO_GERACAO = REGISTRO.adicionar(Histograma(
+    "gptpol_geracao_duracao_segundos", "Duração total de uma geração no Ollama", ("modelo", "modo")
+))
+TOKENS_POR_SEGUNDO = REGISTRO.adicionar(Histograma(
+    "gptpol_tokens_por_segundo", "Velocidade de geração (eval_count / eval_duration)", ("modelo",),
+    faixas=FAIXAS_TOKENS_POR_SEGUNDO,
+))
+DURACAO_PROMPT = REGISTRO.adicionar(Histograma(
+    "gptpol_prompt_eval_segundos", "Tempo de avaliação do prompt no Ollama (prompt_eval_duration)", ("modelo",)
+))
+TOKENS_GERADOS = REGISTRO.adicionar(Contador("gptpol_tokens_gerados_total", "Tokens gerados pelo Ollama", ("modelo",)))
+TOKENS_PROMPT = REGISTRO.adicionar(Contador("gptpol_tokens_prompt_total", "Tokens de prompt avaliados pelo Ollama", ("modelo",)))
+STREAMS_ATIVOS = REGISTRO.adicionar(Medidor("gptpol_streams_ativos", "Respostas em streaming abertas com o Ollama"))
+TIMEOUTS = REGISTRO.adicionar(Contador("gptpol_timeouts_total", "Tempos limite excedidos", ("etapa",)))
+ERROS_UPSTREAM = REGISTRO.adicionar(Contador(
+    "gptpol_erros_upstream_total", "Erros do Ollama (status HTTP, erro no meio do streaming ou falha de conexão)", ("tipo",)
+))
+CANCELAMENTOS = REGISTRO.adicionar(Contador(
+    "gptpol_cancelamentos_total", "Gerações canceladas por prazo vencido ou desconexão do cliente", ("motivo", "rota")
+))
+
+# Extração de texto dos uploads
+DURACAO_EXTRACAO = REGISTRO.adicionar(Histograma(
+    "gptpol_extracao_duracao_segundos", "Tempo de extração de texto por tipo de arquivo", ("tipo", "origem")
+))
+TAMANHO_UPLOAD = REGISTRO.adicionar(Histograma(
+    "gptpol_upload_bytes", "Tamanho dos arquivos enviados por tipo", ("tipo",), faixas=FAIXAS_BYTES
+))
+REINICIOS_EXTRACAO = REGISTRO.adicionar(Contador(
+    "gptpol_extracao_reinicios_total", "Pools de extração recriados (tempo limite excedido ou processo encerrado)", ("motivo",)
+))
+
+# Cache semântico de respostas
+CACHE_SEMANTICO = REGISTRO.adicionar(Contador(
+    "gptpol_cache_semantico_total", "Consultas ao cache semântico por resultado (hit, miss, erro)", ("resultado",)
+))
+SIMILARIDADE_CACHE = REGISTRO.adicionar(Histograma(
+    "gptpol_cache_semantico_similaridade", "Maior similaridade de cosseno encontrada em cada consulta ao cache semântico",
+    faixas=FAIXAS_SIMILARIDADE,
+))
+
+# Event loop e rotas HTTP
+ATRASO_LOOP = REGISTRO.adicionar(Histograma(
+    "gptpol_loop_atraso_segundos", "Atraso do event loop (quanto um sleep curto demora além do previsto)",
+    faixas=FAIXAS_ATRASO,
+))
+TRAVAMENTOS_LOOP = REGISTRO.adicionar(Contador(
+    "gptpol_loop_travamentos_total", "Vezes em que o event loop ficou bloqueado acima do limiar de travamento"
+))
+DURACAO_REQUISICAO = REGISTRO.adicionar(Histograma(
+    "gptpol_requisicao_duracao_segundos", "Duração das requisições HTTP até o fim da resposta", ("metodo", "rota", "status")
+))
+PRIMEIRO_BYTE_REQUISICAO = REGISTRO.adicionar(Histograma(
+    "gptpol_requisicao_primeiro_byte_segundos", "Tempo até o início da resposta HTTP (status e cabeçalhos)", ("metodo", "rota")
+))
+
+
+# Registra as estatísticas do frame final (done) do Ollama
+def registrar_frame_final(modelo, frame):
+    eval_count = frame.get("eval_count") or 0
+    eval_duration = frame.get("eval_duration") or 0
+    if eval_count:
+        TOKENS_GERADOS.incrementar(eval_count, modelo=modelo)
+        if eval_duration:
+            TOKENS_POR_SEGUNDO.observar(eval_count / (eval_duration / 1e9), modelo=modelo)
+    if frame.get("prompt_eval_count"):
+        TOKENS_PROMPT.incrementar(frame["prompt_eval_count"], modelo=modelo)
+    if frame.get("prompt_eval_duration"):
+        DURACAO_PROMPT.observar(frame["prompt_eval_duration"] / 1e9, modelo=modelo)
@@ -1,8 +1,15 @@
 # models.py
 # Este módulo define as tabelas do banco de dados SQLite usando SQLAlchemy.
+# A aplicação usa um único engine compartilhado (pool de conexões, WAL e synchronous=NORMAL),
+# criado na primeira chamada de obter_engine().
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+import threading
+
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from config_manager import obter_config
 
 Base = declarative_base()
 
@@ -15,8 +22,79 @@ class Inquerito(Base):
     data_criacao = Column(DateTime)
     data_vencimento = Column(DateTime)
 
-# Função para criar o banco de dados
+    # Consultas por prazo ("vencendo nos próximos N dias") e por período de criação usam os índices
+    __table_args__ = (
+        Index('idx_inqueritos_vencimento', 'data_vencimento'),
+        Index('idx_inqueritos_criacao', 'data_criacao'),
+    )
+
+_engines = {}
+_fabricas_sessao = {}
+_lock = threading.Lock()
+
+# Caminho do banco da aplicação ([DATABASE] db_path ou DB_PATH), o mesmo para o engine SQLAlchemy e para o
+# pool de conexões do data_manager. É lido no uso, não na importação: o .env só é carregado por main_api
+# depois que este módulo já foi importado. Caminhos relativos partem do diretório de trabalho do processo
+
+def caminho_banco():
+    return obter_config("DATABASE", "DB_PATH", "inqueritos.db").strip()
+
+def uri_padrao():
+    return f"sqlite:///{caminho_banco()}"
+
+# Ajustes aplicados a cada conexão nova do pool
+def _configurar_sqlite(conexao, _registro):
+    cursor = conexao.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+# Engine compartilhado por URI (criado uma única vez)
+
+def obter_engine(uri=None):
+    uri = uri or uri_padrao()
+    with _lock:
+        engine = _engines.get(uri)
+        if engine is None:
+            argumentos = {}
+            if uri.startswith("sqlite"):
+                argumentos["connect_args"] = {
+                    "check_same_thread": False,
+                    "timeout": obter_config("DATABASE", "DB_TIMEOUT", 10, float),
+                }
+            engine = create_engine(
+                uri,
+                pool_size=obter_config("DATABASE", "DB_POOL_TAMANHO", 4, int),
+                max_overflow=obter_config("DATABASE", "DB_POOL_EXTRA", 4, int),
+                pool_pre_ping=True,
+                **argumentos,
+            )
+            if uri.startswith("sqlite"):
+                event.listen(engine, "connect", _configurar_sqlite)
+            _engines[uri] = engine
+            _fabricas_sessao[uri] = sessionmaker(bind=engine, expire_on_commit=False)
+        return engine
+
+# Sessão ORM ligada ao engine compartilhado (use com "with nova_sessao() as sessao:")
+
+def nova_sessao(uri=None):
+    obter_engine(uri)
+    return _fabricas_sessao[uri or uri_padrao()]()
+
+# Função para criar o banco de dados (e os índices que faltarem em bancos já existentes)
+
+def criar_banco_dados(uri=None):
+    engine = obter_engine(uri)
+    Base.metadata.create_all(engine)
+    for tabela in Base.metadata.sorted_tables:
+        for indice in tabela.indexes:
+            indice.create(engine, checkfirst=True)
+    return engine
 
-def criar_banco_dados(uri='sqlite:///inqueritos.db'):
-    engine = create_engine(uri)
-    Base.metadata.create_all(engine) 
\ No newline at end of file
+def encerrar_engines():
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _fabricas_sessao.clear()
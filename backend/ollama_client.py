@@ -0,0 +1,92 @@
+# ollama_client.py
+# Este módulo mantém um cliente assíncrono único para o Ollama, com pool de conexões keep-alive.
+# A sessão é criada no startup da aplicação e fechada no shutdown (ver lifespan em main_api.py).
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiohttp
+
+from config_manager import obter_config
+
+
+class ClienteOllama:
+    def __init__(self, base_url, limite=None, limite_por_host=None, keepalive_timeout=None, timeout_conexao=None):
+        self.base_url = base_url.rstrip("/")
+        self.limite = limite or obter_config("OLLAMA", "OLLAMA_POOL_LIMITE", 32, int)
+        self.limite_por_host = limite_por_host or obter_config("OLLAMA", "OLLAMA_POOL_LIMITE_POR_HOST", 16, int)
+        self.keepalive_timeout = keepalive_timeout or obter_config("OLLAMA", "OLLAMA_KEEPALIVE_TIMEOUT", 60, float)
+        self.timeout_conexao = timeout_conexao or obter_config("OLLAMA", "OLLAMA_TIMEOUT_CONEXAO", 10, float)
+        self._sessao = None
+        self._lock = asyncio.Lock()
+
+    # Criar a sessão compartilhada (chamado no startup)
+    async def iniciar(self):
+        async with self._lock:
+            if self._sessao is None or self._sessao.closed:
+                conector = aiohttp.TCPConnector(
+                    limit=self.limite,
+                    limit_per_host=self.limite_por_host,
+                    keepalive_timeout=self.keepalive_timeout,
+                )
+                self._sessao = aiohttp.ClientSession(
+                    connector=conector,
+                    timeout=aiohttp.ClientTimeout(sock_connect=self.timeout_conexao),
+                )
+                print(f"Cliente Ollama iniciado: {self.base_url} (pool={self.limite}, por host={self.limite_por_host})")
+        return self._sessao
+
+    # Fechar a sessão e liberar as conexões (chamado no shutdown)
+    async def encerrar(self):
+        async with self._lock:
+            if self._sessao is not None and not self._sessao.closed:
+                await self._sessao.close()
+                print("Cliente Ollama encerrado")
+            self._sessao = None
+
+    async def sessao(self):
+        # Fallback para uso fora do lifespan (scripts, testes manuais)
+        if self._sessao is None or self._sessao.closed:
+            return await self.iniciar()
+        return self._sessao
+
+    def url(self, caminho, base_url=None):
+        return f"{base_url or self.base_url}/{caminho.lstrip('/')}"
+
+    # POST com resposta única: retorna (status, corpo JSON ou texto de erro)
+    async def _postar(self, caminho, payload, timeout, base_url=None):
+        sessao = await self.sessao()
+        async with sessao.post(
+            self.url(caminho, base_url),
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout, sock_connect=self.timeout_conexao),
+        ) as response:
+            if response.status != 200:
+                return response.status, await response.text()
+            return response.status, await response.json(content_type=None)
+
+    # Geração sem streaming
+    async def gerar(self, payload, timeout=60, base_url=None):
+        return await self._postar("/api/generate", payload, timeout, base_url)
+
+    # Vetores de embedding ({"model": ..., "input": texto ou lista}); o corpo traz "embeddings"
+    async def embeddings(self, payload, timeout=10, base_url=None):
+        return await self._postar("/api/embed", payload, timeout, base_url)
+
+    # Geração com streaming: entrega a resposta do aiohttp para leitura incremental
+    @asynccontextmanager
+    async def gerar_stream(self, payload, timeout=120, base_url=None):
+        sessao = await self.sessao()
+        async with sessao.post(
+            self.url("/api/generate", base_url),
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout, sock_connect=self.timeout_conexao),
+        ) as response:
+            yield response
+
+    # GET simples com timeout curto (usado nas verificações de saúde)
+    async def consultar(self, caminho, timeout=5, base_url=None):
+        sessao = await self.sessao()
+        async with sessao.get(self.url(caminho, base_url), timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
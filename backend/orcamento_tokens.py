@@ -0,0 +1,150 @@
+# orcamento_tokens.py
+# Este módulo estima o tamanho dos prompts em tokens e monta o orçamento de cada requisição:
+# usa o num_ctx do aquecimento (o do modelo já carregado no Ollama) e só passa para uma faixa maior
+# quando o prompt e a resposta não cabem nele; quando nem a maior faixa basta, corta primeiro os anexos
+# (trechos de documentos) de menor prioridade e depois o histórico da sessão. Cada mudança de num_ctx
+# faz o Ollama recarregar o modelo, então faixas menores que a do aquecimento nunca são usadas.
+# Um prompt fixo (instruções e pergunta) que sozinho não cabe na maior faixa é recusado.
+
+import re
+
+from config_manager import obter_config
+
+# Aproximação usada para converter tokens em caracteres (português fica perto de 4 caracteres por token)
+CARACTERES_POR_TOKEN = 4
+
+# Palavras (com acentos) e sinais de pontuação isolados
+PADRAO_PECA = re.compile(r"\w+|[^\w\s]")
+
+
+# Estimativa aproximada: cada palavra vale ao menos um token e palavras longas se quebram em
+# pedaços de ~4 caracteres; cada sinal de pontuação vale um token
+def estimar_tokens(texto):
+    tokens = 0
+    for peca in PADRAO_PECA.findall(texto):
+        tokens += 1 + (len(peca) - 1) // CARACTERES_POR_TOKEN
+    return max(tokens, len(texto) // (CARACTERES_POR_TOKEN * 2)) + 1
+
+
+# Corta o texto para caber em aproximadamente max_tokens, de preferência numa quebra de linha ou espaço
+def cortar_texto(texto, max_tokens):
+    if max_tokens <= 0:
+        return ""
+    if estimar_tokens(texto) <= max_tokens:
+        return texto
+    fim = max_tokens * CARACTERES_POR_TOKEN
+    while fim > 0 and estimar_tokens(texto[:fim]) > max_tokens:
+        fim = fim * 3 // 4
+    for separador in ("\n", " "):
+        corte = texto.rfind(separador, fim // 2, fim)
+        if corte > 0:
+            fim = corte
+            break
+    return texto[:fim].rstrip()
+
+
+def ler_faixas(valor):
+    return sorted({int(faixa) for faixa in str(valor).replace(";", ",").split(",") if faixa.strip()})
+
+
+# As instruções e a pergunta, com a resposta mínima, não cabem no maior num_ctx
+class PromptGrandeDemais(Exception):
+    def __init__(self, tokens, limite):
+        super().__init__(
+            f"Pergunta grande demais: ~{tokens} tokens, limite de {limite} com a resposta. "
+            "Encurte a pergunta ou envie o texto como documento."
+        )
+        self.tokens = tokens
+        self.limite = limite
+
+
+class PlanoTokens:
+    def __init__(self, num_ctx, num_predict, anexos, manter_historico, tokens_prompt, cortados):
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.anexos = anexos
+        self.manter_historico = manter_historico
+        self.tokens_prompt = tokens_prompt
+        self.cortados = cortados
+
+    # Opções do Ollama com o contexto e o tamanho de resposta escolhidos
+    def opcoes(self, opcoes_base):
+        return {**opcoes_base, "num_ctx": self.num_ctx, "num_predict": self.num_predict}
+
+    def descricao(self):
+        return (f"num_ctx={self.num_ctx} num_predict={self.num_predict} prompt~{self.tokens_prompt} tokens, "
+                f"{len(self.anexos)} anexos, {self.cortados} cortes, histórico={'sim' if self.manter_historico else 'não'}")
+
+
+class OrcamentoTokens:
+    def __init__(self, faixas=None, num_ctx_maximo=None, margem=None, num_predict_minimo=None, num_ctx_padrao=None):
+        self.faixas = faixas or ler_faixas(obter_config("ORCAMENTO", "ORCAMENTO_FAIXAS_CTX", "4096,8192"))
+        self.num_ctx_maximo = num_ctx_maximo or obter_config("ORCAMENTO", "ORCAMENTO_NUM_CTX_MAXIMO", self.faixas[-1], int)
+        # Folga para o template do chat e para o erro da estimativa
+        self.margem = margem if margem is not None else obter_config("ORCAMENTO", "ORCAMENTO_MARGEM", 64, int)
+        # Se faltar espaço, a resposta pode ser encurtada até este mínimo antes de descartar o histórico
+        self.num_predict_minimo = num_predict_minimo or obter_config("ORCAMENTO", "ORCAMENTO_NUM_PREDICT_MINIMO", 256, int)
+        self.faixas = [faixa for faixa in self.faixas if faixa <= self.num_ctx_maximo] or [self.num_ctx_maximo]
+        # Faixa padrão: a do aquecimento, com a qual o modelo fica carregado
+        self.num_ctx_padrao = num_ctx_padrao or obter_config("AQUECIMENTO", "AQUECIMENTO_NUM_CTX", 4096, int)
+        if self.num_ctx_padrao not in self.faixas:
+            raise ValueError(
+                f"[AQUECIMENTO] aquecimento_num_ctx = {self.num_ctx_padrao} não está em [ORCAMENTO] orcamento_faixas_ctx "
+                f"({', '.join(map(str, self.faixas))}): as gerações recarregariam o modelo aquecido"
+            )
+        self.faixas = [faixa for faixa in self.faixas if faixa >= self.num_ctx_padrao]
+
+    # Menor faixa que comporta os tokens pedidos, a partir da padrão (ou a maior disponível)
+    def escolher_num_ctx(self, tokens):
+        for faixa in self.faixas:
+            if tokens <= faixa:
+                return faixa
+        return self.faixas[-1]
+
+    # Levanta PromptGrandeDemais se o prompt fixo, mais reservado tokens de outras partes obrigatórias
+    # e a resposta mínima, não couber no maior num_ctx
+    def verificar(self, fixo, reservado=0):
+        tokens = estimar_tokens(fixo) + self.margem + reservado
+        if tokens + self.num_predict_minimo > self.num_ctx_maximo:
+            raise PromptGrandeDemais(tokens, self.num_ctx_maximo - self.num_predict_minimo)
+        return tokens
+
+    # fixo: parte do prompt que sempre é enviada (instruções e pergunta)
+    # anexos: textos opcionais, do mais para o menos importante (os últimos são cortados primeiro)
+    # tokens_historico: contexto acumulado da sessão, descartado só se o resto ainda não couber
+    def planejar(self, fixo, anexos=(), num_predict=512, tokens_historico=0):
+        tokens_fixo = self.verificar(fixo)
+        originais = list(anexos)
+        custos = [estimar_tokens(anexo) for anexo in anexos]
+        anexos = list(anexos)
+        cortados = 0
+
+        limite = self.num_ctx_maximo
+        pedido = num_predict
+
+        # 1) Cortar os anexos de menor prioridade até caber com a resposta pedida
+        while anexos and tokens_historico + tokens_fixo + sum(custos) + num_predict > limite:
+            excesso = tokens_historico + tokens_fixo + sum(custos) + num_predict - limite
+            if custos[-1] - excesso >= 64:
+                anexos[-1] = cortar_texto(anexos[-1], custos[-1] - excesso)
+                custos[-1] = estimar_tokens(anexos[-1])
+            else:
+                anexos.pop()
+                custos.pop()
+            cortados += 1
+
+        # 2) Encurtar a resposta até o mínimo
+        if tokens_historico + tokens_fixo + sum(custos) + num_predict > limite:
+            num_predict = max(self.num_predict_minimo, limite - tokens_historico - tokens_fixo - sum(custos))
+
+        # 3) Por último, descartar o histórico da sessão (e refazer o plano sem ele)
+        if tokens_historico and tokens_historico + tokens_fixo + sum(custos) + num_predict > limite:
+            plano = self.planejar(fixo, originais, pedido)
+            plano.manter_historico = False
+            plano.cortados += 1
+            return plano
+
+        tokens_prompt = tokens_historico + tokens_fixo + sum(custos)
+        num_predict = max(min(pedido, limite - tokens_prompt), self.num_predict_minimo)
+        num_ctx = self.escolher_num_ctx(tokens_prompt + num_predict)
+        return PlanoTokens(num_ctx, num_predict, anexos, True, tokens_prompt, cortados)
@@ -0,0 +1,227 @@
+# pool_ollama.py
+# Este módulo distribui as gerações entre vários servidores Ollama. Cada backend é configurado com
+# a lista de modelos que atende; verificações periódicas (/api/tags e /api/ps) tiram de rotação os
+# backends que não respondem e os devolvem automaticamente quando voltam. Cada requisição vai para o
+# backend saudável com menos gerações em andamento. Falhas de conexão antes da resposta começar são
+# tentadas de novo em outro backend.
+
+import asyncio
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import aiohttp
+
+from config_manager import obter_config
+from ollama_client import ClienteOllama
+
+
+# Nome do modelo com a tag explícita: o Ollama lista "nomic-embed-text" em /api/tags como
+# "nomic-embed-text:latest", e as duas formas precisam casar na escolha do backend
+def normalizar_modelo(nome):
+    nome = (nome or "").strip()
+    if not nome or ":" in nome.rsplit("/", 1)[-1]:
+        return nome
+    return f"{nome}:latest"
+
+
+# Nenhum backend saudável atende o modelo pedido
+class SemBackendDisponivel(Exception):
+    def __init__(self, modelo, retry_after=5):
+        super().__init__(f"Nenhum servidor Ollama disponível para o modelo {modelo}.")
+        self.retry_after = retry_after
+
+
+class BackendOllama:
+    def __init__(self, url, modelos=None):
+        self.url = url.rstrip("/")
+        # Modelos configurados (vazio = qualquer modelo que o servidor tenha instalado)
+        self.modelos = {normalizar_modelo(modelo) for modelo in modelos or []}
+        self.instalados = None
+        self.carregados = set()
+        self.saudavel = True
+        self.pendentes = 0
+        self.total = 0
+        self.falhas = 0
+        self.falhas_seguidas = 0
+        self.ultimo_erro = None
+        self.ultima_verificacao = None
+
+    def atende(self, modelo):
+        modelo = normalizar_modelo(modelo)
+        if self.modelos and modelo not in self.modelos:
+            return False
+        # Sem lista configurada, vale o que o servidor informou em /api/tags (se já verificado)
+        return bool(self.modelos) or self.instalados is None or modelo in self.instalados
+
+    def estatisticas(self):
+        return {
+            "url": self.url,
+            "saudavel": self.saudavel,
+            "modelos": sorted(self.modelos) if self.modelos else sorted(self.instalados or []),
+            "carregados": sorted(self.carregados),
+            "pendentes": self.pendentes,
+            "total": self.total,
+            "falhas": self.falhas,
+            "ultimo_erro": self.ultimo_erro,
+            "ultima_verificacao": self.ultima_verificacao,
+        }
+
+
+# Lê a lista de backends: "url|modelo1,modelo2; url2|modelo3" (sem modelos = todos os instalados)
+def ler_backends(valor):
+    backends = []
+    for item in str(valor).split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, modelos = item.partition("|")
+        backends.append(BackendOllama(url.strip(), [m.strip() for m in modelos.split(",") if m.strip()]))
+    return backends
+
+
+class PoolOllama(ClienteOllama):
+    def __init__(self, backends, intervalo_verificacao=None, falhas_para_remover=None, **kwargs):
+        if isinstance(backends, str):
+            backends = ler_backends(backends)
+        super().__init__(backends[0].url, **kwargs)
+        self.backends = backends
+        self.intervalo_verificacao = intervalo_verificacao or obter_config("OLLAMA", "OLLAMA_INTERVALO_VERIFICACAO", 10, float)
+        # Falhas de conexão seguidas que tiram um backend de rotação antes da próxima verificação
+        self.falhas_para_remover = falhas_para_remover or obter_config("OLLAMA", "OLLAMA_FALHAS_PARA_REMOVER", 2, int)
+        self._tarefa_verificacao = None
+
+    async def iniciar(self):
+        sessao = await super().iniciar()
+        if self._tarefa_verificacao is None:
+            await self.verificar_backends()
+            self._tarefa_verificacao = asyncio.create_task(self._verificar_periodicamente())
+            print(f"Pool Ollama: {len(self.backends)} backends, verificação a cada {self.intervalo_verificacao:.0f}s")
+        return sessao
+
+    async def encerrar(self):
+        if self._tarefa_verificacao is not None:
+            self._tarefa_verificacao.cancel()
+            try:
+                await self._tarefa_verificacao
+            except asyncio.CancelledError:
+                pass
+            self._tarefa_verificacao = None
+        await super().encerrar()
+
+    async def _verificar_periodicamente(self):
+        while True:
+            await asyncio.sleep(self.intervalo_verificacao)
+            try:
+                await self.verificar_backends()
+            except Exception as e:
+                print(f"Erro na verificação dos backends Ollama: {str(e)}")
+
+    async def verificar_backends(self):
+        await asyncio.gather(*(self._verificar(backend) for backend in self.backends))
+
+    async def _verificar(self, backend):
+        try:
+            tags = await self.consultar("/api/tags", base_url=backend.url)
+            backend.instalados = {normalizar_modelo(modelo.get("name")) for modelo in tags.get("models", [])}
+            try:
+                ps = await self.consultar("/api/ps", base_url=backend.url)
+                backend.carregados = {normalizar_modelo(modelo.get("name")) for modelo in ps.get("models", [])}
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # Versões antigas do Ollama não têm /api/ps
+                backend.carregados = set()
+            faltando = backend.modelos - backend.instalados
+            if faltando:
+                raise RuntimeError(f"modelos não instalados: {', '.join(sorted(faltando))}")
+            if not backend.saudavel:
+                print(f"Backend Ollama de volta à rotação: {backend.url}")
+            backend.saudavel = True
+            backend.falhas_seguidas = 0
+            backend.ultimo_erro = None
+        except Exception as e:
+            if backend.saudavel:
+                print(f"Backend Ollama fora de rotação: {backend.url} ({str(e) or type(e).__name__})")
+            backend.saudavel = False
+            backend.ultimo_erro = str(e) or type(e).__name__
+        backend.ultima_verificacao = time.time()
+
+    # Backend saudável com menos gerações em andamento (empate: o que já tem o modelo carregado)
+    def escolher(self, modelo, excluir=()):
+        candidatos = [b for b in self.backends if b.saudavel and b not in excluir and b.atende(modelo)]
+        if not candidatos:
+            raise SemBackendDisponivel(modelo, retry_after=max(1, int(self.intervalo_verificacao)))
+        modelo = normalizar_modelo(modelo)
+        return min(candidatos, key=lambda b: (b.pendentes, modelo not in b.carregados, b.total))
+
+    def _registrar_falha(self, backend, erro):
+        backend.falhas += 1
+        backend.falhas_seguidas += 1
+        backend.ultimo_erro = str(erro) or type(erro).__name__
+        if backend.saudavel and backend.falhas_seguidas >= self.falhas_para_remover:
+            backend.saudavel = False
+            print(f"Backend Ollama fora de rotação: {backend.url} ({backend.ultimo_erro})")
+
+    # Requisição de resposta única (geração ou embeddings) no backend escolhido para o modelo
+    async def _requisitar(self, enviar, payload, timeout):
+        tentados = []
+        while True:
+            backend = self.escolher(payload.get("model"), tentados)
+            tentados.append(backend)
+            backend.pendentes += 1
+            backend.total += 1
+            try:
+                resultado = await enviar(payload, timeout, base_url=backend.url)
+                backend.falhas_seguidas = 0
+                backend.carregados.add(normalizar_modelo(payload.get("model")))
+                return resultado
+            except aiohttp.ClientConnectionError as e:
+                # Sem resposta do backend: a requisição é refeita em outro, se houver
+                self._registrar_falha(backend, e)
+                print(f"Falha de conexão com {backend.url}; tentando outro backend")
+            finally:
+                backend.pendentes -= 1
+
+    async def gerar(self, payload, timeout=60, base_url=None):
+        return await self._requisitar(super().gerar, payload, timeout)
+
+    async def embeddings(self, payload, timeout=10, base_url=None):
+        return await self._requisitar(super().embeddings, payload, timeout)
+
+    # Geração direcionada a um backend específico (usada no aquecimento dos modelos)
+    async def gerar_em(self, backend, payload, timeout=60):
+        backend.pendentes += 1
+        try:
+            return await super().gerar(payload, timeout, base_url=backend.url)
+        finally:
+            backend.pendentes -= 1
+
+    @asynccontextmanager
+    async def gerar_stream(self, payload, timeout=120, base_url=None):
+        tentados = []
+        while True:
+            backend = self.escolher(payload.get("model"), tentados)
+            tentados.append(backend)
+            backend.pendentes += 1
+            backend.total += 1
+            try:
+                async with AsyncExitStack() as pilha:
+                    try:
+                        response = await pilha.enter_async_context(
+                            super().gerar_stream(payload, timeout, base_url=backend.url)
+                        )
+                    except aiohttp.ClientConnectionError as e:
+                        # Nada foi enviado ao cliente ainda: tentar outro backend
+                        self._registrar_falha(backend, e)
+                        print(f"Falha de conexão com {backend.url}; tentando outro backend")
+                        continue
+                    backend.falhas_seguidas = 0
+                    backend.carregados.add(normalizar_modelo(payload.get("model")))
+                    yield response
+                    return
+            finally:
+                backend.pendentes -= 1
+
+    def estatisticas(self):
+        return {
+            "backends": [backend.estatisticas() for backend in self.backends],
+            "saudaveis": sum(backend.saudavel for backend in self.backends),
+        }
@@ -0,0 +1,123 @@
+# relay_ndjson.py
+# Este módulo faz o repasse do streaming NDJSON do Ollama para o cliente com o mínimo de trabalho por token:
+# divisão de linhas direto nos bytes, JSON rápido (orjson, se instalado) e agrupamento de tokens
+# em um único frame por janela de tempo ou quantidade de tokens.
+
+import asyncio
+import json
+import time
+
+from config_manager import obter_config
+
+# Backend de JSON: orjson é bem mais rápido, mas é opcional
+try:
+    import orjson
+
+    def carregar_json(dados):
+        return orjson.loads(dados)
+
+    def frame_ndjson(objeto):
+        return orjson.dumps(objeto) + b"\n"
+
+    ErroJSON = orjson.JSONDecodeError
+    JSON_BACKEND = "orjson"
+except ImportError:
+    def carregar_json(dados):
+        return json.loads(dados)
+
+    def frame_ndjson(objeto):
+        return (json.dumps(objeto) + "\n").encode("utf-8")
+
+    ErroJSON = json.JSONDecodeError
+    JSON_BACKEND = "json"
+
+
+# Divide o fluxo de bytes em linhas completas sem decodificar nem recriar strings a cada chunk.
+# O byte "\n" nunca aparece dentro de um caractere UTF-8 multibyte, então cada linha completa
+# pode ser decodificada de uma vez sem risco de cortar acentos no meio.
+class DivisorLinhas:
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def alimentar(self, chunk):
+        self._buffer += chunk
+        fim = self._buffer.rfind(b"\n")
+        if fim < 0:
+            return []
+        linhas = bytes(self._buffer[:fim]).split(b"\n")
+        del self._buffer[:fim + 1]
+        return [linha for linha in linhas if linha.strip()]
+
+    def finalizar(self):
+        resto = bytes(self._buffer).strip()
+        self._buffer.clear()
+        return [resto] if resto else []
+
+
+# Agrupa tokens em um único frame {"token": ...} por janela de tempo ou quantidade de tokens.
+# O primeiro token sai sozinho, na hora (não atrasa o tempo até o primeiro token); depois disso, a janela é
+# fechada pelo leitor (ler_chunks) mesmo que o modelo pare de gerar, sem esperar o próximo token.
+class AgrupadorTokens:
+    def __init__(self, janela_ms=None, max_tokens=None):
+        self.janela = (janela_ms if janela_ms is not None else obter_config("RELAY", "RELAY_JANELA_MS", 40, float)) / 1000
+        self.max_tokens = max_tokens if max_tokens is not None else obter_config("RELAY", "RELAY_MAX_TOKENS", 8, int)
+        self._pendentes = []
+        self._inicio = 0.0
+        self._primeiro_enviado = False
+
+    def adicionar(self, token):
+        if not self._primeiro_enviado:
+            self._primeiro_enviado = True
+            return frame_ndjson({"token": token})
+        if not self._pendentes:
+            self._inicio = time.monotonic()
+        self._pendentes.append(token)
+        if len(self._pendentes) >= self.max_tokens or time.monotonic() - self._inicio >= self.janela:
+            return self.esvaziar()
+        return None
+
+    # Segundos até a janela atual fechar (None sem tokens pendentes)
+    def restante(self):
+        if not self._pendentes:
+            return None
+        return max(0.0, self.janela - (time.monotonic() - self._inicio))
+
+    def esvaziar(self):
+        if not self._pendentes:
+            return None
+        frame = frame_ndjson({"token": "".join(self._pendentes)})
+        self._pendentes.clear()
+        return frame
+
+
+# Lê os chunks do streaming do Ollama. Se a janela do agrupador fecha antes do próximo chunk chegar,
+# devolve None para o chamador esvaziar o agrupador. A leitura pendente não é cancelada nesse caso (segue
+# esperando o mesmo chunk), então um timeout de leitura do aiohttp continua chegando ao chamador como erro.
+async def ler_chunks(iteravel, agrupador):
+    iterador = iteravel.__aiter__()
+
+    async def proximo_chunk():
+        try:
+            return await iterador.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    leitura = None
+    try:
+        while True:
+            if leitura is None:
+                leitura = asyncio.ensure_future(proximo_chunk())
+            restante = agrupador.restante()
+            if restante is not None:
+                await asyncio.wait({leitura}, timeout=restante)
+                if not leitura.done():
+                    yield None
+                    continue
+            chunk = await leitura
+            leitura = None
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        if leitura is not None and not leitura.done():
+            leitura.cancel()
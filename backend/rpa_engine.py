@@ -1,12 +1,462 @@
 # rpa_engine.py
 # Este módulo será responsável por realizar o screen scraping do sistema IP-e.
+# A listagem de inquéritos é percorrida página a página e só os inquéritos cuja linha mudou desde a
+# última sincronização (assinatura dos dados da listagem) têm a página de detalhe baixada de novo.
+# Páginas simples são baixadas por HTTP (aiohttp + html.parser); páginas que dependem de JavaScript usam
+# um pool limitado de navegadores headless reaproveitados. Vários trabalhadores baixam os detalhes em
+# paralelo e gravam os inquéritos em lotes no banco (data_manager.salvar_inqueritos).
+#
+# Uso: python -m rpa_engine --url http://ipe.local --completa
 
 # Importar bibliotecas necessárias
-from selenium import webdriver
+import argparse
+import asyncio
+import hashlib
+import queue
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import aiohttp
+
+from config_manager import obter_config
+from data_manager import pool_conexoes, salvar_inqueritos
+
+try:
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions
+    from selenium.webdriver.support.ui import WebDriverWait
+    SELENIUM_DISPONIVEL = True
+except ImportError:
+    SELENIUM_DISPONIVEL = False
+
+MODOS = ("http", "navegador", "auto")
+
+# Rótulos (sem acentos, minúsculos) das colunas da listagem e dos campos do detalhe
+ROTULOS = {
+    "numero": ("numero", "n", "no", "inquerito", "numero do inquerito"),
+    "descricao": ("descricao", "assunto", "historico", "fato"),
+    "data_criacao": ("criacao", "data de criacao", "instauracao", "data de instauracao", "abertura"),
+    "data_vencimento": ("vencimento", "data de vencimento", "prazo", "data do prazo"),
+}
+
+FORMATOS_DATA = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y")
+
+
+def _normalizar_rotulo(texto):
+    texto = unicodedata.normalize("NFKD", texto.strip().lower().rstrip(":"))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.replace(".", " ").replace("º", " ").split())
+
+
+def _campo(rotulo):
+    rotulo = _normalizar_rotulo(rotulo)
+    for campo, rotulos in ROTULOS.items():
+        if rotulo in rotulos:
+            return campo
+    return None
+
+
+# Datas no formato ISO ou brasileiro (dd/mm/aaaa, com ou sem hora)
+def converter_data(texto):
+    texto = (texto or "").strip()
+    if not texto:
+        return None
+    try:
+        return datetime.fromisoformat(texto)
+    except ValueError:
+        pass
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+    return None
+
+
+# Coleta tabelas (linhas com texto e links), pares de definição (<dt>/<dd>) e o link da próxima página
+class ParserPagina(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.linhas = []
+        self.pares = []
+        self.proxima = None
+        self._linha = None
+        self._celula = None
+        self._termo = None
+        self._definicao = None
+        self._link = None
+
+    def handle_starttag(self, tag, atributos):
+        atributos = dict(atributos)
+        if tag == "tr":
+            self._linha = {"celulas": [], "links": [], "cabecalho": False}
+        elif tag in ("td", "th") and self._linha is not None:
+            self._celula = []
+            if tag == "th":
+                self._linha["cabecalho"] = True
+        elif tag == "dt":
+            self._termo = []
+        elif tag == "dd":
+            self._definicao = []
+        elif tag == "a":
+            href = atributos.get("href")
+            if "next" in (atributos.get("rel") or "").split() and href:
+                self.proxima = href
+            self._link = {"href": href, "texto": []}
+            if self._linha is not None and href:
+                self._linha["links"].append(href)
+
+    def handle_endtag(self, tag):
+        if tag in ("td", "th") and self._linha is not None and self._celula is not None:
+            self._linha["celulas"].append(" ".join("".join(self._celula).split()))
+            self._celula = None
+        elif tag == "tr" and self._linha is not None:
+            if self._linha["celulas"]:
+                self.linhas.append(self._linha)
+            self._linha = None
+        elif tag == "dt" and self._termo is not None:
+            self.pares.append([" ".join("".join(self._termo).split()), ""])
+            self._termo = None
+        elif tag == "dd" and self._definicao is not None:
+            if self.pares:
+                self.pares[-1][1] = " ".join("".join(self._definicao).split())
+            self._definicao = None
+        elif tag == "a" and self._link is not None:
+            texto = _normalizar_rotulo("".join(self._link["texto"]))
+            if self.proxima is None and self._link["href"] and texto in ("proxima", "proxima pagina", ">", ">>"):
+                self.proxima = self._link["href"]
+            self._link = None
+
+    def handle_data(self, dados):
+        for destino in (self._celula, self._termo, self._definicao):
+            if destino is not None:
+                destino.append(dados)
+        if self._link is not None:
+            self._link["texto"].append(dados)
+
+
+# Linhas da listagem: [{"numero", "url", "assinatura", campos...}] e a URL da próxima página
+def extrair_listagem(html, url_pagina):
+    parser = ParserPagina()
+    parser.feed(html)
+    colunas = None
+    itens = []
+    for linha in parser.linhas:
+        if linha["cabecalho"]:
+            colunas = [_campo(celula) for celula in linha["celulas"]]
+            continue
+        if colunas is None or "numero" not in colunas:
+            continue
+        item = {}
+        for campo, valor in zip(colunas, linha["celulas"]):
+            if campo:
+                item[campo] = valor
+        if not item.get("numero"):
+            continue
+        item["url"] = urljoin(url_pagina, linha["links"][0]) if linha["links"] else None
+        # Qualquer mudança visível na linha (situação, prazo, data de atualização...) muda a assinatura
+        item["assinatura"] = hashlib.sha256("\x1f".join(linha["celulas"]).encode("utf-8")).hexdigest()
+        itens.append(item)
+    proxima = urljoin(url_pagina, parser.proxima) if parser.proxima else None
+    return itens, proxima
+
+
+# Campos do inquérito na página de detalhe (<dt>/<dd> ou linhas "rótulo | valor" de tabela)
+def extrair_detalhe(html):
+    parser = ParserPagina()
+    parser.feed(html)
+    pares = list(parser.pares)
+    pares += [linha["celulas"][:2] for linha in parser.linhas if len(linha["celulas"]) == 2]
+    detalhe = {}
+    for rotulo, valor in pares:
+        campo = _campo(rotulo)
+        if campo and campo not in detalhe:
+            detalhe[campo] = valor
+    return detalhe
+
+
+def _registro(item, detalhe):
+    dados = {**item, **{campo: valor for campo, valor in detalhe.items() if valor}}
+    return {
+        # O número da listagem é a chave da assinatura; o detalhe pode formatá-lo de outro jeito
+        "numero": item["numero"],
+        "descricao": dados.get("descricao"),
+        "data_criacao": converter_data(dados.get("data_criacao")),
+        "data_vencimento": converter_data(dados.get("data_vencimento")),
+    }
+
+
+def opcoes_chrome(headless=True):
+    opcoes = webdriver.ChromeOptions()
+    if headless:
+        opcoes.add_argument("--headless=new")
+    opcoes.add_argument("--no-sandbox")
+    opcoes.add_argument("--disable-dev-shm-usage")
+    opcoes.add_argument("--disable-gpu")
+    opcoes.add_argument("--blink-settings=imagesEnabled=false")
+    # Não esperar imagens e folhas de estilo: o DOM pronto basta para a extração
+    opcoes.page_load_strategy = "eager"
+    return opcoes
 
 # Função de exemplo para iniciar o navegador
 
-def iniciar_navegador():
-    driver = webdriver.Chrome()
-    driver.get('http://example.com')
-    return driver 
\ No newline at end of file
+def iniciar_navegador(url=None, headless=True):
+    if not SELENIUM_DISPONIVEL:
+        raise RuntimeError("Selenium não está instalado")
+    driver = webdriver.Chrome(options=opcoes_chrome(headless))
+    if url:
+        driver.get(url)
+    return driver
+
+
+# Navegadores headless reaproveitados entre páginas (cada um custa segundos e centenas de MB para abrir)
+class PoolNavegadores:
+    def __init__(self, tamanho=None, headless=None, timeout=None, max_usos=None):
+        self.tamanho = tamanho or obter_config("RPA", "RPA_NAVEGADORES", 2, int)
+        self.headless = obter_config("RPA", "RPA_HEADLESS", True, bool) if headless is None else headless
+        self.timeout = timeout or obter_config("RPA", "RPA_TIMEOUT", 30, float)
+        # Recriar o navegador depois de N páginas evita o crescimento de memória do Chrome
+        self.max_usos = max_usos or obter_config("RPA", "RPA_NAVEGADOR_MAX_USOS", 200, int)
+        self._livres = queue.LifoQueue()
+        self._usos = {}
+        self._criados = 0
+        self._lock = threading.Lock()
+        self.abertos = 0
+
+    def _abrir(self):
+        driver = iniciar_navegador(headless=self.headless)
+        driver.set_page_load_timeout(self.timeout)
+        self.abertos += 1
+        return driver
+
+    def _descartar(self, driver):
+        self._usos.pop(id(driver), None)
+        with self._lock:
+            self._criados -= 1
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Erro ao fechar o navegador: {str(e)}")
+
+    # Empresta um navegador (bloqueia enquanto todos estiverem em uso)
+    @contextmanager
+    def emprestar(self):
+        try:
+            driver = self._livres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                criar = self._criados < self.tamanho
+                if criar:
+                    self._criados += 1
+            if criar:
+                try:
+                    driver = self._abrir()
+                except Exception:
+                    with self._lock:
+                        self._criados -= 1
+                    raise
+            else:
+                driver = self._livres.get()
+        # Navegador que falhou no meio de uma página é descartado (pode ter ficado em estado inconsistente)
+        saudavel = False
+        try:
+            yield driver
+            saudavel = True
+        finally:
+            self._usos[id(driver)] = self._usos.get(id(driver), 0) + 1
+            if saudavel and self._usos[id(driver)] < self.max_usos:
+                self._livres.put(driver)
+            else:
+                self._descartar(driver)
+
+    # Carrega a página e devolve o HTML já renderizado pelo JavaScript
+    def baixar(self, url, seletor=None):
+        with self.emprestar() as driver:
+            driver.get(url)
+            if seletor:
+                WebDriverWait(driver, self.timeout).until(
+                    expected_conditions.presence_of_element_located((By.CSS_SELECTOR, seletor))
+                )
+            return driver.page_source
+
+    def encerrar(self):
+        while True:
+            try:
+                driver = self._livres.get_nowait()
+            except queue.Empty:
+                break
+            self._descartar(driver)
+
+
+class MotorRPA:
+    def __init__(self, url_base=None, caminho_listagem=None, modo_listagem=None, modo_detalhe=None,
+                 trabalhadores=None, tamanho_lote=None, navegadores=None):
+        self.url_base = url_base or obter_config("RPA", "RPA_URL_BASE", "http://localhost:8090")
+        self.caminho_listagem = caminho_listagem or obter_config("RPA", "RPA_CAMINHO_LISTAGEM", "/inqueritos")
+        # "http", "navegador" ou "auto" (HTTP primeiro; navegador se a página vier sem dados)
+        self.modo_listagem = modo_listagem or obter_config("RPA", "RPA_MODO_LISTAGEM", "auto")
+        self.modo_detalhe = modo_detalhe or obter_config("RPA", "RPA_MODO_DETALHE", "http")
+        for modo in (self.modo_listagem, self.modo_detalhe):
+            if modo not in MODOS:
+                raise ValueError(f"Modo de captura inválido: {modo} (use {', '.join(MODOS)})")
+        self.trabalhadores = trabalhadores or obter_config("RPA", "RPA_TRABALHADORES", 4, int)
+        self.tamanho_lote = tamanho_lote or obter_config("RPA", "RPA_TAMANHO_LOTE", 200, int)
+        self.timeout = obter_config("RPA", "RPA_TIMEOUT", 30, float)
+        self.max_paginas = obter_config("RPA", "RPA_MAX_PAGINAS", 1000, int)
+        self.navegadores = navegadores or PoolNavegadores()
+        self._sessao = None
+        self._modo_listagem = self.modo_listagem
+        self.ultima_sincronizacao = None
+
+    def abrir(self):
+        with pool_conexoes.conexao() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rpa_listagem (
+                    numero TEXT PRIMARY KEY, assinatura TEXT NOT NULL, sincronizado_em REAL NOT NULL
+                )
+            """)
+
+    def _assinaturas(self):
+        with pool_conexoes.conexao() as conn:
+            return dict(conn.execute("SELECT numero, assinatura FROM rpa_listagem"))
+
+    def _gravar(self, registros, assinaturas):
+        salvar_inqueritos(registros)
+        agora = time.time()
+        with pool_conexoes.conexao() as conn:
+            conn.executemany(
+                """INSERT INTO rpa_listagem (numero, assinatura, sincronizado_em) VALUES (?, ?, ?)
+                   ON CONFLICT (numero) DO UPDATE SET assinatura = excluded.assinatura,
+                                                      sincronizado_em = excluded.sincronizado_em""",
+                [(numero, assinatura, agora) for numero, assinatura in assinaturas],
+            )
+
+    async def _baixar_http(self, url):
+        async with self._sessao.get(url) as resposta:
+            resposta.raise_for_status()
+            return await resposta.text()
+
+    async def baixar(self, url, modo, seletor=None):
+        if modo == "navegador":
+            if not SELENIUM_DISPONIVEL:
+                raise RuntimeError("Modo navegador requer o Selenium instalado")
+            return await asyncio.to_thread(self.navegadores.baixar, url, seletor)
+        return await self._baixar_http(url)
+
+    async def _baixar_listagem(self, url):
+        modo = "http" if self._modo_listagem == "auto" else self._modo_listagem
+        itens, proxima = extrair_listagem(await self.baixar(url, modo, "table tr td"), url)
+        # Listagem montada por JavaScript: o HTML estático vem sem linhas (o resto da sincronização usa o navegador)
+        if not itens and self._modo_listagem == "auto" and SELENIUM_DISPONIVEL:
+            print(f"Listagem sem dados por HTTP; usando navegador: {url}")
+            self._modo_listagem = "navegador"
+            itens, proxima = extrair_listagem(await self.baixar(url, "navegador", "table tr td"), url)
+        return itens, proxima
+
+    async def _baixar_detalhe(self, url):
+        modo = "http" if self.modo_detalhe == "auto" else self.modo_detalhe
+        detalhe = extrair_detalhe(await self.baixar(url, modo, "dl, table"))
+        if not detalhe and self.modo_detalhe == "auto" and SELENIUM_DISPONIVEL:
+            detalhe = extrair_detalhe(await self.baixar(url, "navegador", "dl, table"))
+        return detalhe
+
+    async def _trabalhador(self, fila, estatisticas):
+        registros, assinaturas = [], []
+
+        async def descarregar():
+            if registros:
+                await asyncio.to_thread(self._gravar, list(registros), list(assinaturas))
+                estatisticas["gravados"] += len(registros)
+                registros.clear()
+                assinaturas.clear()
+
+        while True:
+            item = await fila.get()
+            try:
+                if item is None:
+                    await descarregar()
+                    return
+                detalhe = {}
+                if item.get("url"):
+                    detalhe = await self._baixar_detalhe(item["url"])
+                    estatisticas["detalhes"] += 1
+                registros.append(_registro(item, detalhe))
+                assinaturas.append((item["numero"], item["assinatura"]))
+                if len(registros) >= self.tamanho_lote:
+                    await descarregar()
+            except Exception as e:
+                estatisticas["falhas"] += 1
+                print(f"Erro ao capturar o inquérito {item.get('numero') if item else ''}: {str(e)}")
+            finally:
+                fila.task_done()
+
+    # Percorre a listagem e baixa os detalhes dos inquéritos novos ou alterados (todos, se completa=True)
+    async def sincronizar(self, completa=False):
+        inicio = time.perf_counter()
+        estatisticas = {"paginas": 0, "listados": 0, "alterados": 0, "detalhes": 0, "gravados": 0, "falhas": 0}
+        await asyncio.to_thread(self.abrir)
+        self._modo_listagem = self.modo_listagem
+        conhecidas = {} if completa else await asyncio.to_thread(self._assinaturas)
+        fila = asyncio.Queue(maxsize=self.trabalhadores * 4)
+        conector = aiohttp.TCPConnector(limit=self.trabalhadores + 1)
+        async with aiohttp.ClientSession(connector=conector, timeout=aiohttp.ClientTimeout(total=self.timeout)) as sessao:
+            self._sessao = sessao
+            tarefas = [asyncio.create_task(self._trabalhador(fila, estatisticas)) for _ in range(self.trabalhadores)]
+            try:
+                url = urljoin(self.url_base, self.caminho_listagem)
+                while url and estatisticas["paginas"] < self.max_paginas:
+                    itens, url = await self._baixar_listagem(url)
+                    estatisticas["paginas"] += 1
+                    estatisticas["listados"] += len(itens)
+                    for item in itens:
+                        if conhecidas.get(item["numero"]) == item["assinatura"]:
+                            continue
+                        estatisticas["alterados"] += 1
+                        await fila.put(item)
+                for _ in tarefas:
+                    await fila.put(None)
+                await asyncio.gather(*tarefas)
+            except BaseException:
+                for tarefa in tarefas:
+                    tarefa.cancel()
+                await asyncio.gather(*tarefas, return_exceptions=True)
+                raise
+            finally:
+                self._sessao = None
+        estatisticas["duracao"] = round(time.perf_counter() - inicio, 2)
+        estatisticas["concluida_em"] = time.time()
+        self.ultima_sincronizacao = estatisticas
+        print(f"Sincronização do IP-e concluída: {estatisticas}")
+        return estatisticas
+
+    def encerrar(self):
+        self.navegadores.encerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza os inquéritos do IP-e com o banco local")
+    parser.add_argument("--url", help="URL base do IP-e (padrão: [RPA] rpa_url_base)")
+    parser.add_argument("--listagem", help="Caminho da listagem (padrão: [RPA] rpa_caminho_listagem)")
+    parser.add_argument("--modo-listagem", choices=MODOS)
+    parser.add_argument("--modo-detalhe", choices=MODOS)
+    parser.add_argument("--trabalhadores", type=int)
+    parser.add_argument("--completa", action="store_true", help="Baixa todos os detalhes, mesmo sem mudança na listagem")
+    args = parser.parse_args()
+
+    from models import criar_banco_dados
+    criar_banco_dados()
+    motor = MotorRPA(args.url, args.listagem, args.modo_listagem, args.modo_detalhe, args.trabalhadores)
+    try:
+        asyncio.run(motor.sincronizar(completa=args.completa))
+    finally:
+        motor.encerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# servidor.py
+# Lançador do backend em produção: sobe N workers do uvicorn (um só, por padrão) atrás do
+# mesmo socket. Antes de iniciar os workers, o processo principal importa a aplicação (código ou configuração
+# com erro falham aqui, antes de qualquer worker subir) e faz uma única vez a preparação do banco.
+# Cada worker cria os próprios pools e caches no lifespan, com a sua parte dos limites globais (cota_por_worker).
+# Mais workers do que gerações simultâneas permitidas no Ollama não dividem o limite, multiplicam: nesse
+# caso o lançador se recusa a subir.
+#
+# Uso: python servidor.py --workers 4 --porta 8000
+#      kill -HUP <pid>   recarga gradual: cada worker é substituído por um novo só depois que o novo está pronto
+#      kill -TTIN/-TTOU <pid>   um worker a mais / a menos
+#      python servidor.py --reload   desenvolvimento: um processo, reiniciado a cada alteração no código
+
+import argparse
+import os
+import sys
+
+import uvicorn
+
+from config_manager import obter_config
+
+# Limites globais que os workers dividem entre si: (seção, chave, padrão, descrição, rígido). Com mais
+# workers do que o valor, cada worker fica com 1 e a soma passa do configurado; nos rígidos o servidor
+# não sobe, nos demais só há aviso
+LIMITES_DIVIDIDOS = (
+    ("AGENDADOR", "AGENDADOR_MAX_CONCORRENTES", 2, "gerações simultâneas no Ollama", True),
+    ("AGENDADOR", "AGENDADOR_MAX_FILA", 32, "requisições na fila do agendador", False),
+    ("EXTRACAO", "EXTRACAO_PROCESSOS", os.cpu_count() or 2, "processos de extração", False),
+)
+
+
+# Erros (limites rígidos) e avisos dos limites que não se dividem entre os workers
+def verificar_limites(workers):
+    erros = []
+    for secao, chave, padrao, descricao, rigido in LIMITES_DIVIDIDOS:
+        valor = obter_config(secao, chave, padrao, int)
+        if workers <= valor:
+            continue
+        mensagem = (
+            f"{workers} workers com [{secao}] {chave.lower()} = {valor}: cada worker ficaria com 1 e o servidor "
+            f"permitiria {workers} {descricao}"
+        )
+        if rigido:
+            erros.append(mensagem)
+        else:
+            print(f"AVISO: {mensagem}")
+    return erros
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor da API GPTPOL")
+    parser.add_argument("--host", default=obter_config("SERVIDOR", "SERVIDOR_HOST", "0.0.0.0"))
+    parser.add_argument("--porta", type=int, default=obter_config("SERVIDOR", "SERVIDOR_PORTA", 8000, int))
+    parser.add_argument(
+        "--workers", type=int, default=obter_config("SERVIDOR", "SERVIDOR_WORKERS", 1, int),
+        help="Processos da API (0 = um por núcleo; não pode passar de [AGENDADOR] agendador_max_concorrentes)"
+    )
+    parser.add_argument("--reload", action="store_true", help="Desenvolvimento: recarregar ao alterar o código")
+    args = parser.parse_args()
+
+    # O uvicorn importa "main_api:app" a partir do diretório do backend, de onde quer que o lançador seja chamado
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(diretorio)
+
+    if args.reload:
+        print(f"Iniciando servidor API GPTPOL em modo desenvolvimento na porta {args.porta}...")
+        uvicorn.run("main_api:app", host=args.host, port=args.porta, reload=True, reload_dirs=[diretorio])
+        return
+
+    workers = args.workers or os.cpu_count() or 1
+    erros = verificar_limites(workers)
+    if erros:
+        for erro in erros:
+            print(f"ERRO: {erro}")
+        print("Reduza --workers ou aumente o limite em config.ini.")
+        sys.exit(1)
+    # Os workers herdam a variável e dividem entre si os limites globais
+    os.environ["GPTPOL_WORKERS"] = str(workers)
+
+    import main_api
+    from data_manager import pool_conexoes
+    from models import encerrar_engines
+
+    if workers > 1:
+        main_api.preparar_armazenamento()
+        pool_conexoes.fechar()
+        encerrar_engines()
+
+    print(f"Iniciando servidor API GPTPOL na porta {args.porta} com {workers} workers...")
+    uvicorn.run(
+        "main_api:app",
+        host=args.host,
+        port=args.porta,
+        workers=workers,
+        # Requisições em andamento (streaming de respostas) têm este prazo para terminar no desligamento/recarga
+        timeout_graceful_shutdown=obter_config("SERVIDOR", "SERVIDOR_TIMEOUT_DESLIGAMENTO", 30, int),
+        timeout_keep_alive=obter_config("SERVIDOR", "SERVIDOR_TIMEOUT_KEEP_ALIVE", 5, int),
+    )
+
+
+if __name__ == "__main__":
+    main()
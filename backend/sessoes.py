@@ -0,0 +1,117 @@
+# sessoes.py
+# Este módulo mantém as sessões de conversa no servidor. Cada sessão guarda o vetor "context"
+# devolvido pelo Ollama no frame final (done), que é reenviado no turno seguinte para que o modelo
+# avalie apenas a nova mensagem do usuário. Sessões ociosas expiram e o total de tokens é limitado.
+
+import time
+from array import array
+from collections import OrderedDict
+
+from config_manager import obter_config, cota_por_worker
+
+
+# Sessão existente de outro usuário
+class SessaoDeOutroUsuario(Exception):
+    pass
+
+
+class Sessao:
+    def __init__(self, sessao_id, dono=""):
+        self.id = sessao_id
+        # Usuário que abriu a sessão: só ele continua a conversa com o contexto acumulado
+        self.dono = dono
+        self.criada_em = time.time()
+        self.ultimo_uso = self.criada_em
+        self.turnos = 0
+        # array de inteiros sem sinal: ~4 bytes por token em vez de um objeto int por posição
+        self._contexto = array("I")
+
+    @property
+    def contexto(self):
+        return self._contexto.tolist() if self._contexto else None
+
+    @property
+    def tamanho(self):
+        return len(self._contexto)
+
+
+class GerenciadorSessoes:
+    def __init__(self, ttl_ocioso=None, max_sessoes=None, max_tokens=None):
+        self.ttl_ocioso = ttl_ocioso or obter_config("SESSOES", "SESSOES_TTL_OCIOSO", 1800, float)
+        self.max_sessoes = max_sessoes or obter_config("SESSOES", "SESSOES_MAX", 1000, int)
+        self.max_tokens = max_tokens or cota_por_worker(obter_config("SESSOES", "SESSOES_MAX_TOKENS", 4_000_000, int))
+        # Ordenado do uso mais antigo para o mais recente
+        self._sessoes = OrderedDict()
+        self._tokens = 0
+        self.expiradas = 0
+        self.descartadas = 0
+
+    def obter(self, sessao_id):
+        self._expirar_ociosas()
+        sessao = self._sessoes.get(sessao_id)
+        if sessao is not None:
+            sessao.ultimo_uso = time.time()
+            self._sessoes.move_to_end(sessao_id)
+        return sessao
+
+    def obter_ou_criar(self, sessao_id, dono=""):
+        sessao = self.obter(sessao_id)
+        if sessao is not None and sessao.dono != (dono or ""):
+            raise SessaoDeOutroUsuario(sessao_id)
+        if sessao is None:
+            sessao = Sessao(sessao_id, dono or "")
+            self._sessoes[sessao_id] = sessao
+            self._respeitar_limites()
+        return sessao
+
+    # Guarda o contexto devolvido pelo Ollama ao final de um turno
+    def atualizar_contexto(self, sessao, contexto):
+        if not contexto or self._sessoes.get(sessao.id) is not sessao:
+            return
+        self._tokens -= sessao.tamanho
+        sessao._contexto = array("I", contexto)
+        sessao.turnos += 1
+        sessao.ultimo_uso = time.time()
+        self._tokens += sessao.tamanho
+        self._sessoes.move_to_end(sessao.id)
+        self._respeitar_limites()
+
+    # Descarta o contexto acumulado (o próximo turno recomeça com o prompt completo)
+    def reiniciar_contexto(self, sessao):
+        self._tokens -= sessao.tamanho
+        sessao._contexto = array("I")
+
+    def remover(self, sessao_id):
+        sessao = self._sessoes.pop(sessao_id, None)
+        if sessao is None:
+            return False
+        self._tokens -= sessao.tamanho
+        return True
+
+    def estatisticas(self):
+        self._expirar_ociosas()
+        return {
+            "sessoes": len(self._sessoes),
+            "tokens": self._tokens,
+            "max_sessoes": self.max_sessoes,
+            "max_tokens": self.max_tokens,
+            "ttl_ocioso": self.ttl_ocioso,
+            "expiradas": self.expiradas,
+            "descartadas": self.descartadas,
+        }
+
+    def _expirar_ociosas(self):
+        limite = time.time() - self.ttl_ocioso
+        while self._sessoes:
+            sessao = next(iter(self._sessoes.values()))
+            if sessao.ultimo_uso >= limite:
+                break
+            self.remover(sessao.id)
+            self.expiradas += 1
+
+    def _respeitar_limites(self):
+        # Descartar as sessões usadas há mais tempo até caber nos limites
+        while len(self._sessoes) > 1 and (len(self._sessoes) > self.max_sessoes or self._tokens > self.max_tokens):
+            sessao_id = next(iter(self._sessoes))
+            self.remover(sessao_id)
+            self.descartadas += 1
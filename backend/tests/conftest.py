@@ -0,0 +1,63 @@
+# conftest.py
+# Configuração comum dos testes: o diretório do backend entra no sys.path (os módulos são importados
+# pelo nome, como em main_api.py) e os servidores falsos do pacote benchmark sobem em portas livres.
+
+import os
+import socket
+import sys
+
+import pytest
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Servidor aiohttp (Ollama ou IPE falso) que pode ser parado e religado na mesma porta
+class ServidorFalso:
+    def __init__(self, app, porta=None):
+        self.app = app
+        self.porta = porta or porta_livre()
+        self.url = f"http://127.0.0.1:{self.porta}"
+        self._runner = None
+
+    async def iniciar(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.porta).start()
+        return self
+
+    async def parar(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.iniciar()
+
+    async def __aexit__(self, *exc):
+        await self.parar()
+
+
+# Banco SQLite temporário para o teste: DB_PATH aponta para tmp_path e o pool compartilhado de
+# data_manager e os engines de models.py são recriados no novo caminho
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    from data_manager import pool_conexoes
+    from models import criar_banco_dados, encerrar_engines
+
+    caminho = str(tmp_path / "inqueritos.db")
+    monkeypatch.setenv("DB_PATH", caminho)
+    pool_conexoes.fechar()
+    pool_conexoes._caminho = None
+    encerrar_engines()
+    criar_banco_dados()
+    yield caminho
+    pool_conexoes.fechar()
+    pool_conexoes._caminho = None
+    encerrar_engines()
@@ -0,0 +1,115 @@
+# test_agendador.py
+# Agendador das gerações: limite de concorrência, prioridade do chat interativo sobre os lotes na fila,
+# rejeição com Retry-After quando a fila enche e desistência por tempo de espera. As gerações vão para
+# um Ollama falso (benchmark/ollama_falso.py).
+
+import asyncio
+
+import pytest
+
+from agendador import PRIORIDADE_INTERATIVA, PRIORIDADE_LOTE, Agendador, FilaCheia, TempoEsperaExcedido
+from benchmark.ollama_falso import ConfiguracaoFalsa, criar_app
+from conftest import ServidorFalso
+from pool_ollama import PoolOllama
+
+MODELO = "deepseek-r1:32b"
+
+
+def test_interativa_passa_na_frente_do_lote():
+    async def cenario():
+        config = ConfiguracaoFalsa(modelos=(MODELO,), tokens_por_segundo=0, ttft=0.1, jitter=0, tokens=4)
+        async with ServidorFalso(criar_app(config)) as ollama:
+            pool = PoolOllama(ollama.url, intervalo_verificacao=60)
+            await pool.iniciar()
+            agendador = Agendador(max_concorrentes=1, max_fila=10, max_espera=0)
+            ordem = []
+
+            async def gerar(nome, prioridade):
+                async with agendador.slot(prioridade):
+                    ordem.append(nome)
+                    assert agendador.ativos == 1
+                    status, _ = await pool.gerar({"model": MODELO, "prompt": nome, "stream": False})
+                    assert status == 200
+
+            try:
+                tarefas = [asyncio.create_task(gerar("lote-1", PRIORIDADE_LOTE))]
+                await asyncio.sleep(0.02)
+                tarefas.append(asyncio.create_task(gerar("lote-2", PRIORIDADE_LOTE)))
+                tarefas.append(asyncio.create_task(gerar("lote-3", PRIORIDADE_LOTE)))
+                await asyncio.sleep(0.02)
+                tarefas.append(asyncio.create_task(gerar("chat", PRIORIDADE_INTERATIVA)))
+                await asyncio.sleep(0.02)
+                assert agendador.em_fila == 3
+                await asyncio.gather(*tarefas)
+            finally:
+                await pool.encerrar()
+
+            # A geração em andamento não é interrompida; o chat é o próximo a sair da fila
+            assert ordem == ["lote-1", "chat", "lote-2", "lote-3"]
+            assert agendador.ativos == agendador.em_fila == 0
+
+    asyncio.run(cenario())
+
+
+def test_posicao_na_fila():
+    async def cenario():
+        agendador = Agendador(max_concorrentes=1, max_fila=10, max_espera=0)
+        ativa = agendador.reservar(PRIORIDADE_LOTE)
+        lote = agendador.reservar(PRIORIDADE_LOTE)
+        chat = agendador.reservar(PRIORIDADE_INTERATIVA)
+        assert (ativa.posicao(), chat.posicao(), lote.posicao()) == (0, 1, 2)
+        chat.liberar()
+        assert lote.posicao() == 1
+        assert agendador.desistencias == 1
+        ativa.liberar()
+        assert lote.concedida
+        lote.liberar()
+
+    asyncio.run(cenario())
+
+
+def test_fila_cheia_com_retry_after():
+    async def cenario():
+        agendador = Agendador(max_concorrentes=1, max_fila=1, max_espera=0)
+        ativa = agendador.reservar()
+        na_fila = agendador.reservar()
+        with pytest.raises(FilaCheia) as erro:
+            agendador.reservar()
+        assert erro.value.retry_after >= 1
+        assert agendador.rejeitadas == 1
+        # O Retry-After cresce com a fila (duração média por rodada de max_concorrentes gerações)
+        assert erro.value.retry_after == agendador.estimar_retry_after()
+        assert Agendador(max_concorrentes=1, max_fila=5, max_espera=0).estimar_retry_after() < erro.value.retry_after
+        na_fila.liberar()
+        ativa.liberar()
+        # Com vaga livre a admissão volta a passar
+        agendador.verificar_admissao()
+
+    asyncio.run(cenario())
+
+
+def test_erro_agendador_envia_retry_after():
+    from main_api import erro_agendador
+
+    cheia = erro_agendador(FilaCheia(12))
+    assert cheia.status_code == 429
+    assert cheia.headers == {"Retry-After": "12"}
+    espera = erro_agendador(TempoEsperaExcedido(7))
+    assert espera.status_code == 503
+    assert espera.headers == {"Retry-After": "7"}
+
+
+def test_tempo_de_espera_excedido():
+    async def cenario():
+        agendador = Agendador(max_concorrentes=1, max_fila=5, max_espera=0.2)
+        ativa = agendador.reservar()
+        with pytest.raises(TempoEsperaExcedido) as erro:
+            async with agendador.slot():
+                pass
+        assert erro.value.retry_after >= 1
+        assert agendador.em_fila == 0
+        assert agendador.desistencias == 1
+        ativa.liberar()
+        assert agendador.ativos == 0
+
+    asyncio.run(cenario())
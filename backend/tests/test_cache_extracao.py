@@ -0,0 +1,99 @@
+# test_cache_extracao.py
+# Cache do texto extraído compartilhado entre workers: documento gravado por um worker é encontrado
+# pelo outro, o último acesso (mtime) vale para todos, o limite é do diretório inteiro e só um worker
+# faz a limpeza por vez (lock no arquivo .limpeza.lock).
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from cache_extracao import CacheExtracao, fcntl
+
+
+def envelhecer(cache, chave, segundos):
+    caminho = cache._caminho(chave)
+    instante = time.time() - segundos
+    os.utime(caminho, (instante, instante))
+
+
+def test_documento_gravado_por_outro_worker(tmp_path):
+    async def cenario():
+        worker_a = CacheExtracao(str(tmp_path), max_bytes=10_000)
+        worker_b = CacheExtracao(str(tmp_path), max_bytes=10_000)
+        await worker_a.iniciar()
+        await worker_b.iniciar()
+        await worker_a.guardar("abc", "application/pdf", "Texto do PDF")
+        assert await worker_b.obter("abc", "application/pdf") == "Texto do PDF"
+        # O mesmo conteúdo declarado com outro tipo é outro documento
+        assert await worker_b.obter("abc", "text/plain") is None
+        assert worker_b.estatisticas()["documentos"] == 1
+        assert (worker_b.hits, worker_b.misses) == (1, 1)
+        # Arquivo removido por outro worker: a consulta falha e sai do índice local
+        os.unlink(worker_a._caminho(worker_a.chave("abc", "application/pdf")))
+        assert await worker_b.obter("abc", "application/pdf") is None
+        assert worker_b.estatisticas()["documentos"] == 0
+
+    asyncio.run(cenario())
+
+
+def test_limite_vale_para_o_diretorio_inteiro(tmp_path):
+    async def cenario():
+        worker_a = CacheExtracao(str(tmp_path), max_bytes=250)
+        worker_b = CacheExtracao(str(tmp_path), max_bytes=250)
+        await worker_a.iniciar()
+        await worker_b.iniciar()
+        await worker_a.guardar("a1", "text/plain", "a" * 100)
+        await worker_a.guardar("a2", "text/plain", "b" * 100)
+        envelhecer(worker_a, "a1.txt", 300)
+        envelhecer(worker_a, "a2.txt", 200)
+        # Lido pelo worker B: o acesso atualiza o mtime e protege o documento da limpeza
+        assert await worker_b.obter("a1", "text/plain") == "a" * 100
+
+        await worker_b.guardar("b1", "text/plain", "c" * 100)
+        restantes = sorted(nome for nome in os.listdir(tmp_path) if nome.endswith(".txt"))
+        assert restantes == ["a1.txt.txt", "b1.txt.txt"]
+        # O índice do worker B passa a refletir o diretório, inclusive o que A gravou
+        assert worker_b.estatisticas()["documentos"] == 2
+        assert worker_b.estatisticas()["bytes"] == 200
+
+        # Texto maior que o cache inteiro não fica no disco
+        await worker_a.guardar("grande", "text/plain", "g" * 300)
+        assert await worker_b.obter("grande", "text/plain") is None
+
+    asyncio.run(cenario())
+
+
+@pytest.mark.skipif(fcntl is None, reason="requer fcntl")
+def test_limpeza_de_um_worker_por_vez(tmp_path):
+    async def cenario():
+        cache = CacheExtracao(str(tmp_path), max_bytes=150)
+        await cache.iniciar()
+        # Outro worker está limpando: este grava sem esperar o lock e não remove nada
+        with open(os.path.join(tmp_path, ".limpeza.lock"), "w") as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            await cache.guardar("d1", "text/plain", "x" * 100)
+            await cache.guardar("d2", "text/plain", "y" * 100)
+            assert len([nome for nome in os.listdir(tmp_path) if nome.endswith(".txt")]) == 2
+        # Com o lock livre, a próxima gravação faz a limpeza do diretório
+        envelhecer(cache, "d1.txt", 100)
+        await cache.guardar("d3", "text/plain", "z" * 10)
+        restantes = sorted(nome for nome in os.listdir(tmp_path) if nome.endswith(".txt"))
+        assert restantes == ["d2.txt.txt", "d3.txt.txt"]
+
+    asyncio.run(cenario())
+
+
+def test_invalidar_remove_os_documentos_de_todos_os_workers(tmp_path):
+    async def cenario():
+        worker_a = CacheExtracao(str(tmp_path), max_bytes=10_000)
+        worker_b = CacheExtracao(str(tmp_path), max_bytes=10_000)
+        await worker_a.iniciar()
+        await worker_b.iniciar()
+        await worker_a.guardar("a", "text/plain", "texto a")
+        await worker_b.guardar("b", "text/plain", "texto b")
+        assert await worker_b.invalidar() == 2
+        assert await worker_a.obter("a", "text/plain") is None
+
+    asyncio.run(cenario())
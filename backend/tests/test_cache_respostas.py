@@ -0,0 +1,129 @@
+# test_cache_respostas.py
+# Cache de respostas: chave, LRU com limites de itens e bytes, TTL e camada SQLite que sobrevive
+# a um reinício do processo.
+
+import asyncio
+import time
+
+from cache_respostas import CacheRespostas, gerar_chave
+
+OPCOES = {"temperature": 0.7, "num_ctx": 4096}
+
+
+def test_chave_depende_de_tudo_o_que_muda_a_resposta():
+    base = gerar_chave("deepseek-r1:32b", "prompt", OPCOES, False)
+    assert base == gerar_chave("deepseek-r1:32b", "prompt", dict(reversed(list(OPCOES.items()))), False)
+    assert base == gerar_chave("deepseek-r1:32b", "prompt", OPCOES, False, "")
+    assert len({
+        base,
+        gerar_chave("llama3:8b", "prompt", OPCOES, False),
+        gerar_chave("deepseek-r1:32b", "outro prompt", OPCOES, False),
+        gerar_chave("deepseek-r1:32b", "prompt", {**OPCOES, "num_ctx": 8192}, False),
+        gerar_chave("deepseek-r1:32b", "prompt", OPCOES, True),
+        gerar_chave("deepseek-r1:32b", "prompt", OPCOES, False, "ana"),
+    }) == 6
+
+
+def test_lru_por_itens():
+    async def cenario():
+        cache = CacheRespostas(max_itens=2, max_bytes=1024, ttl=0)
+        await cache.guardar("a", "resposta a")
+        await cache.guardar("b", "resposta b")
+        # Acessar "a" faz de "b" o menos usado
+        assert await cache.obter("a") == "resposta a"
+        await cache.guardar("c", "resposta c")
+        assert await cache.obter("b") is None
+        assert await cache.obter("a") == "resposta a"
+        assert await cache.obter("c") == "resposta c"
+        estatisticas = cache.estatisticas()
+        assert estatisticas["itens_memoria"] == 2
+        assert (estatisticas["hits_memoria"], estatisticas["misses"]) == (3, 1)
+
+    asyncio.run(cenario())
+
+
+def test_lru_por_bytes():
+    async def cenario():
+        cache = CacheRespostas(max_itens=100, max_bytes=25, ttl=0)
+        await cache.guardar("a", "x" * 10)
+        await cache.guardar("b", "y" * 10)
+        await cache.guardar("c", "z" * 10)
+        assert await cache.obter("a") is None
+        assert cache.estatisticas()["bytes_memoria"] == 20
+        # Resposta maior que o cache inteiro não é guardada (nem expulsa as outras)
+        await cache.guardar("grande", "g" * 30)
+        assert await cache.obter("grande") is None
+        assert await cache.obter("b") == "y" * 10
+        # Bytes contados em UTF-8
+        await cache.guardar("b", "ã" * 5)
+        assert cache.estatisticas()["bytes_memoria"] == 20
+
+    asyncio.run(cenario())
+
+
+def test_ttl():
+    async def cenario():
+        cache = CacheRespostas(max_itens=10, max_bytes=1024, ttl=0.2)
+        await cache.guardar("a", "resposta")
+        assert await cache.obter("a") == "resposta"
+        await asyncio.sleep(0.3)
+        assert await cache.obter("a") is None
+        assert cache.estatisticas()["itens_memoria"] == 0
+
+    asyncio.run(cenario())
+
+
+def test_camada_sqlite_sobrevive_ao_reinicio(tmp_path):
+    caminho = str(tmp_path / "cache.db")
+
+    async def cenario():
+        cache = CacheRespostas(max_itens=10, max_bytes=1024, ttl=0, caminho_sqlite=caminho)
+        cache.iniciar()
+        await cache.guardar("a", "resposta persistida")
+        await cache.guardar("vazia", "")
+        cache.encerrar()
+
+        # Outro processo (ou um reinício): memória vazia, resposta vem do disco e volta para a memória
+        novo = CacheRespostas(max_itens=10, max_bytes=1024, ttl=0, caminho_sqlite=caminho)
+        novo.iniciar()
+        try:
+            assert await novo.obter("a") == "resposta persistida"
+            assert await novo.obter("a") == "resposta persistida"
+            assert await novo.obter("vazia") is None
+            estatisticas = novo.estatisticas()
+            assert (estatisticas["hits_disco"], estatisticas["hits_memoria"]) == (1, 1)
+            assert estatisticas["itens_disco"] == 1
+
+            assert await novo.invalidar("a") == 1
+            assert await novo.obter("a") is None
+            assert novo.estatisticas()["itens_disco"] == 0
+        finally:
+            novo.encerrar()
+
+    asyncio.run(cenario())
+
+
+def test_camada_sqlite_respeita_ttl_e_limite(tmp_path):
+    caminho = str(tmp_path / "cache.db")
+
+    async def cenario():
+        cache = CacheRespostas(max_itens=1, max_bytes=1024, ttl=0.2, caminho_sqlite=caminho)
+        cache.iniciar()
+        try:
+            cache._disco.max_itens = 2
+            for chave in ("a", "b", "c"):
+                await cache.guardar(chave, f"resposta {chave}")
+                time.sleep(0.01)
+            # Disco guarda as 2 mais recentes; memória só a última
+            assert cache.estatisticas()["itens_disco"] == 2
+            assert await cache.obter("a") is None
+            assert await cache.obter("b") == "resposta b"
+            await asyncio.sleep(0.3)
+            cache._itens.clear()
+            cache._bytes = 0
+            assert await cache.obter("c") is None
+            assert cache.estatisticas()["itens_disco"] == 1
+        finally:
+            cache.encerrar()
+
+    asyncio.run(cenario())
@@ -0,0 +1,144 @@
+# test_cache_semantico.py
+# Cache semântico com os embeddings do Ollama falso: paráfrase reaproveita a resposta, escopo separa
+# números citados, documentos e usuários, entradas saem por TTL e por uso, e uma falha no endpoint de
+# embeddings suspende o cache por um tempo.
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from benchmark.ollama_falso import ConfiguracaoFalsa, criar_app
+from cache_semantico import CacheSemantico, gerar_escopo
+from conftest import ServidorFalso
+from pool_ollama import PoolOllama
+
+MODELO = "deepseek-r1:32b"
+
+
+def cenario_com_ollama(teste, **kwargs):
+    async def executar():
+        config = ConfiguracaoFalsa(modelos=(MODELO,), ttft=0, jitter=0)
+        async with ServidorFalso(criar_app(config)) as ollama:
+            pool = PoolOllama(ollama.url, intervalo_verificacao=60)
+            await pool.iniciar()
+            try:
+                cache = CacheSemantico(pool, **{"modelo": "nomic-embed-text", "limiar": 0.9, **kwargs})
+                cache.ativo = True
+                await teste(cache)
+            finally:
+                await pool.encerrar()
+
+    asyncio.run(executar())
+
+
+def test_escopo():
+    base = gerar_escopo(MODELO, False, "Qual o prazo do inquérito?")
+    assert base == gerar_escopo(MODELO, False, "qual é o prazo do inquérito")
+    assert base != gerar_escopo(MODELO, True, "Qual o prazo do inquérito?")
+    assert base != gerar_escopo(MODELO, False, "Qual o prazo do inquérito 12/2024?")
+    assert base != gerar_escopo(MODELO, False, "Qual o prazo?", ["doc-1\ntrecho"])
+    assert gerar_escopo(MODELO, False, "x", ["doc-1\na", "doc-2\nb"]) == gerar_escopo(MODELO, False, "x", ["doc-2\nc", "doc-1\nd"])
+    assert gerar_escopo(MODELO, False, "x", ["doc-1\na"], "ana") != gerar_escopo(MODELO, False, "x", ["doc-1\na"], "bia")
+
+
+def test_parafrase_reaproveita_a_resposta():
+    async def teste(cache):
+        original = "Qual o prazo do inquérito policial"
+        escopo = gerar_escopo(MODELO, False, original)
+        resposta, vetor = await cache.buscar(original, escopo)
+        assert resposta is None and vetor is not None
+        cache.guardar(vetor, original, "30 dias com o investigado solto", escopo)
+
+        resposta, _ = await cache.buscar("qual é o prazo do inquérito policial", escopo)
+        assert resposta == "30 dias com o investigado solto"
+        # Pergunta sem relação, no mesmo escopo, não acerta
+        resposta, _ = await cache.buscar("quem assina o relatório final", escopo)
+        assert resposta is None
+        # Outro escopo (outro usuário) não enxerga a resposta
+        resposta, _ = await cache.buscar(original, gerar_escopo(MODELO, False, original, ["doc\nx"], "bia"))
+        assert resposta is None
+        estatisticas = cache.estatisticas()
+        assert (estatisticas["hits"], estatisticas["misses"]) == (1, 3)
+        assert estatisticas["similaridade"]["acima_do_limiar"] == 1
+
+    cenario_com_ollama(teste)
+
+
+def test_pergunta_repetida_substitui_a_entrada():
+    async def teste(cache):
+        escopo = gerar_escopo(MODELO, False, "prazo")
+        _, vetor = await cache.buscar("qual o prazo", escopo)
+        cache.guardar(vetor, "qual o prazo", "primeira", escopo)
+        cache.guardar(vetor, "qual o prazo", "segunda", escopo)
+        assert cache.estatisticas()["entradas"] == 1
+        assert (await cache.buscar("qual o prazo", escopo))[0] == "segunda"
+
+    cenario_com_ollama(teste)
+
+
+def test_capacidade_e_ttl():
+    async def teste(cache):
+        escopo = gerar_escopo(MODELO, False, "")
+        vetores = {}
+        for pergunta in ("quem é o delegado", "qual a vara competente", "onde fica a delegacia"):
+            _, vetores[pergunta] = await cache.buscar(pergunta, escopo)
+        cache.guardar(vetores["quem é o delegado"], "quem é o delegado", "resposta 1", escopo)
+        cache.guardar(vetores["qual a vara competente"], "qual a vara competente", "resposta 2", escopo)
+        # Usar a primeira faz da segunda a menos usada: é ela que sai quando o índice enche
+        await asyncio.sleep(0.01)
+        assert (await cache.buscar("quem é o delegado", escopo))[0] == "resposta 1"
+        cache.guardar(vetores["onde fica a delegacia"], "onde fica a delegacia", "resposta 3", escopo)
+        assert cache.estatisticas()["entradas"] == 2
+        assert (await cache.buscar("qual a vara competente", escopo))[0] is None
+        assert (await cache.buscar("onde fica a delegacia", escopo))[0] == "resposta 3"
+
+        # Entradas vencidas não são devolvidas
+        await asyncio.sleep(0.35)
+        assert (await cache.buscar("quem é o delegado", escopo))[0] is None
+
+    cenario_com_ollama(teste, capacidade=2, ttl=0.3)
+
+
+def test_limite_de_escopos():
+    async def teste(cache):
+        cache.max_escopos = 2
+        for numero in (1, 2, 3):
+            pergunta = f"situação do inquérito {numero}"
+            escopo = gerar_escopo(MODELO, False, pergunta)
+            _, vetor = await cache.buscar(pergunta, escopo)
+            cache.guardar(vetor, pergunta, f"resposta {numero}", escopo)
+        assert cache.estatisticas()["escopos"] == 2
+        assert (await cache.buscar("situação do inquérito 1", gerar_escopo(MODELO, False, "situação do inquérito 1")))[0] is None
+        assert (await cache.buscar("situação do inquérito 3", gerar_escopo(MODELO, False, "situação do inquérito 3")))[0] == "resposta 3"
+
+    cenario_com_ollama(teste)
+
+
+def test_falha_nos_embeddings_suspende_o_cache():
+    async def teste(cache):
+        cache.pausa_erro = 0.3
+        # Modelo de embedding que o Ollama não tem: erro 404
+        assert await cache.buscar("qual o prazo", "escopo") == (None, None)
+        assert cache.erros == 1
+        assert cache.estatisticas()["suspenso"]
+        # Suspenso: nem consulta o Ollama
+        assert await cache.buscar("qual o prazo", "escopo") == (None, None)
+        assert (cache.erros, cache.ignoradas) == (1, 1)
+
+        await asyncio.sleep(0.35)
+        cache.modelo = "nomic-embed-text"
+        resposta, vetor = await cache.buscar("qual o prazo", "escopo")
+        assert resposta is None and vetor is not None
+
+    cenario_com_ollama(teste, modelo="modelo-inexistente")
+
+
+def test_pergunta_longa_nao_passa_pelo_cache():
+    async def teste(cache):
+        assert await cache.buscar("texto colado " * 200, "escopo") == (None, None)
+        assert cache.ignoradas == 1
+        assert cache.erros == 0
+
+    cenario_com_ollama(teste)
@@ -0,0 +1,129 @@
+# test_coalescencia.py
+# Coalescência de perguntas idênticas: uma única geração no Ollama falso é repassada a todos os
+# assinantes (inclusive os que chegam no meio), sobrevive à saída de quem a iniciou e só é cancelada
+# quando o último assinante desiste.
+
+import asyncio
+import json
+
+import aiohttp
+
+from benchmark.ollama_falso import ConfiguracaoFalsa, criar_app
+from coalescencia import Coalescedor, normalizar_texto
+from conftest import ServidorFalso
+from pool_ollama import PoolOllama
+
+MODELO = "deepseek-r1:32b"
+
+
+def configuracao():
+    return ConfiguracaoFalsa(modelos=(MODELO,), tokens_por_segundo=50, ttft=0.05, jitter=0, tokens=20)
+
+
+# Linhas NDJSON do /api/generate em streaming, como o relay repassa ao cliente
+async def gerar_stream(pool, prompt):
+    async with pool.gerar_stream({"model": MODELO, "prompt": prompt, "stream": True}) as resposta:
+        async for linha in resposta.content:
+            yield linha
+
+
+async def consumir(gerador, frames, parar_em=None):
+    async for frame in gerador:
+        frames.append(json.loads(frame))
+        if parar_em is not None and len(frames) >= parar_em:
+            await gerador.aclose()
+            return frames
+    return frames
+
+
+async def estatisticas(servidor):
+    async with aiohttp.ClientSession() as sessao:
+        async with sessao.get(f"{servidor.url}/_estatisticas") as resposta:
+            return await resposta.json()
+
+
+def test_normalizar_texto():
+    assert normalizar_texto("  Qual o PRAZO\n do inquérito? ") == normalizar_texto("qual o prazo do inquérito?")
+
+
+def test_assinantes_recebem_a_mesma_geracao():
+    async def cenario():
+        async with ServidorFalso(criar_app(configuracao())) as ollama:
+            pool = PoolOllama(ollama.url, intervalo_verificacao=60)
+            await pool.iniciar()
+            coalescedor = Coalescedor()
+            try:
+                criar = lambda: gerar_stream(pool, "Qual o prazo?")
+                primeiro = asyncio.create_task(consumir(coalescedor.assinar("chave", criar), []))
+                await asyncio.sleep(0.15)
+                # Chegam no meio da geração: recebem os frames já produzidos e seguem ao vivo
+                assert coalescedor.em_andamento("chave")
+                outros = [asyncio.create_task(consumir(coalescedor.assinar("chave", criar), [])) for _ in range(2)]
+                resultados = await asyncio.gather(primeiro, *outros)
+            finally:
+                await pool.encerrar()
+
+            assert resultados[0] == resultados[1] == resultados[2]
+            assert len(resultados[0]) == 21
+            assert resultados[0][-1]["done"] is True
+            assert coalescedor.estatisticas() == {"em_andamento": 0, "assinantes": 0, "geracoes": 1, "coalescidas": 2}
+            assert (await estatisticas(ollama))["geracoes"] == 1
+
+    asyncio.run(cenario())
+
+
+def test_saida_de_quem_iniciou_nao_cancela_os_demais():
+    async def cenario():
+        async with ServidorFalso(criar_app(configuracao())) as ollama:
+            pool = PoolOllama(ollama.url, intervalo_verificacao=60)
+            await pool.iniciar()
+            coalescedor = Coalescedor()
+            try:
+                criar = lambda: gerar_stream(pool, "Quem é o autor?")
+                lider = asyncio.create_task(consumir(coalescedor.assinar("chave", criar), []))
+                seguidor = asyncio.create_task(consumir(coalescedor.assinar("chave", criar), []))
+                await asyncio.sleep(0.15)
+                # Cliente do líder desconecta no meio do streaming
+                lider.cancel()
+                await asyncio.gather(lider, return_exceptions=True)
+                assert coalescedor.estatisticas()["assinantes"] == 1
+
+                frames = await seguidor
+            finally:
+                await pool.encerrar()
+
+            assert len(frames) == 21
+            assert frames[-1]["done"] is True
+            assert (await estatisticas(ollama))["geracoes"] == 1
+
+    asyncio.run(cenario())
+
+
+def test_ultimo_assinante_a_sair_cancela_a_geracao():
+    async def cenario():
+        async with ServidorFalso(criar_app(configuracao())) as ollama:
+            pool = PoolOllama(ollama.url, intervalo_verificacao=60)
+            await pool.iniciar()
+            coalescedor = Coalescedor()
+            try:
+                criar = lambda: gerar_stream(pool, "Resuma o caso.")
+                a = await consumir(coalescedor.assinar("chave", criar), [], parar_em=3)
+                assert len(a) == 3
+                await asyncio.sleep(0.05)
+                # Sem assinantes, a geração é cancelada e a conexão com o Ollama é fechada
+                assert not coalescedor.em_andamento("chave")
+                assert pool.backends[0].pendentes == 0
+                for _ in range(20):
+                    if (await estatisticas(ollama))["ativas"] == 0:
+                        break
+                    await asyncio.sleep(0.05)
+                assert (await estatisticas(ollama))["ativas"] == 0
+
+                # A mesma pergunta depois disso inicia uma geração nova
+                frames = await consumir(coalescedor.assinar("chave", criar), [])
+                assert frames[-1]["done"] is True
+                assert coalescedor.geracoes == 2
+            finally:
+                await pool.encerrar()
+
+    asyncio.run(cenario())
@@ -0,0 +1,81 @@
+# test_documentos.py
+# Pipeline map-reduce de documentos longos: limite de trechos e corte das anotações que continuam
+# acima do limite do reduce depois das rodadas de condensação.
+
+import asyncio
+import json
+
+import pytest
+
+from documentos import DocumentoGrandeDemais, PipelineDocumento, dividir_em_trechos
+from orcamento_tokens import estimar_tokens
+
+
+def texto_longo(paragrafos):
+    return "\n\n".join(f"Parágrafo {i}: " + "depoimento da testemunha sobre o fato " * 20 for i in range(paragrafos))
+
+
+def coletar(gerador):
+    async def consumir():
+        return [json.loads(frame) async for frame in gerador]
+    return asyncio.run(consumir())
+
+
+def test_dividir_em_trechos_com_sobreposicao():
+    texto = texto_longo(30)
+    trechos = dividir_em_trechos(texto, 200, 20)
+    assert len(trechos) > 1
+    assert all(estimar_tokens(trecho) <= 260 for trecho in trechos)
+    # O fim de um trecho reaparece no começo do seguinte
+    assert trechos[0][-40:] in trechos[1]
+
+
+def test_documento_acima_do_maximo_de_trechos():
+    pipeline = PipelineDocumento(None, None, tokens_por_trecho=200, sobreposicao=20, max_trechos=3)
+    with pytest.raises(DocumentoGrandeDemais) as erro:
+        pipeline.dividir(texto_longo(30))
+    assert erro.value.maximo == 3
+    assert erro.value.trechos > 3
+    assert len(pipeline.dividir(texto_longo(2))) <= 3
+
+
+def test_anotacoes_cortadas_quando_a_condensacao_nao_basta():
+    prompts_finais = []
+
+    # Cada trecho e cada condensação devolvem uma anotação longa: as rodadas nunca ficam abaixo do limite
+    async def gerar(prompt):
+        return "anotação extensa sobre o depoimento " * 60
+
+    async def gerar_stream(prompt, thinkkn_mode):
+        prompts_finais.append(prompt)
+        yield json.dumps({"response": "ok", "done": True}) + "\n"
+
+    pipeline = PipelineDocumento(
+        gerar, gerar_stream, tokens_por_trecho=200, sobreposicao=20, concorrencia=2, limite_reducao=300, max_trechos=50
+    )
+    frames = coletar(pipeline.responder("Quem é o autor?", texto_longo(20)))
+
+    rodadas = [f["progress"] for f in frames if f.get("progress", {}).get("etapa") == "reduce"]
+    assert [r["rodada"] for r in rodadas if "grupos" in r] == [1, 2, 3]
+    assert rodadas[-1]["cortado"] is True
+    assert frames[-1] == {"response": "ok", "done": True}
+    anotacoes = prompts_finais[0].split("Anotações do documento:\n", 1)[1].split("\n\nPergunta:", 1)[0]
+    # Os cabeçalhos "[Parte N]" ficam fora do limite; o texto das anotações cabe nele
+    corpo = "\n\n".join(linha for linha in anotacoes.split("\n") if not linha.startswith("[Parte "))
+    assert estimar_tokens(corpo) <= 300
+
+
+def test_documento_curto_vai_direto_para_a_resposta():
+    chamadas = []
+
+    async def gerar(prompt):
+        chamadas.append(prompt)
+        return ""
+
+    async def gerar_stream(prompt, thinkkn_mode):
+        yield json.dumps({"response": "curto", "done": True}) + "\n"
+
+    pipeline = PipelineDocumento(gerar, gerar_stream, tokens_por_trecho=2500, sobreposicao=200, max_trechos=1)
+    frames = coletar(pipeline.responder("Qual a data?", "Instaurado em 02/01/2024."))
+    assert frames == [{"response": "curto", "done": True}]
+    assert chamadas == []
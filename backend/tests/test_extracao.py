@@ -0,0 +1,58 @@
+# test_extracao.py
+# Pool de extração: texto de arquivos em processos separados e troca do pool quando uma extração passa
+# do tempo limite (o processo preso é encerrado, sem acessar atributos internos do ProcessPoolExecutor).
+
+import asyncio
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from extracao import PoolExtracao, TempoExtracaoExcedido
+
+
+def test_extrai_texto_no_pool(tmp_path):
+    caminho = tmp_path / "depoimento.txt"
+    caminho.write_text("Depoimento da testemunha.\nSegunda linha.", encoding="utf-8")
+
+    async def cenario():
+        pool = PoolExtracao(processos=1, timeout=30)
+        try:
+            assert await pool.extrair(str(caminho), "text/plain") == "Depoimento da testemunha.\nSegunda linha."
+            assert await pool.extrair(str(caminho), "text/plain", max_caracteres=11) == "Depoimento "
+        finally:
+            pool.encerrar()
+
+    asyncio.run(cenario())
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="requer os.mkfifo")
+def test_tempo_limite_encerra_o_processo_preso(tmp_path):
+    # Ler um FIFO sem escritor bloqueia o processo do pool para sempre
+    fifo = tmp_path / "preso.txt"
+    os.mkfifo(fifo)
+    normal = tmp_path / "normal.txt"
+    normal.write_text("texto", encoding="utf-8")
+
+    async def cenario():
+        pool = PoolExtracao(processos=1, timeout=1)
+        try:
+            # Processo já iniciado (e com o PID informado) antes da extração que trava
+            assert await pool.extrair(str(normal), "text/plain") == "texto"
+            antigos = {processo.pid for processo in multiprocessing.active_children()}
+            with pytest.raises(TempoExtracaoExcedido):
+                await pool.extrair(str(fifo), "text/plain")
+            assert pool.reinicios == 1
+
+            fim = time.monotonic() + 10
+            while antigos & {processo.pid for processo in multiprocessing.active_children()}:
+                assert time.monotonic() < fim, "processo preso no pool antigo não foi encerrado"
+                await asyncio.sleep(0.1)
+
+            # O pool novo atende as próximas extrações
+            assert await pool.extrair(str(normal), "text/plain") == "texto"
+        finally:
+            pool.encerrar()
+
+    asyncio.run(cenario())
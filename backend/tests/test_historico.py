@@ -0,0 +1,121 @@
+# test_historico.py
+# Histórico das conversas: paginação por cursor (sem repetir nem pular conversas com a mesma data),
+# páginas de mensagens, isolamento entre usuários e compactação em resumo com o Ollama falso.
+
+import asyncio
+
+import pytest
+
+from benchmark.ollama_falso import ConfiguracaoFalsa, criar_app
+from conftest import ServidorFalso
+from data_manager import PoolConexoes
+from historico import HistoricoConversas
+from pool_ollama import PoolOllama
+
+MODELO = "deepseek-r1:32b"
+
+
+@pytest.fixture
+def historico(tmp_path):
+    pool = PoolConexoes(str(tmp_path / "historico.db"), tamanho=2)
+    historico = HistoricoConversas(None, pool)
+    historico.mensagens_por_conversa = 2
+    historico.abrir()
+    yield historico
+    pool.fechar()
+
+
+def test_paginacao_por_cursor(historico):
+    for indice in range(25):
+        historico.registrar_turno(f"c{indice:02d}", f"pergunta {indice}", "resposta", "ana")
+    # Várias conversas com a mesma data de atualização: o id desempata
+    with historico.pool.conexao() as conn:
+        conn.execute("UPDATE conversas SET atualizada_em = 1000 WHERE id IN ('c05', 'c06', 'c07', 'c08')")
+    historico.registrar_turno("outra", "pergunta", "resposta", "bia")
+
+    vistas, cursor, paginas = [], None, 0
+    while True:
+        conversas, cursor = historico.listar_conversas("ana", limite=10, cursor=cursor)
+        vistas += [c["_id"] for c in conversas]
+        paginas += 1
+        if cursor is None:
+            break
+    assert paginas == 3
+    assert len(vistas) == len(set(vistas)) == 25
+    assert vistas[-4:] == ["c08", "c07", "c06", "c05"]
+    assert "outra" not in vistas
+
+    with pytest.raises(ValueError):
+        historico.listar_conversas("ana", cursor="invalido")
+
+
+def test_paginacao_de_mensagens(historico):
+    for indice in range(5):
+        historico.registrar_turno("c1", f"pergunta {indice}", f"resposta {indice}", "ana")
+    conversas, _ = historico.listar_conversas("ana")
+    # A listagem traz só as mensagens mais recentes de cada conversa
+    assert [m["content"] for m in conversas[0]["messages"]] == ["pergunta 4", "resposta 4"]
+    assert conversas[0]["totalMessages"] == 10
+
+    mensagens, antes = historico.listar_mensagens("c1", limite=4)
+    assert [m["content"] for m in mensagens] == ["pergunta 3", "resposta 3", "pergunta 4", "resposta 4"]
+    anteriores, antes = historico.listar_mensagens("c1", limite=4, antes=antes)
+    assert [m["content"] for m in anteriores] == ["pergunta 1", "resposta 1", "pergunta 2", "resposta 2"]
+    primeiras, antes = historico.listar_mensagens("c1", limite=4, antes=antes)
+    assert [m["content"] for m in primeiras] == ["pergunta 0", "resposta 0"]
+    assert antes is None
+
+
+def test_conversa_de_outro_usuario(historico):
+    assert historico.criar_conversa("c1", "ana", "Caso 123")["userId"] == "ana"
+    assert historico.criar_conversa("c1", "ana")["name"] == "Caso 123"
+    assert historico.criar_conversa("c1", "bia") is None
+    assert historico.dono("c1") == "ana"
+
+    historico.registrar_turno("c1", "pergunta da ana", "resposta", "ana")
+    assert historico.registrar_turno("c1", "pergunta da bia", "resposta", "bia") == 0
+    mensagens, _ = historico.listar_mensagens("c1")
+    assert [m["content"] for m in mensagens] == ["pergunta da ana", "resposta"]
+
+    assert historico.memoria("c1", "bia") is None
+    assert "pergunta da ana" in historico.memoria("c1", "ana")
+    assert historico.listar_conversas("bia") == ([], None)
+
+    assert not historico.renomear("c1", "Invadido", "bia")
+    assert not historico.remover("c1", "bia")
+    assert historico.renomear("c1", "Renomeado", "ana")
+    # Administrador (usuario=None) altera qualquer conversa
+    assert historico.remover("c1")
+    assert historico.dono("c1") is None
+
+
+def test_compactacao_com_ollama_falso(historico):
+    async def cenario():
+        config = ConfiguracaoFalsa(modelos=(MODELO,), tokens_por_segundo=0, ttft=0.01, jitter=0, tokens=20)
+        async with ServidorFalso(criar_app(config)) as ollama:
+            pool = PoolOllama(ollama.url, intervalo_verificacao=60)
+            await pool.iniciar()
+
+            async def resumir(prompt):
+                status, corpo = await pool.gerar({"model": MODELO, "prompt": prompt, "stream": False})
+                assert status == 200
+                return corpo["response"]
+
+            historico.resumir = resumir
+            historico.limite_compactacao = 4
+            historico.manter_recentes = 2
+            try:
+                for indice in range(3):
+                    await historico.registrar_turno_async("c1", f"pergunta {indice}", f"resposta {indice}", "ana")
+                await asyncio.gather(*historico._compactando.values())
+            finally:
+                await pool.encerrar()
+
+        assert historico.compactacoes == 1
+        memoria = historico.memoria("c1", "ana")
+        assert memoria.startswith("Resumo da conversa até aqui:\n")
+        # As mensagens recentes ficam fora do resumo, literais
+        assert memoria.endswith("Mensagens recentes:\nUsuário: pergunta 2\nAssistente: resposta 2")
+        assert historico.estatisticas()["conversas_com_resumo"] == 1
+
+    asyncio.run(cenario())
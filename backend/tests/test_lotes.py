@@ -0,0 +1,145 @@
+# test_lotes.py
+# Trabalhos em lote: itens respondidos pelo Ollama falso, novas tentativas com espera, reserva vencida
+# de um worker que parou no meio do item e limite de lotes em andamento por cliente.
+
+import asyncio
+import time
+
+import pytest
+
+from benchmark.ollama_falso import ConfiguracaoFalsa, criar_app
+from conftest import ServidorFalso
+from data_manager import PoolConexoes
+from lotes import GerenciadorLotes, LimiteLotes, preencher_modelo
+from pool_ollama import PoolOllama
+
+MODELO = "deepseek-r1:32b"
+
+
+@pytest.fixture
+def pool_banco(tmp_path):
+    pool = PoolConexoes(str(tmp_path / "lotes.db"), tamanho=4)
+    yield pool
+    pool.fechar()
+
+
+def gerenciador(pool_banco, responder=None, **ajustes):
+    lotes = GerenciadorLotes(responder, pool_banco)
+    lotes.trabalhadores = 1
+    lotes.max_pendentes = 3
+    lotes.max_tentativas = 3
+    lotes.espera_base = 0.05
+    for nome, valor in ajustes.items():
+        setattr(lotes, nome, valor)
+    lotes.abrir()
+    return lotes
+
+
+async def aguardar_lote(lotes, lote_id):
+    eventos = []
+    async for evento in lotes.acompanhar(lote_id):
+        eventos.append(evento)
+    return eventos
+
+
+def test_preencher_modelo():
+    inquerito = {"numero": "000001/2024", "descricao": None}
+    assert preencher_modelo("Resuma o inquérito {numero}: {descricao} {situacao}", inquerito) == "Resuma o inquérito 000001/2024:  "
+
+
+def test_itens_com_novas_tentativas(pool_banco):
+    async def cenario():
+        config = ConfiguracaoFalsa(modelos=(MODELO,), tokens_por_segundo=0, ttft=0.01, jitter=0, tokens=8)
+        async with ServidorFalso(criar_app(config)) as ollama:
+            pool = PoolOllama(ollama.url, intervalo_verificacao=60)
+            await pool.iniciar()
+            chamadas = []
+
+            # "instável" falha na primeira tentativa; "quebrada" falha sempre
+            async def responder(pergunta, thinkkn_mode, dono):
+                chamadas.append((pergunta, dono))
+                if pergunta == "quebrada" or (pergunta == "instável" and chamadas.count((pergunta, dono)) == 1):
+                    raise RuntimeError(f"falha em {pergunta}")
+                status, corpo = await pool.gerar({"model": MODELO, "prompt": pergunta, "stream": False})
+                assert status == 200
+                return corpo["response"]
+
+            lotes = gerenciador(pool_banco, responder, max_tentativas=2)
+            lote = lotes.criar([("1", "estável"), ("2", "instável"), ("3", "quebrada")], "teste", dono="ana")
+            assert lote["estado"] == "pendente"
+            lotes.iniciar()
+            try:
+                eventos = await asyncio.wait_for(aguardar_lote(lotes, lote["id"]), 10)
+            finally:
+                await lotes.encerrar()
+                await pool.encerrar()
+
+        final = eventos[-1]["lote"]
+        assert final["estado"] == "concluido"
+        assert final["itens"]["concluido"] == 2
+        assert final["itens"]["falhou"] == 1
+        itens = {evento["item"]["referencia"]: evento["item"] for evento in eventos if "item" in evento}
+        assert itens["1"]["tentativas"] == 1 and itens["1"]["resposta"]
+        assert itens["2"]["tentativas"] == 2 and itens["2"]["resposta"]
+        assert itens["3"]["estado"] == "falhou"
+        assert itens["3"]["tentativas"] == 2
+        assert itens["3"]["erro"] == "falha em quebrada"
+        # A ordem dos resultados é a de conclusão, sem buracos
+        assert sorted(item["ordem"] for item in itens.values()) == [1, 2, 3]
+        # O dono do lote chega ao responder (passagens dos documentos dele)
+        assert {dono for _, dono in chamadas} == {"ana"}
+
+    asyncio.run(cenario())
+
+
+def test_reserva_vencida_volta_para_a_fila(pool_banco):
+    worker_a = gerenciador(pool_banco, prazo_reserva=0.3)
+    worker_b = gerenciador(pool_banco, prazo_reserva=0.3)
+    lote = worker_a.criar([(None, "pergunta")], dono="ana")
+
+    item = worker_a._reservar_item()
+    assert item is not None
+    # Worker A parou sem devolver o item: B não tem vaga (limite do servidor inteiro) até a reserva vencer
+    assert worker_b._reservar_item() is None
+    assert worker_b._sem_vaga
+    time.sleep(0.4)
+    retomado = worker_b._reservar_item()
+    assert retomado[0] == item[0]
+    assert retomado[3] == 1  # tentativas antes desta reserva
+    assert worker_b.obter(lote["id"])["itens"]["processando"] == 1
+
+    # Reserva renovada enquanto o item roda não vence
+    time.sleep(0.2)
+    worker_b._renovar_reserva(retomado[0])
+    time.sleep(0.2)
+    assert worker_a._reservar_item() is None
+
+
+def test_limite_de_lotes_por_cliente(pool_banco):
+    lotes = gerenciador(pool_banco, max_pendentes=2)
+    primeiro = lotes.criar([(None, "a")], dono="ana")
+    lotes.criar([(None, "b")], dono="ana")
+    with pytest.raises(LimiteLotes):
+        lotes.criar([(None, "c")], dono="ana")
+    # Outro cliente tem o seu próprio limite
+    lotes.criar([(None, "d")], dono="bia")
+    # Lote cancelado deixa de contar
+    assert lotes.cancelar(primeiro["id"])
+    assert lotes.obter(primeiro["id"])["itens"]["cancelado"] == 1
+    lotes.criar([(None, "e")], dono="ana")
+    assert [lote["dono"] for lote in lotes.listar(dono="ana")] == ["ana"] * 3
+    assert len(lotes.listar()) == 4
+
+    with pytest.raises(ValueError):
+        lotes.criar([], dono="bia")
+
+
+def test_itens_interrompidos_voltam_na_abertura(pool_banco):
+    lotes = gerenciador(pool_banco)
+    lotes.criar([(None, "pergunta")], dono="ana")
+    assert lotes._reservar_item() is not None
+    # Reinício do servidor: o item em processamento volta sem gastar a tentativa
+    reiniciado = gerenciador(pool_banco)
+    item = reiniciado._reservar_item()
+    assert item is not None
+    assert item[3] == 0
@@ -0,0 +1,65 @@
+# test_orcamento_tokens.py
+# Orçamento de tokens: faixa de num_ctx a partir da do aquecimento, cortes dos anexos e do histórico,
+# e recusa das perguntas que sozinhas não cabem no maior num_ctx.
+
+import pytest
+
+from orcamento_tokens import OrcamentoTokens, PromptGrandeDemais, cortar_texto, estimar_tokens
+
+
+def orcamento(**kwargs):
+    parametros = dict(faixas=[2048, 4096, 8192], num_ctx_maximo=8192, margem=64, num_predict_minimo=256, num_ctx_padrao=4096)
+    parametros.update(kwargs)
+    return OrcamentoTokens(**parametros)
+
+
+def test_faixas_menores_que_a_do_aquecimento_nao_sao_usadas():
+    plano = orcamento().planejar("Qual o prazo do inquérito?", num_predict=512)
+    assert plano.num_ctx == 4096
+    assert orcamento().faixas == [4096, 8192]
+
+
+def test_faixa_maior_quando_o_prompt_nao_cabe():
+    anexo = "depoimento " * 1300
+    plano = orcamento().planejar("Resuma o depoimento.", [anexo], num_predict=512)
+    assert plano.num_ctx == 8192
+    assert plano.anexos == [anexo]
+
+
+def test_aquecimento_fora_das_faixas():
+    with pytest.raises(ValueError):
+        orcamento(num_ctx_padrao=3000)
+
+
+def test_anexos_cortados_do_menos_importante():
+    importante = "artigo " * 2000
+    secundario = "nota " * 6000
+    plano = orcamento().planejar("Pergunta", [importante, secundario], num_predict=512)
+    assert plano.cortados >= 1
+    assert plano.anexos[0] == importante
+    assert plano.tokens_prompt + plano.num_predict <= 8192
+
+
+def test_historico_descartado_por_ultimo():
+    plano = orcamento().planejar("Pergunta " * 3000, num_predict=512, tokens_historico=6000)
+    assert plano.manter_historico is False
+    assert plano.tokens_prompt + plano.num_predict <= 8192
+
+
+def test_pergunta_maior_que_o_orcamento():
+    with pytest.raises(PromptGrandeDemais) as erro:
+        orcamento().planejar("palavra " * 8000)
+    assert erro.value.limite == 8192 - 256
+    # Com os tokens reservados para outra parte obrigatória (um trecho de documento)
+    with pytest.raises(PromptGrandeDemais):
+        orcamento().verificar("palavra " * 3000, reservado=5000)
+    assert orcamento().verificar("palavra " * 3000) < 8192
+
+
+def test_cortar_texto():
+    texto = "uma frase curta. " * 500
+    cortado = cortar_texto(texto, 100)
+    assert estimar_tokens(cortado) <= 100
+    assert texto.startswith(cortado)
+    assert cortar_texto("curto", 100) == "curto"
+    assert cortar_texto(texto, 0) == ""
@@ -0,0 +1,154 @@
+# test_pool_ollama.py
+# Distribuição das gerações entre vários Ollama falsos: backend com menos gerações em andamento,
+# retirada de rotação de um backend que cai e retorno dele depois que as verificações voltam a passar.
+
+import asyncio
+import time
+
+from benchmark.ollama_falso import ConfiguracaoFalsa, criar_app
+from conftest import ServidorFalso
+from pool_ollama import PoolOllama
+
+MODELO = "deepseek-r1:32b"
+
+
+def configuracao(**kwargs):
+    return ConfiguracaoFalsa(modelos=(MODELO,), tokens_por_segundo=0, ttft=0.2, jitter=0, tokens=4, **kwargs)
+
+
+def payload(prompt="teste"):
+    return {"model": MODELO, "prompt": prompt, "stream": False}
+
+
+async def esperar(condicao, limite=5.0):
+    fim = time.monotonic() + limite
+    while not condicao():
+        if time.monotonic() > fim:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+def test_gera_no_backend_com_menos_pendentes():
+    async def cenario():
+        async with ServidorFalso(criar_app(configuracao())) as a, ServidorFalso(criar_app(configuracao())) as b:
+            pool = PoolOllama(f"{a.url}|{MODELO}; {b.url}|{MODELO}", intervalo_verificacao=60)
+            await pool.iniciar()
+            try:
+                backend_a, backend_b = pool.backends
+                # Uma geração em andamento em A: a próxima vai para B
+                primeira = asyncio.create_task(pool.gerar(payload()))
+                assert await esperar(lambda: backend_a.pendentes == 1)
+                assert pool.escolher(MODELO) is backend_b
+
+                respostas = await asyncio.gather(primeira, *(pool.gerar(payload()) for _ in range(3)))
+                assert all(status == 200 for status, _ in respostas)
+                assert backend_a.total == 2
+                assert backend_b.total == 2
+                assert backend_a.pendentes == backend_b.pendentes == 0
+            finally:
+                await pool.encerrar()
+
+    asyncio.run(cenario())
+
+
+def test_empate_prefere_backend_com_modelo_carregado():
+    async def cenario():
+        async with ServidorFalso(criar_app(configuracao())) as a, ServidorFalso(criar_app(configuracao())) as b:
+            pool = PoolOllama(f"{a.url}|{MODELO}; {b.url}|{MODELO}", intervalo_verificacao=60)
+            await pool.iniciar()
+            try:
+                backend_a, backend_b = pool.backends
+                # Carregar o modelo só em B; a verificação lê /api/ps e registra o modelo carregado
+                status, _ = await pool.gerar_em(backend_b, payload(""))
+                assert status == 200
+                await pool.verificar_backends()
+                assert MODELO in backend_b.carregados
+                assert MODELO not in backend_a.carregados
+                assert pool.escolher(MODELO) is backend_b
+            finally:
+                await pool.encerrar()
+
+    asyncio.run(cenario())
+
+
+def test_backend_fora_do_ar_sai_de_rotacao_e_volta():
+    async def cenario():
+        a = await ServidorFalso(criar_app(configuracao())).iniciar()
+        b = await ServidorFalso(criar_app(configuracao())).iniciar()
+        pool = PoolOllama(
+            f"{a.url}|{MODELO}; {b.url}|{MODELO}", intervalo_verificacao=0.2, falhas_para_remover=2
+        )
+        await pool.iniciar()
+        try:
+            backend_a, backend_b = pool.backends
+            assert backend_a.saudavel and backend_b.saudavel
+            # Pausar as verificações periódicas para isolar as falhas de conexão
+            pool.intervalo_verificacao = 60
+            await asyncio.sleep(0.3)
+            await b.parar()
+
+            # Metade das gerações é enviada a B, falha na conexão e é refeita em A
+            respostas = await asyncio.gather(*(pool.gerar(payload()) for _ in range(4)))
+            assert all(status == 200 for status, _ in respostas)
+            assert not backend_b.saudavel
+            assert backend_b.falhas >= 2
+            assert backend_a.total >= 4
+
+            # Fora de rotação, B não recebe novas gerações
+            assert pool.escolher(MODELO) is backend_a
+            assert pool.estatisticas()["saudaveis"] == 1
+
+            # B volta na mesma porta; a próxima verificação o devolve à rotação
+            b = await ServidorFalso(criar_app(configuracao()), porta=b.porta).iniciar()
+            await pool.verificar_backends()
+            assert backend_b.saudavel
+            assert backend_b.ultimo_erro is None
+
+            total_b = backend_b.total
+            respostas = await asyncio.gather(*(pool.gerar(payload()) for _ in range(4)))
+            assert all(status == 200 for status, _ in respostas)
+            assert backend_b.total > total_b
+        finally:
+            await pool.encerrar()
+            await a.parar()
+            await b.parar()
+
+    asyncio.run(cenario())
+
+
+def test_verificacao_periodica_tira_e_devolve_backend():
+    async def cenario():
+        a = await ServidorFalso(criar_app(configuracao())).iniciar()
+        b = await ServidorFalso(criar_app(configuracao())).iniciar()
+        pool = PoolOllama(f"{a.url}|{MODELO}; {b.url}|{MODELO}", intervalo_verificacao=0.1)
+        await pool.iniciar()
+        try:
+            backend_b = pool.backends[1]
+            await b.parar()
+            assert await esperar(lambda: not backend_b.saudavel)
+
+            b = await ServidorFalso(criar_app(configuracao()), porta=b.porta).iniciar()
+            assert await esperar(lambda: backend_b.saudavel)
+        finally:
+            await pool.encerrar()
+            await a.parar()
+            await b.parar()
+
+    asyncio.run(cenario())
+
+
+def test_backend_sem_o_modelo_instalado_fica_fora():
+    async def cenario():
+        async with ServidorFalso(criar_app(configuracao())) as a, \
+                ServidorFalso(criar_app(ConfiguracaoFalsa(modelos=("llama3:8b",)))) as b:
+            pool = PoolOllama(f"{a.url}|{MODELO}; {b.url}|{MODELO}", intervalo_verificacao=60)
+            await pool.iniciar()
+            try:
+                assert pool.backends[0].saudavel
+                assert not pool.backends[1].saudavel
+                assert "não instalados" in pool.backends[1].ultimo_erro
+            finally:
+                await pool.encerrar()
+
+    asyncio.run(cenario())
@@ -0,0 +1,121 @@
+# test_relay_ndjson.py
+# Repasse do NDJSON do Ollama: divisão de linhas nos bytes (inclusive acentos cortados entre chunks),
+# agrupamento de tokens por janela e quantidade, primeiro token sem espera e janela fechada durante
+# uma pausa do modelo. O streaming de ponta a ponta vem do Ollama falso.
+
+import asyncio
+import json
+import time
+
+from benchmark.ollama_falso import ConfiguracaoFalsa, criar_app
+from conftest import ServidorFalso
+from pool_ollama import PoolOllama
+from relay_ndjson import AgrupadorTokens, DivisorLinhas, carregar_json, ler_chunks
+
+MODELO = "deepseek-r1:32b"
+
+
+def test_divisor_linhas_cortadas_entre_chunks():
+    dados = '{"response": "ação"}\n\n{"response": "é"}\n{"done": true}'.encode("utf-8")
+    divisor = DivisorLinhas()
+    linhas = []
+    # Um byte por chunk: os caracteres de dois bytes chegam partidos
+    for indice in range(len(dados)):
+        linhas += divisor.alimentar(dados[indice:indice + 1])
+    assert [carregar_json(linha) for linha in linhas] == [{"response": "ação"}, {"response": "é"}]
+    assert [carregar_json(linha) for linha in divisor.finalizar()] == [{"done": True}]
+    assert divisor.finalizar() == []
+
+
+def test_divisor_varias_linhas_por_chunk():
+    divisor = DivisorLinhas()
+    assert divisor.alimentar(b'{"a": 1}\n{"b": 2}\n{"c"') == [b'{"a": 1}', b'{"b": 2}']
+    assert divisor.alimentar(b": 3}\n") == [b'{"c": 3}']
+
+
+def test_agrupador_primeiro_token_e_quantidade():
+    agrupador = AgrupadorTokens(janela_ms=10_000, max_tokens=3)
+    assert json.loads(agrupador.adicionar("O")) == {"token": "O"}
+    assert agrupador.adicionar(" inquérito") is None
+    assert agrupador.adicionar(" foi") is None
+    assert json.loads(agrupador.adicionar(" relatado")) == {"token": " inquérito foi relatado"}
+    assert agrupador.esvaziar() is None
+    assert agrupador.restante() is None
+
+
+def test_agrupador_fecha_a_janela_por_tempo():
+    agrupador = AgrupadorTokens(janela_ms=50, max_tokens=100)
+    agrupador.adicionar("a")
+    assert agrupador.adicionar("b") is None
+    assert 0 < agrupador.restante() <= 0.05
+    time.sleep(0.06)
+    assert agrupador.restante() == 0
+    assert json.loads(agrupador.adicionar("c")) == {"token": "bc"}
+
+
+# Relay como em gerar_resposta_ollama_stream: (instante, tokens) de cada frame enviado ao cliente
+async def repassar(chunks, agrupador):
+    divisor = DivisorLinhas()
+    inicio = time.monotonic()
+    frames = []
+
+    def registrar(frame):
+        if frame:
+            frames.append((time.monotonic() - inicio, json.loads(frame)["token"]))
+
+    async for chunk in ler_chunks(chunks, agrupador):
+        # Chunk None: a janela fechou sem token novo
+        if chunk is None:
+            registrar(agrupador.esvaziar())
+            continue
+        for linha in divisor.alimentar(chunk):
+            token = carregar_json(linha).get("response")
+            if token:
+                registrar(agrupador.adicionar(token))
+    registrar(agrupador.esvaziar())
+    return frames
+
+
+# Leitor lento: o segundo chunk só chega bem depois de a janela fechar
+async def chunks_com_pausa():
+    yield b'{"response": "Resposta"}\n{"response": " parcial"}\n'
+    await asyncio.sleep(0.4)
+    yield b'{"response": " final", "done": true}\n'
+
+
+def test_janela_fecha_durante_pausa_do_modelo():
+    frames = asyncio.run(repassar(chunks_com_pausa(), AgrupadorTokens(janela_ms=50, max_tokens=100)))
+    assert [token for _, token in frames] == ["Resposta", " parcial", " final"]
+    # " parcial" sai quando a janela fecha, sem esperar o próximo chunk (0,4 s depois)
+    assert frames[1][0] < 0.2
+    assert frames[2][0] >= 0.4
+
+
+async def repassar_ollama(pool, agrupador):
+    async with pool.gerar_stream({"model": MODELO, "prompt": "Qual o prazo?", "stream": True}) as resposta:
+        return await repassar(resposta.content.iter_any(), agrupador)
+
+
+def test_relay_do_ollama_falso():
+    async def cenario():
+        config = ConfiguracaoFalsa(modelos=(MODELO,), tokens_por_segundo=50, ttft=0.2, jitter=0, tokens=30)
+        async with ServidorFalso(criar_app(config)) as ollama:
+            pool = PoolOllama(ollama.url, intervalo_verificacao=60)
+            await pool.iniciar()
+            try:
+                # Referência: os mesmos tokens sem agrupamento
+                sem_grupo = await repassar_ollama(pool, AgrupadorTokens(janela_ms=0, max_tokens=1))
+                agrupado = await repassar_ollama(pool, AgrupadorTokens(janela_ms=100, max_tokens=4))
+            finally:
+                await pool.encerrar()
+        return sem_grupo, agrupado
+
+    sem_grupo, agrupado = asyncio.run(cenario())
+    assert len(sem_grupo) == 30
+    # O primeiro token sai sozinho, logo depois do tempo até o primeiro token
+    assert len(agrupado[0][1].split()) == 1
+    assert agrupado[0][0] < 0.2 + 0.1
+    # Os demais saem em grupos de até 4 tokens: menos frames, mesmo texto
+    assert len(agrupado) < len(sem_grupo)
+    assert all(len(token.split()) <= 4 for _, token in agrupado)
+    assert len("".join(token for _, token in agrupado).split()) == 30
@@ -0,0 +1,162 @@
+# test_rpa_engine.py
+# Extração da listagem e do detalhe do IP-e e sincronização incremental contra o IP-e falso
+# (benchmark/ipe_falso.py): só as linhas que mudaram têm o detalhe baixado de novo.
+
+import asyncio
+import sqlite3
+from datetime import datetime
+
+import aiohttp
+
+from benchmark.ipe_falso import criar_app
+from conftest import ServidorFalso
+from rpa_engine import MotorRPA, PoolNavegadores, converter_data, extrair_detalhe, extrair_listagem
+
+LISTAGEM = """<html><body><table>
+<tr><th>Nº</th><th>Situação</th><th>Data de Instauração</th><th>Prazo</th></tr>
+<tr><td><a href="detalhe/000001-2024">000001/2024</a></td><td>Em andamento</td><td>02/01/2024</td><td>01/03/2024</td></tr>
+<tr><td><a href="/inqueritos/000002-2024">000002/2024</a></td><td>Relatado</td><td>05/01/2024</td><td>04/02/2024</td></tr>
+<tr><td></td><td>linha sem número</td><td></td><td></td></tr>
+</table><a href="?pagina=2">Próxima</a></body></html>"""
+
+DETALHE_DL = """<html><body><dl>
+<dt>Número do inquérito:</dt><dd>000001/2024</dd>
+<dt>Descrição</dt><dd>Apuração de furto &amp; dano</dd>
+<dt>Data de instauração</dt><dd>02/01/2024 10:30</dd>
+<dt>Data de vencimento</dt><dd>01/03/2024</dd>
+</dl></body></html>"""
+
+DETALHE_TABELA = """<html><body><table>
+<tr><td>Assunto</td><td>Estelionato</td></tr>
+<tr><td>Vencimento</td><td>2024-05-10</td></tr>
+<tr><td>Observação</td><td>ignorada</td></tr>
+</table></body></html>"""
+
+
+def test_extrair_listagem():
+    itens, proxima = extrair_listagem(LISTAGEM, "http://ipe.local/inqueritos/lista")
+    assert [item["numero"] for item in itens] == ["000001/2024", "000002/2024"]
+    assert itens[0]["url"] == "http://ipe.local/inqueritos/detalhe/000001-2024"
+    assert itens[1]["url"] == "http://ipe.local/inqueritos/000002-2024"
+    assert itens[0]["data_criacao"] == "02/01/2024"
+    assert itens[0]["data_vencimento"] == "01/03/2024"
+    assert proxima == "http://ipe.local/inqueritos/lista?pagina=2"
+    # Mudança em qualquer coluna (mesmo sem campo mapeado, como a situação) muda a assinatura
+    alterada, _ = extrair_listagem(LISTAGEM.replace("Em andamento", "Prorrogado"), "http://ipe.local/inqueritos/lista")
+    assert alterada[0]["assinatura"] != itens[0]["assinatura"]
+    assert alterada[1]["assinatura"] == itens[1]["assinatura"]
+
+
+def test_extrair_listagem_sem_cabecalho_ou_ultima_pagina():
+    assert extrair_listagem("<table><tr><td>1</td></tr></table>", "http://ipe.local/") == ([], None)
+    itens, proxima = extrair_listagem(LISTAGEM.replace("Próxima", "Voltar"), "http://ipe.local/inqueritos")
+    assert len(itens) == 2
+    assert proxima is None
+
+
+def test_extrair_detalhe():
+    assert extrair_detalhe(DETALHE_DL) == {
+        "numero": "000001/2024",
+        "descricao": "Apuração de furto & dano",
+        "data_criacao": "02/01/2024 10:30",
+        "data_vencimento": "01/03/2024",
+    }
+    assert extrair_detalhe(DETALHE_TABELA) == {"descricao": "Estelionato", "data_vencimento": "2024-05-10"}
+    assert extrair_detalhe("<html><body><p>sem dados</p></body></html>") == {}
+
+
+def test_converter_data():
+    assert converter_data("02/01/2024 10:30") == datetime(2024, 1, 2, 10, 30)
+    assert converter_data("2024-05-10") == datetime(2024, 5, 10)
+    assert converter_data("") is None
+    assert converter_data("amanhã") is None
+
+
+def _inqueritos(caminho):
+    conn = sqlite3.connect(caminho)
+    try:
+        return {
+            numero: (descricao, vencimento)
+            for numero, descricao, vencimento in conn.execute(
+                "SELECT numero, descricao, data_vencimento FROM inqueritos"
+            )
+        }
+    finally:
+        conn.close()
+
+
+def test_sincronizacao_incremental_e_completa(banco):
+    async def cenario():
+        async with ServidorFalso(criar_app(quantidade=25, por_pagina=10)) as ipe:
+            motor = MotorRPA(
+                ipe.url, "/inqueritos", modo_listagem="http", modo_detalhe="http", trabalhadores=3,
+                tamanho_lote=4, navegadores=PoolNavegadores(tamanho=1),
+            )
+            async with aiohttp.ClientSession() as sessao:
+                async def detalhes_baixados():
+                    async with sessao.get(f"{ipe.url}/_estatisticas") as resposta:
+                        return (await resposta.json())["detalhes"]
+
+                # Primeira execução: todas as páginas e todos os detalhes
+                primeira = await motor.sincronizar()
+                assert primeira["paginas"] == 3
+                assert primeira["listados"] == 25
+                assert primeira["alterados"] == primeira["detalhes"] == primeira["gravados"] == 25
+                assert primeira["falhas"] == 0
+                gravados = _inqueritos(banco)
+                assert len(gravados) == 25
+                assert gravados["000001/2024"][0].startswith("Apuração do fato 1 ")
+                assert await detalhes_baixados() == 25
+
+                # Sem mudanças na listagem, nenhum detalhe é baixado de novo
+                segunda = await motor.sincronizar()
+                assert segunda["listados"] == 25
+                assert segunda["alterados"] == segunda["detalhes"] == segunda["gravados"] == 0
+                assert await detalhes_baixados() == 25
+
+                # Só as linhas alteradas no IP-e voltam a ter o detalhe baixado
+                async with sessao.post(f"{ipe.url}/_alterar?quantidade=3") as resposta:
+                    alterados = (await resposta.json())["alterados"]
+                terceira = await motor.sincronizar()
+                assert terceira["alterados"] == terceira["detalhes"] == terceira["gravados"] == 3
+                assert await detalhes_baixados() == 28
+                atualizados = _inqueritos(banco)
+                for numero in alterados:
+                    assert atualizados[numero][1] != gravados[numero][1]
+                inalterados = set(gravados) - set(alterados)
+                assert all(atualizados[numero] == gravados[numero] for numero in inalterados)
+
+                # --completa ignora as assinaturas e baixa todos os detalhes
+                completa = await motor.sincronizar(completa=True)
+                assert completa["alterados"] == completa["detalhes"] == completa["gravados"] == 25
+                assert await detalhes_baixados() == 53
+                assert motor.ultima_sincronizacao is completa
+
+    asyncio.run(cenario())
+
+
+def test_detalhe_indisponivel_conta_falha_e_tenta_de_novo(banco):
+    async def cenario():
+        async with ServidorFalso(criar_app(quantidade=5, por_pagina=10)) as ipe:
+            motor = MotorRPA(
+                ipe.url, "/inqueritos", modo_listagem="http", modo_detalhe="http", trabalhadores=2,
+                navegadores=PoolNavegadores(tamanho=1),
+            )
+            # Detalhe fora do ar: nada é gravado, e a assinatura não é registrada
+            original = motor._baixar_detalhe
+
+            async def falhar(url):
+                raise aiohttp.ClientConnectionError("IP-e fora do ar")
+
+            motor._baixar_detalhe = falhar
+            primeira = await motor.sincronizar()
+            assert primeira["falhas"] == 5
+            assert primeira["gravados"] == 0
+
+            # Na execução seguinte os mesmos inquéritos ainda contam como alterados
+            motor._baixar_detalhe = original
+            segunda = await motor.sincronizar()
+            assert segunda["alterados"] == segunda["gravados"] == 5
+            assert segunda["falhas"] == 0
+
+    asyncio.run(cenario())
@@ -19,7 +19,8 @@ export async function POST(request) {
         },
         body: JSON.stringify({ 
           pergunta: prompt,
-          thinkknMode: true  // Forçando o modo de pensamento a ser sempre ativado
+          thinkknMode: true,  // Forçando o modo de pensamento a ser sempre ativado
+          sessao_id: chatId   // Reaproveitar o contexto do modelo entre as mensagens do mesmo chat
         }),
         signal: controller.signal
       });
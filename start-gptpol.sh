@@ -31,6 +31,7 @@ kill_port() {
 
 # Encerrar serviços conhecidos
 echo -e "${YELLOW}🧹 Encerrando processos existentes...${NC}"
+pkill -f "python servidor.py" || true
 pkill -f uvicorn || true
 pkill -f "npm run dev" || true
 kill_port 8000
@@ -65,10 +66,11 @@ else
   exit 1
 fi
 
-# Iniciar backend
+# Iniciar backend (um worker por núcleo; ver [SERVIDOR] no config.ini)
+# Recarga gradual após atualizar o código: kill -HUP $(pgrep -f "python servidor.py")
 echo -e "${GREEN}🚀 Iniciando backend na porta 8000...${NC}"
 cd "$BACKEND_DIR"
-uvicorn main_api:app --host 0.0.0.0 --port 8000 > "$LOGS_DIR/backend.log" 2>&1 &
+python servidor.py --host 0.0.0.0 --porta 8000 > "$LOGS_DIR/backend.log" 2>&1 &
 
 # Iniciar frontend (Next.js)
 echo -e "${GREEN}🚀 Iniciando frontend (Next.js) na porta 3000...${NC}"
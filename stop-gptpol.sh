@@ -12,7 +12,11 @@ NC='\033[0m'
 
 # Encerrar processos
 echo -e "${YELLOW}🔍 Procurando e encerrando processos do Backend (uvicorn)...${NC}"
-pkill -f uvicorn && echo -e "${GREEN}✅ Backend encerrado com sucesso.${NC}" || echo -e "${RED}⚠️ Nenhum processo uvicorn em execução.${NC}"
+# O processo principal do lançador (servidor.py) encerra os workers de forma ordenada
+BACKEND_ENCERRADO=0
+pkill -f "python servidor.py" && BACKEND_ENCERRADO=1
+pkill -f uvicorn && BACKEND_ENCERRADO=1
+[ "$BACKEND_ENCERRADO" = 1 ] && echo -e "${GREEN}✅ Backend encerrado com sucesso.${NC}" || echo -e "${RED}⚠️ Nenhum processo uvicorn em execução.${NC}"
 
 echo -e "${YELLOW}🔍 Procurando e encerrando processos do Frontend (Next.js)...${NC}"
 pkill -f "npm run dev" && echo -e "${GREEN}✅ Frontend encerrado com sucesso.${NC}" || echo -e "${RED}⚠️ Nenhum processo Next.js em execução.${NC}"